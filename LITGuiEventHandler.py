@@ -254,6 +254,11 @@ class LITGuiEventHandler:
         """Returns the tuple of ints from a checkbox event in the Adjust LED range subframe. Used to parse the str displayed to the user and only return the int values."""
         return tuple(int(x) for x in self.event.replace('-','').split('_')[3:])
 
+    def on_connection_status_event(self):
+        """Handles an event posted by the sender of a Subsystem when its connection to the server changes status, showing the new status in the Subsystem's panel."""
+        self.window[f'-CAMERA_{self.event_camera}_CONNECTIONSTATUS-'].update(f'Server: {self.get_value_of_element_from_event()}')
+        return
+
     def get_value_of_element_from_event(self)->bool:
         """Returns the value of the element where an event spawns."""
         return self.values[self.event]
@@ -292,6 +297,8 @@ class LITGuiEventHandler:
             elif '_BRIGHTNESSSLIDER' in self.event and 'Release' in self.event:
                 # time.sleep(0.5)
                 self.on_manually_control_led_brightness_slider_event()
+            elif 'CONNECTIONSTATUS' in self.event:
+                self.on_connection_status_event()
             elif 'UPDATE_' in self.event and '_FRAME' in self.event:
                 img_bytes = self.get_value_of_element_from_event()
                 self.window[f'-CAMERA_{self.event_camera}_FEED-'].update(data=img_bytes)
@@ -69,10 +69,24 @@ class LITGUI(LITGuiEventHandler):
         if isinstance(lit_subsystem_data, LITSubsystemData):
             if lit_subsystem_data.object_detection_model:
                 lit_subsystem_data.object_detection_model.set_window(self.window)
+            self.set_connection_status_callback(lit_subsystem_data)
         elif isinstance(lit_subsystem_data, list):
             for subsystem in lit_subsystem_data:
                 if isinstance(subsystem.object_detection_model, ObjectDetectionModel):
                     subsystem.object_detection_model.set_window(self.window)
+                self.set_connection_status_callback(subsystem)
+        return
+
+    def set_connection_status_callback(self, lit_subsystem_data: LITSubsystemData):
+        """Has the sender of a LITSubsystemData post an event to the window whenever the connection to its server changes status, so the status shown in the GUI stays
+        current without the GUI ever waiting on the server.
+
+        Parameters:
+        - lit_subsystem_data (LITSubsystemData): An instance of the LITSubsystemData class."""
+
+        status_key = f'-CAMERA_{lit_subsystem_data.camera_idx}_CONNECTIONSTATUS-'
+        lit_subsystem_data.set_connection_status_callback(lambda status: self.window.write_event_value(status_key, status))
+        self.window[status_key].update(f'Server: {lit_subsystem_data.get_connection_status()}')
         return
     
     def create_led_tuple_range_list(self)->list[tuple[int, int]]:
@@ -137,11 +151,14 @@ class LITGUI(LITGuiEventHandler):
         return camera_preview
 
     def create_enable_controls_row(self)->list[sg.Checkbox]:
-        """Creates the main controls row, which contains the checkboxes for enabling manual control of the LED subsystem, Turning all LEDs on, Autonomous Mode, and showing the camera feed."""
+        """Creates the main controls row, which contains the checkboxes for enabling manual control of the LED subsystem, Turning all LEDs on, Autonomous Mode, and showing the camera feed,
+        followed by the status of the connection to the server."""
         control_buttons_row = [sg.Checkbox(f"Manually Control LIT Subsystem {self.camera_idx}", size=(23,1), key=f'-CAMERA_{self.camera_idx}_MANUALSTATUS-', enable_events=True), 
                                sg.Checkbox(f"Turn On All LEDs", size=(15,1), key=f'-CAMERA_{self.camera_idx}_TURNONALLLEDs-', enable_events=True, disabled=True),
                                 sg.Checkbox(f"Autonomous Mode", size=(13,1), key=f'-CAMERA_{self.camera_idx}_AUTONOMOUSMODE-', enable_events=True), 
-                                sg.Checkbox(f"Show Camera Feed", size=(15,1), key=f'-CAMERA_{self.camera_idx}_SHOWFEED-', enable_events=True, disabled=True)]
+                                sg.Checkbox(f"Show Camera Feed", size=(15,1), key=f'-CAMERA_{self.camera_idx}_SHOWFEED-', enable_events=True, disabled=True),
+                                sg.Text(f"Server: {self.lit_subsystem_dict[f'CAMERA_{self.camera_idx}'].get_connection_status()}", size=(20,1),
+                                        key=f'-CAMERA_{self.camera_idx}_CONNECTIONSTATUS-')]
         
         return control_buttons_row
 
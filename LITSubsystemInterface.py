@@ -1,8 +1,10 @@
 import typing
 import threading
-import pickle
 import socket
+import time
 from utils import find_missing_numbers_as_ranges_tuples, is_overlap, SystemLEDData
+from lit_protocol import encode_manual, encode_auto
+from lit_sender import LITSubsystemSender
 import itertools
 from ObjectDetectionModel import ObjectDetectionModel
 import sys
@@ -12,8 +14,13 @@ import sys
 class LITSubsystemData():
     """A data structure used to store information relevant between the GUI, ObjectDetectionModel used for performing Object Detection on the camera specified, and the potential server the user 
     would like data sent to for addressing the LED subsystems."""
+
+    TCP: str = 'tcp'
+    UDP: str = 'udp'
+
     def __init__(self, camera_idx: int, object_detection_model: typing.Union[ObjectDetectionModel, None] = None, number_of_leds: int = 256,
-                 number_of_sections: int = 8, host: str = None, port: int = None, image_preview_height: int = 480, image_preview_width:int = 640) -> None:
+                 number_of_sections: int = 8, host: str = None, port: int = None, image_preview_height: int = 480, image_preview_width:int = 640,
+                 client_priority: int = 0, auto_transport: str = TCP, max_send_rate: float = 0) -> None:
         """
         Parameters:
         - camera_idx (int): The USB ID number for the camera of this Subsystem. This is how the device is identified by the OS.
@@ -21,8 +28,14 @@ class LITSubsystemData():
         - number_of_leds (int): The number of LEDs of the LED Subsystem.
         - number_of_sections (int): When specifying how the lights would like to be sectionalzied when attempting to illuminate an object, this value is used to divide the LED Subsystem
                                     into an equal number of sections equal to number_of_sections. The larger this number the smalled the column illuminated when an object is detected.
-        - host (str): The Server IP Address where information will be sent, involving LEDs to Illumuniate.     
+        - host (str): The Server IP Address where information will be sent, involving LEDs to Illumuniate. The connection is made and kept alive by a LITSubsystemSender
+                      in the background, so the server does not have to be up yet.
         - port (int): The specific port you would like to create your connectiom to the server with. 
+        - client_priority (int): The priority (0-255) of this client on the server, when several clients address the same LED subsystem the highest priority wins.
+        - auto_transport (str): LITSubsystemData.TCP to send the LED data of the ObjectDetectionModel over the connection to the server, or LITSubsystemData.UDP to send it as
+                                datagrams, where a lost frame never delays the ones after it. Manual LED data is always sent over the connection.
+        - max_send_rate (float): The most frames sent to the server per second, 0 for no limit. Frames held back by the limit are not lost, the latest one of each kind is sent
+                                 as soon as the limit allows it, so the server always ends up showing the final state of a slider that is dragged quickly.
         """
         self.camera_idx = camera_idx
         self.object_detection_model = object_detection_model
@@ -31,10 +44,23 @@ class LITSubsystemData():
         self.number_of_sections = number_of_sections
         self.host = host
         self.port = port
+        self.client_priority = client_priority
+        if auto_transport not in (self.TCP, self.UDP):
+            raise ValueError(f'Unknown auto transport {auto_transport}')
+        self.auto_transport = auto_transport
         self.system_led_data = SystemLEDData(None, None)
         self.manual_status: bool = False
         self.auto_status: bool = False
         self.force_all_leds_on: bool = False 
+        self.auto_sequence: int = 0
+        self.max_send_rate = max_send_rate
+        self.throttle_lock = threading.Lock()
+        self.next_send_time: float = 0.0
+        # The latest held back frame of each kind, keyed by whether it is an AUTO frame, in the order they were made
+        self.pending_frames: dict[bool, bytes] = {}
+        self.trailing_send_timer: typing.Union[threading.Timer, None] = None
+        self.frames_sent: int = 0
+        self.frames_throttled: int = 0
         self.attempt_to_create_client_conn()
         if isinstance(self.object_detection_model, ObjectDetectionModel):
             self.set_object_detection_model(self.object_detection_model)
@@ -60,23 +86,36 @@ class LITSubsystemData():
         return
     
     def attempt_to_create_client_conn(self):
-        """Called in the constructor, used to create a connection to the server if provided a host and port. This connection is unique to each instance, as well as the lock creatred when connecting.
-        This connection and thread lock is also passed to the object detection model if provide in the constructor. If the server and port are not present, the client_conn and send_lock
-        attributes are set to False."""
+        """Called in the constructor, starts the LITSubsystemSender connecting to the server if provided a host and port. The sender is unique to each instance and is stored in
+        client_conn, which is also passed to the object detection model if provide in the constructor. Frames are only queued for the sender, so neither the GUI nor the object
+        detection model ever wait on the server. If the server and port are not present, the client_conn attribute is set to False."""
 
+        self.send_lock = False
         if self.host and self.port:
-            # try:
-                self.send_lock = threading.Lock()
-                self.client_conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.client_conn.connect((self.host,self.port))
-                if self.object_detection_model:
-                    self.object_detection_model.set_client_conn(self.client_conn)
-                    self.object_detection_model.set_thread_lock(self.send_lock)
-                return
-            # except:
-                pass
+            self.client_conn = LITSubsystemSender(self.host, self.port, f'CAMERA_{self.camera_idx}', self.client_priority,
+                                                  use_datagrams_for_auto=self.auto_transport == self.UDP)
+            self.client_conn.start()
+            if self.object_detection_model:
+                self.object_detection_model.set_client_conn(self.client_conn)
+                self.object_detection_model.set_thread_lock(self.send_lock)
+            return
         self.client_conn = False
-        self.send_lock = False
+        return
+
+    def get_connection_status(self)->str:
+        """Returns the status of the connection to the server, one of the LITSubsystemSender statuses, or LITSubsystemSender.DISCONNECTED if there is no server."""
+        return self.client_conn.status if self.client_conn else LITSubsystemSender.DISCONNECTED
+
+    def set_connection_status_callback(self, status_callback: typing.Union[typing.Callable[[str], None], None]):
+        """Sets the function called from the sender thread with the new status whenever the connection to the server changes status."""
+        if self.client_conn:
+            self.client_conn.set_status_callback(status_callback)
+        return
+
+    def close(self):
+        """Stops the sender thread and closes the connection to the server."""
+        if self.client_conn:
+            self.client_conn.stop()
         return
 
     def send_data_for_led_addressing(self, manual_event: bool)->None:
@@ -86,37 +125,96 @@ class LITSubsystemData():
         Parameters:
         - manual_event (bool): A boolean indicating if this method was called a part of a manual control event in the GUI, or an ObjectDetectionModel sending led data."""
  
+        auto_frame = False
         #FORCING ALL LEDS ON OVERRIDES ALL OF SETTINGS
         if self.force_all_leds_on and self.manual_status:
-            data = [0, [(0,self.number_of_leds)], 1, []]
+            frame = encode_manual([(0,self.number_of_leds)], 1, [])
 
 
         elif self.auto_status or self.manual_status:
             self.system_led_data.update_led_data_for_sending(self.auto_status, self.manual_status, self.number_of_leds)                    
             if manual_event:
-                data = [0, self.system_led_data.full_manual_list, self.system_led_data.manual_led_data.brightness, self.system_led_data.turn_off_leds.manual_led_tuple_list]
+                frame = encode_manual(self.system_led_data.full_manual_list, self.system_led_data.manual_led_data.brightness, self.system_led_data.turn_off_leds.manual_led_tuple_list)
             elif self.system_led_data.auto_led_data_list and self.auto_status:
-                data = [1, [(auto_led.led_range, auto_led.brightness) for auto_led in self.system_led_data.auto_led_data_list], self.system_led_data.turn_off_leds.manual_led_tuple_list]
+                self.auto_sequence += 1
+                auto_frame = True
+                frame = encode_auto(self.auto_sequence, time.time(), [(auto_led.led_range, auto_led.brightness) for auto_led in self.system_led_data.auto_led_data_list],
+                                    self.system_led_data.turn_off_leds.manual_led_tuple_list)
             elif self.manual_status:
                 try:
                     if self.system_led_data.full_manual_list:
-                        data = [0, self.system_led_data.full_manual_list, self.system_led_data.manual_led_data.brightness, self.system_led_data.turn_off_leds.manual_led_tuple_list]
+                        frame = encode_manual(self.system_led_data.full_manual_list, self.system_led_data.manual_led_data.brightness, self.system_led_data.turn_off_leds.manual_led_tuple_list)
                     else:
-                        data = [0, [], 0, [(0,self.number_of_leds)]]
+                        frame = encode_manual([], 0, [(0,self.number_of_leds)])
                 except:
-                        data = [0, [], 0, [(0,self.number_of_leds)]]
+                        frame = encode_manual([], 0, [(0,self.number_of_leds)])
             else:
-                data = [0, [], 0, [(0,self.number_of_leds)]]
+                frame = encode_manual([], 0, [(0,self.number_of_leds)])
         else:
-            data = [0, [], 0, [(0,self.number_of_leds)]]
+            frame = encode_manual([], 0, [(0,self.number_of_leds)])
 
-        
-        pickle_data = pickle.dumps(data)
-        if self.send_lock:
-            with self.send_lock:
-                self.client_conn.send(pickle_data)
-        elif self.client_conn:
-            self.client_conn.send(pickle_data)      
+        self.deliver_frame(frame, auto_frame)
         return
+
+    def deliver_frame(self, frame: bytes, auto_frame: bool):
+        """Sends a frame to the server unless it is held back by the max send rate. A held back frame replaces the one of the same kind still waiting, and the frames
+        waiting are sent by a timer once the rate allows it, in the order they were made.
+
+        Parameters:
+        - frame (bytes): The encoded LED data.
+        - auto_frame (bool): True if the frame holds the LED data of the ObjectDetectionModel, False for manual LED data."""
+
+        if not self.client_conn:
+            return
+        with self.throttle_lock:
+            self.pending_frames.pop(auto_frame, None)
+            self.pending_frames[auto_frame] = frame
+            delay = self.next_send_time - time.monotonic()
+            if self.max_send_rate > 0 and delay > 0:
+                self.frames_throttled += 1
+                if self.trailing_send_timer is None:
+                    self.trailing_send_timer = threading.Timer(delay, self.send_pending_frames)
+                    self.trailing_send_timer.daemon = True
+                    self.trailing_send_timer.start()
+                return
+            self.flush_pending_frames()
+        return
+
+    def send_pending_frames(self):
+        """Called by the trailing send timer, sends the frames held back by the max send rate."""
+        with self.throttle_lock:
+            self.trailing_send_timer = None
+            self.flush_pending_frames()
+        return
+
+    def flush_pending_frames(self):
+        """Sends the frames waiting to be sent, in the order they were made. Must be called holding the throttle_lock."""
+        pending_frames, self.pending_frames = self.pending_frames, {}
+        for auto_frame, frame in pending_frames.items():
+            self.send_frame_unless_duplicate(frame, auto_frame)
+        return
+
+    def send_frame_unless_duplicate(self, frame: bytes, auto_frame: bool):
+        """Queues a frame for the sender unless it holds the same LED data as the frame the sender puts on the wire right before it. The sender compares the frames, as
+        only it knows which frames are still waiting. Datagrams are always sent, as a lost datagram would otherwise never be repaired while the LED data stays the same."""
+
+        if self.client_conn.send_frame(frame, auto_frame, deduplicate=not (auto_frame and self.auto_transport == self.UDP)):
+            self.record_sent_frame()
+        return
+
+    def record_sent_frame(self):
+        self.frames_sent += 1
+        if self.max_send_rate > 0:
+            self.next_send_time = time.monotonic() + 1 / self.max_send_rate
+        return
+
+    def get_send_stats(self)->dict[str, typing.Union[str, int]]:
+        """Returns how many frames were sent to the server and held back by the max send rate, along with the statistics of the sender if there is a server, which
+        include the frames suppressed as duplicates."""
+        with self.throttle_lock:
+            send_stats = {'sent': self.frames_sent, 'throttled': self.frames_throttled}
+        if self.client_conn:
+            send_stats.update(self.client_conn.get_stats())
+        return send_stats
     
 
@@ -6,27 +6,37 @@ import argparse
 from ObjectDetectionModel import ObjectDetectionModel
 from LITSubsystemInterface import LITSubsystemData
 from LITGuiWithClasses import LITGUI
+from inference_service import InferenceService, InferenceClient
+import typing
 
 
 def run_gui_process(camera_idx: int, number_of_leds: int = 256, numbmer_of_sections: int = 8, host:str = '', port: str = '', 
-                    object_detect_status: bool=False, model_path: str='', label_path: str='',use_tpu: bool = False):
+                    object_detect_status: bool=False, model_path: str='', label_path: str='',use_tpu: bool = False, inference_client: typing.Union[InferenceClient, None] = None,
+                    auto_transport: str = LITSubsystemData.TCP, max_send_rate: float = 0, detection_interval: int = 1, target_fps: float = 0):
     model_path = r'C:\Users\brand\Documents\seniordesign\OldLITTest\ModelFiles\detect.tflite'
     label_path = r'C:\Users\brand\Documents\seniordesign\OldLITTest\ModelFiles\labelmap.txt'
     if object_detect_status:
         from tensorflow.lite.python.interpreter import Interpreter 
         from tensorflow.lite.python.interpreter import load_delegate
-        object_detection_model = ObjectDetectionModel(model_path=model_path, use_edge_tpu=use_tpu, camera_index=camera_idx, label_path=label_path,resolution=(720, 405))
-        lit_subsystem_data = LITSubsystemData(camera_idx, object_detection_model, number_of_leds=number_of_leds, number_of_sections=numbmer_of_sections, host=host, port=port)
+        object_detection_model = ObjectDetectionModel(model_path=model_path, use_edge_tpu=use_tpu, camera_index=camera_idx, label_path=label_path,resolution=(720, 405),
+                                                      inference_client=inference_client, detection_interval=detection_interval, target_fps=target_fps)
+        lit_subsystem_data = LITSubsystemData(camera_idx, object_detection_model, number_of_leds=number_of_leds, number_of_sections=numbmer_of_sections, host=host, port=port,
+                                              auto_transport=auto_transport, max_send_rate=max_send_rate)
         gui = LITGUI(lit_subsystem_data)
     else:
-        lit_subsystem_data = LITSubsystemData(camera_idx, number_of_leds=256, number_of_sections=8, host=host, port=port)
+        lit_subsystem_data = LITSubsystemData(camera_idx, number_of_leds=256, number_of_sections=8, host=host, port=port, max_send_rate=max_send_rate)
         gui = LITGUI(lit_subsystem_data)
     gui.start_event_loop()
+    lit_subsystem_data.close()
+    print(f'CAMERA_{camera_idx} frames: {lit_subsystem_data.get_send_stats()}')
     return
 
 def start_gui(camera_idx: int, number_of_leds: int = 256, numbmer_of_sections: int = 8, host:str = '', port: str = '', 
-              object_detect_status: bool = False, model_path: str='', label_path: str='', use_tpu: bool = False)->multiprocessing.Process:
-    p = multiprocessing.Process(target=run_gui_process, args=(camera_idx,number_of_leds, numbmer_of_sections, host, port, object_detect_status, model_path, label_path, use_tpu))
+              object_detect_status: bool = False, model_path: str='', label_path: str='', use_tpu: bool = False,
+              inference_client: typing.Union[InferenceClient, None] = None, auto_transport: str = LITSubsystemData.TCP,
+              max_send_rate: float = 0, detection_interval: int = 1, target_fps: float = 0)->multiprocessing.Process:
+    p = multiprocessing.Process(target=run_gui_process, args=(camera_idx,number_of_leds, numbmer_of_sections, host, port, object_detect_status, model_path, label_path, use_tpu,
+                                                              inference_client, auto_transport, max_send_rate, detection_interval, target_fps))
     p.start()
     return p
 
@@ -34,6 +44,12 @@ def set_command_line_arguments()->argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     parser.add_argument("--performance_mode", help="(Optional) Run subsystems in parallel", action="store_true")
     parser.add_argument("--host", help='(Optional) Local IP address of the server for sending data', action='store')
+    parser.add_argument("--inference_workers", help='(Optional) Number of shared inference worker processes serving every camera', type=int, default=0)
+    parser.add_argument("--udp_auto", help="(Optional) Send the LED data of detected people to the server as UDP datagrams", action="store_true")
+    parser.add_argument("--max_send_rate", help='(Optional) Most LED data frames sent to each server per second, 0 for no limit', type=float, default=0)
+    parser.add_argument("--inference_batch_size", help='(Optional) Maximum number of camera frames stacked into a single invoke by each inference worker', type=int, default=1)
+    parser.add_argument("--detection_interval", help='(Optional) Run detection every N frames and move the boxes of people with optical flow in between', type=int, default=1)
+    parser.add_argument("--target_fps", help='(Optional) Adapt the detection interval to reach this framerate, 0 to keep --detection_interval', type=float, default=0)
     # parser.add_argument("--ports", help='(Optional) Local IP address of the server for sending data', action='store')
     # parser.add_argument("--host", help='(Optional) Local IP address of the server for sending data', action='store')
 
@@ -49,16 +65,37 @@ if __name__ == '__main__':
     wifi_host='192.168.0.220'
     ethernet_host = '192.168.1.2'
     ports = [5000, 5001]
+    inference_clients = {1: None, 2: None}
+    auto_transport = LITSubsystemData.UDP if args.udp_auto else LITSubsystemData.TCP
+    if args.inference_workers:
+        inference_service = InferenceService(model_path, use_edge_tpu=False, num_workers=args.inference_workers,
+                                             keypoint_classifier_path=r'C:\Users\brand\Documents\seniordesign\OldLITTest\ModelFiles\keypoint_classifier.tflite',
+                                             max_batch_size=args.inference_batch_size)
+        inference_clients = {camera_idx: inference_service.create_client(camera_idx) for camera_idx in inference_clients}
+        inference_service.start()
     if performance_status:
-        process1 = start_gui(camera_idx=1, number_of_leds=256, numbmer_of_sections=8, host=ethernet_host, port=ports[0], object_detect_status=True, model_path=model_path, label_path=label_path, use_tpu=False)
-        process2 = start_gui(camera_idx=2, number_of_leds=256, numbmer_of_sections=8, host=ethernet_host, port=ports[1], object_detect_status=True, model_path=model_path, label_path=label_path, use_tpu=False)
+        process1 = start_gui(camera_idx=1, number_of_leds=256, numbmer_of_sections=8, host=ethernet_host, port=ports[0], object_detect_status=True, model_path=model_path, label_path=label_path, use_tpu=False,
+                             inference_client=inference_clients[1], auto_transport=auto_transport,
+                             max_send_rate=args.max_send_rate, detection_interval=args.detection_interval, target_fps=args.target_fps)
+        process2 = start_gui(camera_idx=2, number_of_leds=256, numbmer_of_sections=8, host=ethernet_host, port=ports[1], object_detect_status=True, model_path=model_path, label_path=label_path, use_tpu=False,
+                             inference_client=inference_clients[2], auto_transport=auto_transport,
+                             max_send_rate=args.max_send_rate, detection_interval=args.detection_interval, target_fps=args.target_fps)
         process1.join()
         process2.join()
     else:
-        object_detection_model_one = ObjectDetectionModel(model_path=model_path, use_edge_tpu=False, camera_index=1, label_path=label_path, resolution=(720, 405))
-        object_detection_model_two = ObjectDetectionModel(model_path=model_path, use_edge_tpu=False, camera_index=2, label_path=label_path, resolution=(720, 405))
-        subsystem_one = LITSubsystemData(2, object_detection_model_two, number_of_leds=256, number_of_sections=8, host=ethernet_host, port=ports[0])
-        subsystem_two = LITSubsystemData(1, object_detection_model_one, number_of_leds=256, number_of_sections=8, host=ethernet_host, port=ports[1])
+        object_detection_model_one = ObjectDetectionModel(model_path=model_path, use_edge_tpu=False, camera_index=1, label_path=label_path, resolution=(720, 405),
+                                                          inference_client=inference_clients[1], detection_interval=args.detection_interval, target_fps=args.target_fps)
+        object_detection_model_two = ObjectDetectionModel(model_path=model_path, use_edge_tpu=False, camera_index=2, label_path=label_path, resolution=(720, 405),
+                                                          inference_client=inference_clients[2], detection_interval=args.detection_interval, target_fps=args.target_fps)
+        subsystem_one = LITSubsystemData(2, object_detection_model_two, number_of_leds=256, number_of_sections=8, host=ethernet_host, port=ports[0], auto_transport=auto_transport,
+                                         max_send_rate=args.max_send_rate)
+        subsystem_two = LITSubsystemData(1, object_detection_model_one, number_of_leds=256, number_of_sections=8, host=ethernet_host, port=ports[1], auto_transport=auto_transport,
+                                         max_send_rate=args.max_send_rate)
         subsystem_list = [subsystem_one, subsystem_two]
         lit_gui = LITGUI(subsystem_list)
         lit_gui.start_event_loop()
+        for subsystem in subsystem_list:
+            subsystem.close()
+            print(f'CAMERA_{subsystem.camera_idx} frames: {subsystem.get_send_stats()}')
+    if args.inference_workers:
+        inference_service.stop()
@@ -1,6 +1,7 @@
 import threading
 from threading import Thread
 import cv2
+import queue
 from queue import Queue
 import numpy as np
 import time
@@ -8,6 +9,15 @@ import pickle
 import socket
 import PySimpleGUI as sg    
 from utils import AutoLEDData
+from frame_sources import FrameSource, VideoStream
+from frame_preprocessing import FramePreprocessor
+from detection_pipeline import DetectionPipeline, BoundedFrameQueue, FramePacket
+from inference_service import InferenceClient
+from detection_postprocessing import DetectionPostProcessor, DetectionResults, draw_detections
+from led_mapping import FovSectionIndex, BrightnessCurve
+from object_tracker import ObjectTracker
+from box_propagation import OpticalFlowBoxPropagator, DetectionScheduler, downscale_gray
+from gesture_recognition import KeyPointClassifier, GestureRecognizer, HandsContextPool, pre_process_landmark, pre_process_landmarks, calc_landmark_list, classify_hands_in_crops
 from tensorflow.lite.python.interpreter import Interpreter 
 from tensorflow.lite.python.interpreter import load_delegate
 import csv
@@ -16,70 +26,12 @@ import typing
 from multiprocessing import Process, Queue
 import math
 import mediapipe as mp
-import copy
-import itertools
-
-def pre_process_landmark(landmark_list):
-    temp_landmark_list = copy.deepcopy(landmark_list)
-
-    # Convert to relative coordinates
-    base_x, base_y = 0, 0
-    for index, landmark_point in enumerate(temp_landmark_list):
-        if index == 0:
-            base_x, base_y = landmark_point[0], landmark_point[1]
-
-        temp_landmark_list[index][0] = temp_landmark_list[index][0] - base_x
-        temp_landmark_list[index][1] = temp_landmark_list[index][1] - base_y
-
-    # Convert to a one-dimensional list
-    temp_landmark_list = list(
-        itertools.chain.from_iterable(temp_landmark_list))
-
-    # Normalization
-    max_value = max(list(map(abs, temp_landmark_list)))
-
-    def normalize_(n):
-        return n / max_value
-
-    temp_landmark_list = list(map(normalize_, temp_landmark_list))
-
-    return temp_landmark_list
-
-def calc_landmark_list(image, landmarks):
-    image_width, image_height = image.shape[1], image.shape[0]
-
-    landmark_point = []
-
-    # Keypoint
-    for _, landmark in enumerate(landmarks.landmark):
-        landmark_x = min(int(landmark.x * image_width), image_width - 1)
-        landmark_y = min(int(landmark.y * image_height), image_height - 1)
-        # landmark_z = landmark.z
-
-        landmark_point.append([landmark_x, landmark_y])
-
-    return landmark_point
 
 def focal_length_finder(camera_video_width: int, horizontal_fov: int)->float:
     """Using the width of the video from the camera in pixels and the horizontal field of view of the camera, both in pixels, this functuion returns the focal length in pixels of the camera."""
     fov_rad = math.radians(horizontal_fov)
     return camera_video_width / (2 * math.tan(fov_rad / 2))
 
-def create_fov_range_list(hfov: int, num_of_sections: int)->typing.Union[list[float], list[int]]:
-    """Returns a list of float or integer values equally spaced apart by setting the hfov arguement into 2 seperate values, which are the the positive and negative states of the number divided by two.
-    Then these two numbers are used to create a list of size 'num_of_sections' where the number at index 0 is the negative state and the number at the last index is the positive state. All numbers in the equal distance apart,
-    by an amount equal to hfov / num_of_sections.
-    
-    Parameters:
-    - hfov (int): The horizontal field of view of a camera.
-    - num_of_sections (int): The desired length of the list containing equally spaced numbers ranging from the negative value of hfov/2 to the postive value of hfov/2."""
-
-    max_positive_fov = round(hfov / 2)
-    max_negative_fov = -1 * max_positive_fov
-    lst = [max_negative_fov + x * (max_positive_fov - max_negative_fov) / num_of_sections for x in range(num_of_sections + 1)]
-    lst.sort(reverse=True)
-    return lst
-
 def create_led_tuple_range_list(number_of_leds: int, num_of_sections: int)->list[tuple[int, int]]:
     """Returns a list of tuples containing the start and stopping point of LED ranges based on the number of LEDs of the subsystem specified divided by the number of sections the user would 
     like the subsystem divided into.
@@ -97,47 +49,6 @@ def create_led_tuple_range_list(number_of_leds: int, num_of_sections: int)->list
         i += leds_ranges
     return led_tuples_list
 
-def brightness_based_on_distance(distance, minDist=0.01, maxDist=5.0, linear_slope=0.25, exponential_base=2):
-    """Distance is in meters, so please provide meters"""
-    if distance <= minDist:
-        return 0  # Assuming you want very little brightness at close proximity.
-    elif distance >= maxDist:
-        return 1  # Maximum brightness at the max distance or beyond.
-    
-    # Define the threshold as halfway through the max distance.
-    threshold = maxDist / 2
-    
-    if distance <= threshold:
-        # Linear increase with a customizable slope from minDist to threshold.
-        # Brightness increases linearly based on the distance and slope.
-        linear_brightness = (distance - minDist) / (threshold - minDist) * linear_slope * 100
-        # Ensuring that the linear phase does not exceed the intended maximum at the threshold.
-        return round((min(linear_brightness, linear_slope * 100) / 100), 2)
-    else:
-        # Exponential increase from the end of the linear phase to 100% from threshold to maxDist.
-        # Normalize distance to range [0,1] for exponential calculation.
-        normalized_dist = (distance - threshold) / (maxDist - threshold)
-        # Calculate exponential increase with a base that can be adjusted.
-        exponential_brightness = 100 * linear_slope + (100 * (1 - linear_slope) * (normalized_dist ** exponential_base))
-        return round((exponential_brightness / 100),2)
-
-def determine_leds_range_for_angle(angle_x: typing.Union[float, int], led_sections: list[tuple[int, int]], hfov_range_list: typing.Union[list[float], list[int]])->typing.Union[tuple, None]:
-    """Returns the LEDs to turn on based on the angle of the object provided. This function finds the range this angle lies in based on the list of HFOV ranges, and returns the respective led section from the led_sections list.
-    
-    Parameters:
-    - angle_x (float): The angle of the object detected respective to the camera of the subsystem.
-    - led_sections (list[tuple[int, int]]): The list of the seperate sections used to each illuminate an object detected.
-    - hfov_range_list (list[float]): The list of hfov regions that correlate to each are of leds to illuminate."""
-    i = 0
-    while i < len(hfov_range_list)-1:
-        if angle_x <= hfov_range_list[i] and angle_x >= hfov_range_list[i+1]:
-            return led_sections[i]
-        # elif i == 0 and angle_x <= hfov_range_list[i] and angle_x + (hfov_range_list[i]-hfov_range_list[i+1])  >= hfov_range_list[i+1]:
-        #     return led_sections[i+1]
-        i+=1
-    return led_sections[i]
-
-
 def estimate_distance(found_width: float, focal_length: float, known_width: float):
     """Estimate the distance of an object based on the width found for the object.
     
@@ -175,95 +86,6 @@ def calculate_vert_angle(obj_center_y: float, frame_width: int, vfov: int)->floa
     angle = vfov * relative_position
     return angle
 
-class KeyPointClassifier(object):
-    def __init__(
-        self,
-        model_path=r'C:\Users\brand\Documents\seniordesign\OldLITTest\ModelFiles\keypoint_classifier.tflite',
-        num_threads=1,
-    ):
-        self.interpreter = Interpreter(model_path=model_path,
-                                               num_threads=num_threads)
-
-        self.interpreter.allocate_tensors()
-        self.input_details = self.interpreter.get_input_details()
-        self.output_details = self.interpreter.get_output_details()
-
-    def __call__(
-        self,
-        landmark_list,
-    ):
-        input_details_tensor_index = self.input_details[0]['index']
-        self.interpreter.set_tensor(
-            input_details_tensor_index,
-            np.array([landmark_list], dtype=np.float32))
-        self.interpreter.invoke()
-
-        output_details_tensor_index = self.output_details[0]['index']
-
-        result = self.interpreter.get_tensor(output_details_tensor_index)
-
-        result_index = np.argmax(np.squeeze(result))
-
-        return result_index
-        
-class VideoStream:
-    """Camera object that controls video streaming"""
-    def __init__(self, camera_index: int, resolution: tuple[int, int] =(640,480), framerate: int = 30, focal_length: float = 1080.1875, hfov: int = 78, vfov: int = 49):
-        """Creates an Object for that interfaces with the selected camera and stores data from the live feed in real time.
-        Data is stored and the dropped as feed is updated.
-        
-        Parameters:
-        - camera_index (int): The file path to a TensorFlow Lite model.
-        - resolution (tuple[int, int]): A flag for creating a model that uses an edgeTPU to perfrom computations.
-        - framerate (int): The framerate to display the camera feed at.
-        - focal_length (float): The focal length of the camera. 
-        - hfov (int): The horizontal field of view of the camera.
-        - vfov (int): The vertical field of view of the camera."""
-
-        # Initialize the Camera and the camera image stream
-        self.stream = cv2.VideoCapture(camera_index)
-        ret = self.stream.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
-        ret = self.stream.set(3,resolution[0])
-        ret = self.stream.set(4,resolution[1])
-        self.video_width = resolution[0]
-        self.video_heigth = resolution[1]
-        self.focal_length = focal_length
-        self.hfov = hfov
-        self.vfov = vfov
-        # Read first frame from the stream
-        (self.grabbed, self.frame) = self.stream.read()
-        
-
-	# Variable to control when the camera is stopped
-        self.stopped = False
-
-    def start(self):
-        """Start the thread that reads frames from the video stream"""
-        self.stopped = False
-        Thread(target=self.update,args=()).start()
-        return self
-
-    def update(self):
-        """Keep looping indefinitely until the thread is stopped"""
-        while True:
-            # If the camera is stopped, stop the thread
-            if self.stopped:
-                # Close camera resources
-                self.stream.release()
-                return
-
-            # Otherwise, grab the next frame from the stream
-            (self.grabbed, self.frame) = self.stream.read()
-
-    def read(self):
-        """Return the most recent frame"""
-        return self.frame
-
-    def stop(self):
-        """Indicate that the camera and thread should be stopped"""
-        self.stopped = True
-
-
 class ObjectDetectionModel:
     input_mean: float = 127.5
     input_std: float = 127.5
@@ -271,7 +93,13 @@ class ObjectDetectionModel:
 
     def __init__(self, model_path: str, use_edge_tpu: bool, camera_index: int, label_path: str, 
                  min_conf_threshold: float= 0.5,window: typing.Union[sg.Window, None]=None, image_window_name: typing.Union[str, None]=None, 
-                 client_conn: socket.socket = None, thread_lock: threading.Lock = None, ref_person_width: int = 20, hfov: int = 89, vfov:int = 129.46, resolution: tuple[int, int] =(640,360), focal_length: float = 0) -> None:
+                 client_conn: socket.socket = None, thread_lock: threading.Lock = None, ref_person_width: int = 20, hfov: int = 89, vfov:int = 129.46, resolution: tuple[int, int] =(640,360), focal_length: float = 0,
+                 frame_source: typing.Union[FrameSource, None] = None, pipelined: bool = False, pipeline_queue_size: int = 2,
+                 pipeline_queue_policy: str = BoundedFrameQueue.DROP_OLDEST, inference_client: typing.Union[InferenceClient, None] = None,
+                 keypoint_classifier_path: str = r'C:\Users\brand\Documents\seniordesign\OldLITTest\ModelFiles\keypoint_classifier.tflite',
+                 keypoint_classifier_label_path: str = r'C:\Users\brand\Documents\seniordesign\OldLITTest\ModelFiles\keypoint_classifier_label.csv',
+                 gesture_rate: float = 5.0, hands_tracking: bool = True, max_hands_contexts: int = 8, track_objects: bool = True, motion_threshold: float = 0.05,
+                 detection_interval: int = 1, target_fps: float = 0, max_detection_interval: int = 10, redetect_motion_threshold: float = 0.1) -> None:
         """Creates an Object for performing object detection on a camera feed. Uses either an EdgeTPU or CPU to perform computations.
         
         Parameters:
@@ -280,7 +108,32 @@ class ObjectDetectionModel:
         - camera_index (int): The device ID of the camera the user would like to use for this object detection model.
         - label_path (str): The path of the labels used for object detection labeling.
         - min_conf_threshold (float): The confidence interval used to identify object.
-        - ref_person_width (int): The width of the reference person for determining distance in inches."""
+        - ref_person_width (int): The width of the reference person for determining distance in inches.
+        - frame_source (typing.Union[FrameSource, None]): The source of the frames to perform detection on, such as a VideoFileFrameSource or ImageDirectoryFrameSource.
+                                                          If None, a VideoStream is created for camera_index every time detection is started.
+        - pipelined (bool): Run preprocessing, inference, post-processing, and preview encoding concurrently as a DetectionPipeline instead of sequentially.
+        - pipeline_queue_size (int): The maximum number of frames queued in front of each pipeline stage.
+        - pipeline_queue_policy (str): What a full pipeline queue does with a new frame, either BoundedFrameQueue.DROP_OLDEST or BoundedFrameQueue.BLOCK.
+        - inference_client (typing.Union[InferenceClient, None]): A client of a started InferenceService. If provided, detection and hand gesture recognition run on the
+                                                                  service's shared workers, and this instance loads no models of its own.
+        - keypoint_classifier_path (str): The path to the tflite model used to classify hand gestures.
+        - keypoint_classifier_label_path (str): The path to the csv file containing the labels of the hand gestures.
+        - gesture_rate (float): The most times per second the hand gestures of a single person are recognized, 0 for no limit. Recognition runs on a worker of its own
+                                and skips people while it is busy, so it never slows down detection.
+        - hands_tracking (bool): Give every person a MediaPipe Hands instance of their own in video mode, which tracks their hands from crop to crop instead of running
+                                 palm detection on every crop. If False, a single Hands instance in static image mode is shared by everyone. Needs track_objects,
+                                 and is set by the InferenceService when using an inference_client.
+        - max_hands_contexts (int): The most Hands instances kept open at once when tracking hands, one per person.
+        - track_objects (bool): Follow people across frames with an ObjectTracker, which gives each person a stable id for gesture recognition, bridges frames where
+                                their box flickers out, and keeps their LED section and brightness while they stand still.
+        - motion_threshold (float): How far a tracked person has to move, as a fraction of the width of their box, before their LED mapping is computed again.
+        - detection_interval (int): Run the detection model every detection_interval frames, and move the boxes of the people tracked with optical flow in the frames
+                                    in between, so the LED data is still sent for every frame. 1 runs detection on every frame. Needs track_objects.
+        - target_fps (float): Adapt the detection interval to the measured cost of detection and optical flow to reach this framerate, 0 to keep detection_interval.
+                              detection_interval is then the shortest interval used.
+        - max_detection_interval (int): The longest detection interval used when adapting to target_fps.
+        - redetect_motion_threshold (float): The mean absolute difference (0.00-1.00) from the last frame detection ran on that runs detection before the interval
+                                             is over, such as when someone walks in. 0 to only run detection at the interval."""
 
         self.gui_window = window
         self.image_window_name = image_window_name
@@ -290,15 +143,43 @@ class ObjectDetectionModel:
         self.thread_lock = thread_lock
         self.ref_person_width = ref_person_width
         self.freq = cv2.getTickFrequency()
-        self.set_interpreter(use_edge_tpu, model_path)
+        self.inference_client = inference_client
         self.set_labels_from_label_path(label_path)
-        self.set_input_details()
-        self.set_boxes_clases_and_scores_idxs()
+        self.detection_post_processor = DetectionPostProcessor(self.labels, 'person', min_conf_threshold, ref_person_width)
+        self.object_tracker = ObjectTracker(motion_threshold=motion_threshold) if track_objects else None
+        self.detection_scheduler = None
+        self.box_propagator = None
+        if detection_interval > 1 or target_fps > 0:
+            if self.object_tracker is None:
+                raise ValueError('Running detection every few frames needs track_objects, the boxes of the people tracked are moved with optical flow in between')
+            self.detection_scheduler = DetectionScheduler(detection_interval, max_detection_interval, target_fps, redetect_motion_threshold)
+            self.box_propagator = OpticalFlowBoxPropagator()
+        if self.inference_client:
+            hands_tracking = self.inference_client.hands_tracking
+        if hands_tracking and self.object_tracker is None:
+            raise ValueError('Tracking hands needs track_objects, the Hands instance of a person in video mode has to be fed the crops of that person only')
+        if self.inference_client:
+            self.set_input_details_from_inference_client()
+        else:
+            self.set_interpreter(use_edge_tpu, model_path)
+            self.set_input_details()
+            self.set_boxes_clases_and_scores_idxs()
         self.detection_thread = None
         self.detection_active = threading.Event()
+        self.frame_sequence: int = 0
+        self.frame_timestamp: float = 0.0
+        self.frames_processed: int = 0
+        self.preview_visible: bool = False
+        self.pipelined = pipelined
+        self.pipeline_queue_size = pipeline_queue_size
+        self.pipeline_queue_policy = pipeline_queue_policy
+        self.detection_pipeline = None
+        self.frame_source = frame_source
+        self.video_stream = None
         self.current_led_list_of_dicts: list[dict] = []
         self.curr_auto_led_data_list: list[tuple] = []
         self.led_sections: list[tuple[int, int]]
+        self.fov_section_index: typing.Union[FovSectionIndex, None] = None
         self.hfov = hfov
         self.vfov = vfov
         self.resolution = resolution
@@ -307,20 +188,37 @@ class ObjectDetectionModel:
         else:
             self.focal_length = focal_length
         self.mp_hands = mp.solutions.hands
-        self.hands = self.mp_hands.Hands(static_image_mode=True, max_num_hands=1, min_detection_confidence=0.5)
-        self.keypoint_classifier = KeyPointClassifier()
-        with open(r'C:\Users\brand\Documents\seniordesign\OldLITTest\ModelFiles\keypoint_classifier_label.csv',
+        self.hands_contexts = None
+        if not self.inference_client:
+            self.hands_contexts = HandsContextPool(max_hands_contexts, static_image_mode=not hands_tracking, max_num_hands=1, min_detection_confidence=0.5)
+            self.keypoint_classifier = KeyPointClassifier(keypoint_classifier_path)
+        with open(keypoint_classifier_label_path,
                 encoding='utf-8-sig') as f:
             self.keypoint_classifier_labels = csv.reader(f)
             self.keypoint_classifier_labels = [
                 row[0] for row in self.keypoint_classifier_labels
             ]
         print(self.keypoint_classifier_labels)
+        self.gesture_recognizer = GestureRecognizer(self.classify_hand_gestures, self.keypoint_classifier_labels, rate_per_track=gesture_rate,
+                                                    on_gesture_held=self.on_gesture_held, on_track_forgotten=self.forget_hands_context)
         return
     
     def set_led_ranges_for_objects(self, number_of_leds: int, number_of_sections: int):
         self.led_sections = create_led_tuple_range_list(number_of_leds, number_of_sections)
         self.number_of_sections = number_of_sections
+        self.fov_section_index = None
+        return
+
+    def set_brightness_curve(self, brightness_curve: BrightnessCurve):
+        """Set the curve mapping the distance of each person detected to the brightness used to illuminate them, such as BrightnessCurve.inverse_square or a
+        curve created by BrightnessCurve.from_config."""
+        self.detection_post_processor.brightness_function = brightness_curve
+        return
+
+    def set_fov_section_index(self, fov_section_index: typing.Union[FovSectionIndex, None]):
+        """Set the precomputed FOV sections used to map detected objects to LED sections, such as FovSectionIndex.center_weighted for denser sections near the center of
+        the field of view. If None, equally wide sections spanning the field of view of the camera are created when detection is started."""
+        self.fov_section_index = fov_section_index
         return
     
     def set_client_conn(self, client_conn: socket.socket):
@@ -347,6 +245,11 @@ class ObjectDetectionModel:
         self.send_data_callback = callback
         return
 
+    def set_frame_source(self, frame_source: typing.Union[FrameSource, None]):
+        """Set the source of the frames to perform detection on. If None, the camera of this instance is used. Takes effect the next time detection is started."""
+        self.frame_source = frame_source
+        return
+
     def start_detection(self):
         """Verifies that the current instance of this class does not already have a thread running that spawned from this method, and then initializes a new instance of the VideoStream class with the camera associated with the current instance of this class.
         To keep control of the threads spawned from this method, we start the main detection loop with the detection thread attribute set during this method. 
@@ -354,8 +257,20 @@ class ObjectDetectionModel:
         This leads to the creation of a new thread performing object detection, and the initialize of an attribute that has control of that thread."""
         if self.detection_thread is None or not self.detection_thread.is_alive():
             self.detection_active.set()  # Signal that detection should be active
-            self.video_stream = VideoStream(self.camera_index, resolution=self.resolution, hfov=self.hfov, vfov = self.vfov, focal_length=self.focal_length)  # Recreate VideoStream to ensure it's fresh
-            self.fov_sections = create_fov_range_list(self.video_stream.hfov, self.number_of_sections)
+            if self.frame_source is None:
+                self.video_stream = VideoStream(self.camera_index, resolution=self.resolution, hfov=self.hfov, vfov = self.vfov, focal_length=self.focal_length)  # Recreate VideoStream to ensure it's fresh
+            else:
+                self.video_stream = self.frame_source
+            self.frames_processed = 0
+            if self.fov_section_index is None:
+                self.fov_section_index = FovSectionIndex.uniform(self.video_stream.hfov, self.led_sections)
+            self.detection_post_processor.configure(self.video_stream.video_width, self.video_stream.video_heigth, self.video_stream.focal_length,
+                                                    self.video_stream.hfov, self.fov_section_index)
+            if self.object_tracker:
+                self.object_tracker.reset()
+            if self.detection_scheduler:
+                self.detection_scheduler.reset()
+            self.gesture_recognizer.start()
             self.detection_thread = threading.Thread(target=self.main_detection_loop, daemon=True)
             self.detection_thread.start()
         return
@@ -367,6 +282,9 @@ class ObjectDetectionModel:
         self.detection_active.clear()  # Signal that detection should stop
         if self.video_stream:
             self.video_stream.stop() 
+        self.gesture_recognizer.stop()
+        if self.hands_contexts:
+            self.hands_contexts.close()
         time.sleep(3)
         return
     
@@ -377,19 +295,153 @@ class ObjectDetectionModel:
         and send relevant LED data to the subsystem being controled from this instance."""
 
         self.video_stream.start()
-        self.previous_gestures = None
-        self.gesture_start_time = None
+        if self.pipelined:
+            self.pipelined_detection_loop()
+            self.video_stream.stop()
+            return
         while self.detection_active.is_set():
             try:
+                new_frame = self.video_stream.wait_for_new_frame(timeout=1.0)
+                if new_frame is None:
+                    if self.video_stream.finished:
+                        break
+                    continue
+                self.frame_sequence, self.frame_timestamp, frame = new_frame
                 self.t1 = cv2.getTickCount()
-                self.perform_detection_on_current_frame()
-                boxes, classes, scores = self.get_boxes_classes_and_scores_from_current_frame()
-                self.loop_over_all_objects_detected(boxes, classes, scores)
+                if self.detection_scheduler:
+                    self.detect_or_propagate(frame)
+                else:
+                    self.perform_detection_on_current_frame(frame)
+                    boxes, classes, scores = self.get_boxes_classes_and_scores_from_current_frame()
+                    self.loop_over_all_objects_detected(boxes, classes, scores)
+                self.frames_processed += 1
             except:
                 pass
         self.video_stream.stop()
         return
 
+    def detect_or_propagate(self, frame: np.ndarray):
+        """Runs detection on the frame if the detection scheduler picks it, and otherwise moves the boxes of the people tracked into the frame with optical flow. Either
+        way the LED data is sent, so the LEDs follow people at the camera framerate while the detection model only runs every few frames.
+
+        Parameters:
+        - frame (np.ndarray): The frame read from the frame source."""
+
+        start_time = time.perf_counter()
+        gray, gray_scale = downscale_gray(frame)
+        if self.detection_scheduler.should_detect(gray, self.frame_sequence):
+            self.perform_detection_on_current_frame(frame)
+            if self.video_stream.stopped:
+                return
+            self.post_process_detections(*self.get_boxes_classes_and_scores_from_current_frame())
+            self.box_propagator.set_reference(gray)
+            self.detection_scheduler.record_detection(self.frame_sequence, gray, time.perf_counter() - start_time)
+        else:
+            if self.video_stream.stopped:
+                return
+            self.set_current_frame(frame)
+            self.propagate_tracks(gray, gray_scale)
+            self.detection_scheduler.record_propagation(self.frame_sequence, time.perf_counter() - start_time)
+        self.finish_frame()
+        return
+
+    def pipelined_detection_loop(self):
+        """Runs detection as a DetectionPipeline, where preprocessing, inference, post-processing, and preview encoding each run on their own thread with a bounded queue
+        in front of them. This thread only waits for new frames and submits them to the pipeline, so inference can start on frame N+1 while frame N is still being
+        annotated and sent."""
+
+        self.input_buffer_pool = queue.SimpleQueue()
+        self.last_frame_completed_time = None
+        self.detection_pipeline = DetectionPipeline([('preprocess', self.preprocess_stage), ('inference', self.inference_stage),
+                                                     ('postprocess', self.post_process_stage), ('display', self.display_stage)],
+                                                    queue_size=self.pipeline_queue_size, queue_policy=self.pipeline_queue_policy,
+                                                    is_protected=lambda packet: packet.run_detection)
+        self.detection_pipeline.start()
+        while self.detection_active.is_set():
+            new_frame = self.video_stream.wait_for_new_frame(timeout=1.0)
+            if new_frame is None:
+                if self.video_stream.finished:
+                    break
+                continue
+            sequence, timestamp, frame = new_frame
+            packet = FramePacket(sequence, timestamp, frame, self.gui_window is not None)
+            if self.detection_scheduler:
+                start_time = time.perf_counter()
+                packet.gray, packet.gray_scale = downscale_gray(frame)
+                packet.run_detection = self.detection_scheduler.should_detect(packet.gray, sequence)
+                packet.processing_time = time.perf_counter() - start_time
+            self.detection_pipeline.submit(packet)
+        self.detection_pipeline.stop()
+        return
+
+    def preprocess_stage(self, packet: FramePacket)->FramePacket:
+        """Pipeline stage writing the model input of the frame into a buffer taken from the input buffer pool, and making the display copy if the preview is visible.
+        Frames detection does not run on are only copied."""
+        start_time = time.perf_counter()
+        if packet.preview_visible:
+            packet.frame = packet.frame.copy()
+        if packet.run_detection:
+            try:
+                packet.input_data = self.input_buffer_pool.get_nowait()
+            except queue.Empty:
+                packet.input_data = self.frame_preprocessor.create_input_buffer()
+            self.frame_preprocessor.preprocess_into(packet.frame, packet.input_data[0])
+        packet.processing_time += time.perf_counter() - start_time
+        return packet
+
+    def inference_stage(self, packet: FramePacket)->FramePacket:
+        """Pipeline stage running the detection model on the preprocessed frame and storing the boxes, classes, and scores in the packet. Frames detection does not run on
+        are passed on untouched."""
+        if not packet.run_detection:
+            return packet
+        start_time = time.perf_counter()
+        if self.inference_client:
+            packet.boxes, packet.classes, packet.scores = self.inference_client.detect(packet.input_data)
+            self.input_buffer_pool.put(packet.input_data)
+            packet.input_data = None
+        else:
+            self.interpreter.set_tensor(self.input_details[0]['index'], packet.input_data)
+            self.input_buffer_pool.put(packet.input_data)
+            packet.input_data = None
+            self.interpreter.invoke()
+            packet.boxes, packet.classes, packet.scores = self.get_boxes_classes_and_scores_from_current_frame()
+        packet.processing_time += time.perf_counter() - start_time
+        return packet
+
+    def post_process_stage(self, packet: FramePacket)->FramePacket:
+        """Pipeline stage annotating the detections, mapping them to LEDs, and sending the LED data to the server. In frames detection does not run on, the boxes of the
+        people tracked are moved with optical flow instead. The time spent on the frame in every stage is recorded with the detection scheduler, the same time the
+        serial loop measures."""
+        start_time = time.perf_counter()
+        self.frame = packet.frame
+        self.preview_visible = packet.preview_visible
+        self.frame_sequence, self.frame_timestamp = packet.sequence, packet.timestamp
+        if packet.run_detection:
+            self.post_process_detections(packet.boxes, packet.classes, packet.scores)
+            if self.detection_scheduler:
+                self.box_propagator.set_reference(packet.gray)
+                self.detection_scheduler.record_detection(packet.sequence, packet.gray, packet.processing_time + time.perf_counter() - start_time)
+        else:
+            self.propagate_tracks(packet.gray, packet.gray_scale)
+            self.detection_scheduler.record_propagation(packet.sequence, packet.processing_time + time.perf_counter() - start_time)
+        self.frames_processed += 1
+        return packet if packet.preview_visible else None
+
+    def display_stage(self, packet: FramePacket)->None:
+        """Pipeline stage encoding the annotated frame and passing it to the GUI preview."""
+        now = time.perf_counter()
+        if self.last_frame_completed_time:
+            self.frame_rate_calc = 1 / max(now - self.last_frame_completed_time, 1e-6)
+        self.last_frame_completed_time = now
+        self.update_gui_preview(packet.frame)
+        return None
+
+    def get_pipeline_stats(self)->list[dict[str, typing.Union[str, int, float]]]:
+        """Returns the queue depth, dropped frames, and latency of every stage of the detection pipeline, or an empty list if the pipeline is not used."""
+        if self.detection_pipeline is None:
+            return []
+        return self.detection_pipeline.get_stats()
+
     def loop_over_all_objects_detected(self, boxes, classes, scores):
         """Iterates over all objects detected in the current frame, draws rectangles around them, places labels, calculates distance, horizontal angle, vertical angle, and uses this data to determine the LEDs to turn on a brightness respective to the distance.
         If there is a connect to a server, this data is sent over the server to a device that can directly interface with the LEDs.
@@ -401,61 +453,88 @@ class ObjectDetectionModel:
 
         if self.video_stream.stopped:
             return
+        self.post_process_detections(boxes, classes, scores)
+        self.finish_frame()
+        return
+
+    def finish_frame(self):
+        """Passes the annotated frame to the GUI preview and updates the framerate shown in it."""
+        self.update_gui_preview(self.frame)
+        t2 = cv2.getTickCount()
+        time1 = (t2-self.t1)/self.freq
+        self.frame_rate_calc= 1/time1
+        if cv2.waitKey(1) == ord('q'):
+            self.video_stream.stop()
+        return
+
+    def post_process_detections(self, boxes, classes, scores):
+        """Iterates over all objects detected in the current frame, annotates them in the preview, hands every person to the gesture recognizer, and sends the LED ranges
+        and brightnesses calculated for them to the server.
         
+        Parameters:
+        - boxes: The normalized bounding boxes output by the detection model.
+        - classes: The class indexes output by the detection model.
+        - scores: The confidence scores output by the detection model."""
+
+        if self.object_tracker:
+            tracks = self.object_tracker.update(*self.detection_post_processor.filter_detections(boxes, classes, scores))
+            detection_results = self.map_tracks(tracks)
+        else:
+            detection_results = self.detection_post_processor.process(boxes, classes, scores)
+        self.publish_detection_results(detection_results)
+        return
+
+    def propagate_tracks(self, gray: np.ndarray, gray_scale: float):
+        """Moves the boxes of the people tracked into the current frame with optical flow, in frames detection does not run on, then annotates them and sends their LED
+        data like post_process_detections does.
+
+        Parameters:
+        - gray (np.ndarray): The current frame, as returned by downscale_gray.
+        - gray_scale (float): The scale returned by downscale_gray."""
+
+        boxes = np.array([track.box for track in self.object_tracker.tracks]).reshape(-1, 4)
+        propagated_boxes, propagated = self.box_propagator.propagate(gray, gray_scale, boxes)
+        self.publish_detection_results(self.map_tracks(self.object_tracker.propagate(propagated_boxes, propagated)))
+        return
+
+    def map_tracks(self, tracks: list)->DetectionResults:
+        """Forgets the gestures of the people whose tracks were removed, and maps the tracks left to LEDs."""
+        self.gesture_recognizer.forget_tracks(self.object_tracker.removed_track_ids)
+        return self.object_tracker.map_tracks(self.detection_post_processor, tracks)
+
+    def publish_detection_results(self, detection_results: DetectionResults):
+        """Annotates the people in the preview, hands every person to the gesture recognizer, and sends the LED ranges and brightnesses calculated for them to the server.
+
+        Parameters:
+        - detection_results (DetectionResults): The people in the current frame."""
+
         curr_auto_led_data_list = []
-        
-        for i in range(len(scores)):
-            if (self.labels[int(classes[i])] == 'person') and ((scores[i] > self.min_conf_threshold) and (scores[i] <= 1.0)):      
-                self.get_and_set_current_box_vertices(boxes[i])
-                self.draw_rectangle_around_current_box()
-                self.set_label_on_obj_in_frame(classes[i], scores[i])
-                self.set_mid_point_current_obj()
-                self.set_width_of_current_obj()
-            else:
-                continue
-                
-            try:
-                if self.led_sections:
-                    distance = estimate_distance(self.current_obj_width, self.video_stream.focal_length, self.ref_person_width)
-                    angle_x = calculate_horz_angle(self.current_obj_mid_point_x, self.video_stream.video_width, self.video_stream.hfov)
-                    angle_y = calculate_vert_angle(self.current_obj_mid_point_y, self.video_stream.video_heigth, self.video_stream.hfov)
-                    brightness = brightness_based_on_distance(distance)
-                    led_tuple = determine_leds_range_for_angle(angle_x=angle_x, led_sections=self.led_sections, hfov_range_list=self.fov_sections)
-                    curr_led_data = AutoLEDData(led_tuple, brightness)
-                    curr_auto_led_data_list.append(curr_led_data)
-            except:
-                continue
-            #encapsulate into hand detection function
-            try:
-                cropped_image = self.frame[self.ymin: self.ymax, self.xmin: self.xmax]
-                cropped_image_rgb = cv2.cvtColor(cropped_image, cv2.COLOR_BGR2RGB)
-                results = self.hands.process(cropped_image_rgb)
-                if results.multi_hand_landmarks:
-                    for hand_landmarks in results.multi_hand_landmarks:
-
-                        mp.solutions.drawing_utils.draw_landmarks(cropped_image, hand_landmarks, self.mp_hands.HAND_CONNECTIONS)
-                    
-                        landmark_list = calc_landmark_list(cropped_image, hand_landmarks)
-
-                        # Conversion to relative coordinates / normalized coordinates
-                        pre_processed_landmark_list = pre_process_landmark(
-                            landmark_list)
-
-                        self.hand_sign_id = self.keypoint_classifier(pre_processed_landmark_list)
-                        print(self.keypoint_classifier_labels[self.hand_sign_id])
-                    if self.previous_gestures != self.keypoint_classifier_labels[self.hand_sign_id]:   
-                        if self.previous_gestures and self.gesture_start_time:
-                            duration = time.time() - self.gesture_start_time 
-                            print(f'Detected {self.previous_gestures} for {duration}')
-                            if duration > 3 and self.previous_gestures == 'Love':
-                                self.gui_window.write_event_value(f"-CAMERA_{self.camera_index}_TURNONALLLEDs-", True)
-                            self.gesture_start_time = None
-                        self.gesture_start_time = time.time()
-                        self.previous_gestures = self.keypoint_classifier_labels[self.hand_sign_id]
-                else:
-                    self.previous_gestures = None
-            except:
-                print('Hand Error')
+        if self.preview_visible:
+            draw_detections(self.frame, detection_results, self.labels)
+        if self.led_sections:
+            # Objects outside of the field of view have no LED section to illuminate
+            detection_results = detection_results.select(detection_results.led_section_idxs >= 0)
+            for led_section_idx, brightness in zip(detection_results.led_section_idxs.tolist(), detection_results.brightnesses.tolist()):
+                curr_auto_led_data_list.append(AutoLEDData(self.led_sections[led_section_idx], brightness))
+        self.detection_results = detection_results
+
+        if detection_results.track_ids is not None:
+            track_ids = detection_results.track_ids.tolist()
+        else:
+            # Without tracking, the LED section a person stands in and their order from the left within it identifies them to the gesture recognizer
+            track_ids = list(range(len(detection_results)))
+            if self.led_sections:
+                people_per_section: dict[int, int] = {}
+                for idx in np.argsort(detection_results.boxes[:, 0], kind='stable').tolist():
+                    led_section_idx = int(detection_results.led_section_idxs[idx])
+                    track_ids[idx] = (led_section_idx, people_per_section.get(led_section_idx, 0))
+                    people_per_section[led_section_idx] = track_ids[idx][1] + 1
+        self.gesture_recognizer.submit_frame([(track_id, self.frame[ymin: ymax, xmin: xmax], (xmin, ymin))
+                                              for track_id, (xmin, ymin, xmax, ymax) in zip(track_ids, detection_results.boxes.tolist())], self.frame_timestamp or None)
+        if self.preview_visible:
+            for landmark_list in self.gesture_recognizer.get_landmark_points():
+                for landmark_point in landmark_list:
+                    cv2.circle(self.frame, tuple(landmark_point), 2, (255, 255, 255), -1)
         
         try:
             if self.client_conn:
@@ -463,61 +542,80 @@ class ObjectDetectionModel:
                 self.send_data_callback(False)
         except:
             pass
+        return
+
+    def update_gui_preview(self, frame: np.ndarray):
+        """Encodes the annotated frame and passes it to the GUI window, if the preview is visible.
         
-        if self.gui_window:
+        Parameters:
+        - frame (np.ndarray): The annotated frame to display."""
+
+        if self.preview_visible and self.gui_window:
             try:
-                cv2.putText(self.frame,'FPS: {0:.2f}'.format(self.frame_rate_calc),(30,50),cv2.FONT_HERSHEY_SIMPLEX,1,(255,255,0),2,cv2.LINE_AA)
-                image_bytes = cv2.imencode('.png', self.frame)[1].tobytes()
+                cv2.putText(frame,'FPS: {0:.2f}'.format(self.frame_rate_calc),(30,50),cv2.FONT_HERSHEY_SIMPLEX,1,(255,255,0),2,cv2.LINE_AA)
+                image_bytes = cv2.imencode('.png', frame)[1].tobytes()
                 self.gui_window.write_event_value(f"UPDATE_{self.camera_index}_FRAMES", image_bytes)
             except:
                 print('Brandon')
-        else:
-            print('No Gui Window')
-            
-        t2 = cv2.getTickCount()
-        time1 = (t2-self.t1)/self.freq
-        self.frame_rate_calc= 1/time1
-        if cv2.waitKey(1) == ord('q'):
-            self.video_stream.stop()
         return
         
-    def set_label_on_obj_in_frame(self, class_idx: int, score: float):
-        """Places a label on an object detected in the frame with the name of the object, and the confidence score for the object detected."""
-        object_name = self.labels[int(class_idx)] # Look up object name from "labels" array using class index
-        label = '%s: %d%%' % (object_name, int(score*100)) # Example: 'person: 72%'
-        labelSize, baseLine = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2) # Get font size
-        label_ymin = max(self.ymin, labelSize[1] + 10) # Make sure not to draw label too close to top of window
-        cv2.rectangle(self.frame, (self.xmin, label_ymin-labelSize[1]-10), (self.xmin+labelSize[0], label_ymin+baseLine-10), (255, 255, 255), cv2.FILLED) # Draw white box to put label text in             
-        cv2.putText(self.frame, label, (self.xmin, label_ymin-7), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2) # Draw label text
-        return 
-    
-    def set_width_of_current_obj(self):
-        """Calcalutes the width of the current objected detected using the vertices of the box drawn around the object."""
-
-        self.current_obj_width = self.xmax - self.xmin
-        return 
-    
-    def set_mid_point_current_obj(self):
-        """Sets the midpoints of the current object in respect to the x and y axis."""
-
-        self.current_obj_mid_point_x = self.xmin + (.5 * (self.xmax - self.xmin))
-        self.current_obj_mid_point_y = self.ymin + (.5 * (self.ymax - self.ymin))
-
-    def get_and_set_current_box_vertices(self, boxes):
-        """Gets the cordinates of the vertices used to draw boxes around the current image and sets them to class attributes."""
+    def classify_hand_gestures(self, cropped_images: list[np.ndarray], track_ids: list)->list[list[tuple[int, list[list[int]]]]]:
+        """Finds the hands in the crops of the people in a frame and classifies their gestures in a single batch, using the inference client if one was provided, or the
+        models of this instance otherwise. Called from the worker thread of the gesture recognizer.
+        
+        Parameters:
+        - cropped_images (list[np.ndarray]): The BGR crop of every person detected.
+        - track_ids (list): The id of every person, which selects the Hands instance tracking their hands.
+        
+        Returns:
+        For every crop, the gesture id and the crop coordinates of the landmarks of every hand found."""
 
-        self.ymin = int(max(1,(boxes[0] * self.video_stream.video_heigth)))
-        self.xmin = int(max(1,(boxes[1] * self.video_stream.video_width)))
-        self.ymax = int(min(self.video_stream.video_heigth,(boxes[2] * self.video_stream.video_heigth)))
-        self.xmax = int(min(self.video_stream.video_width,(boxes[3] * self.video_stream.video_width)))
+        cropped_images_rgb = [cv2.cvtColor(cropped_image, cv2.COLOR_BGR2RGB) for cropped_image in cropped_images]
+        if self.inference_client:
+            hands_per_crop = self.inference_client.classify_hand_gestures(cropped_images_rgb, track_ids)
+        else:
+            hands_per_crop = classify_hands_in_crops(self.hands_contexts, self.keypoint_classifier, cropped_images_rgb, track_ids)
+        for hands in hands_per_crop:
+            for hand_sign_id, _ in hands:
+                print(self.keypoint_classifier_labels[hand_sign_id])
+        return hands_per_crop
+
+    def on_gesture_held(self, track_id, gesture: str, duration: float):
+        """Called by the gesture recognizer once a person stops holding the "Love" gesture after holding it for more than 3 seconds, turning on all LEDs from the GUI."""
+        if self.gui_window:
+            self.gui_window.write_event_value(f"-CAMERA_{self.camera_index}_TURNONALLLEDs-", True)
         return
-    
-    def draw_rectangle_around_current_box(self):
-        """Draws a box around the current object with the vertices calculated."""
 
-        cv2.rectangle(self.frame, (self.xmin,self.ymin), (self.xmax,self.ymax), (10, 255, 0), 2)
+    def forget_hands_context(self, track_id):
+        """Called by the gesture recognizer once a person left, closing the Hands instance that tracked their hands, on the inference service if one is used."""
+        if self.hands_contexts:
+            self.hands_contexts.evict(track_id)
+        elif self.inference_client:
+            self.inference_client.forget_hands_contexts([track_id])
         return
-    
+
+    def get_gesture_stats(self)->dict[str, typing.Union[int, float]]:
+        """Returns the number of crops recognized and dropped by the gesture recognizer, its mean latency, and the number of Hands instances open, created, and
+        evicted."""
+        gesture_stats = self.gesture_recognizer.get_stats()
+        if self.hands_contexts:
+            gesture_stats.update({f'hands_{name}': value for name, value in self.hands_contexts.get_stats().items()})
+        return gesture_stats
+
+    def get_detection_interval_stats(self)->dict[str, typing.Union[int, float]]:
+        """Returns the current detection interval, the number of frames detection ran on and the number the boxes were propagated on, their mean time, and the number
+        of boxes moved and lost by optical flow, or an empty dict if detection runs on every frame."""
+        if self.detection_scheduler is None:
+            return {}
+        return {**self.detection_scheduler.get_stats(), **self.box_propagator.get_stats()}
+
+    def get_tracking_stats(self)->dict[str, int]:
+        """Returns the number of tracks open, created, and removed by the object tracker, and how often the LED mapping of a track was computed and reused, or an empty
+        dict if people are not tracked."""
+        if self.object_tracker is None:
+            return {}
+        return self.object_tracker.get_stats()
+
     def obj_is_person(self, obj):
         """Verify the object detected is a person and not a chair or something."""
 
@@ -525,26 +623,38 @@ class ObjectDetectionModel:
             return True
         return False
 
-    def perform_detection_on_current_frame(self):
-        """Using the Tensorflow API, this method performs object detection on the current frame. All boxes, classes, and scores are stored in tensors in the current interpreter instance."""
+    def perform_detection_on_current_frame(self, frame1: typing.Union[np.ndarray, None] = None):
+        """Using the Tensorflow API, this method performs object detection on the current frame. All boxes, classes, and scores are stored in tensors in the current interpreter instance.
+        
+        Parameters:
+        - frame1 (typing.Union[np.ndarray, None]): The frame to perform detection on. If not provided, the most recent frame of the video stream is read."""
         
         if self.video_stream.stopped:
             return
-        frame1 = self.video_stream.read()
-        self.frame = frame1.copy()
-        frame_rgb = cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB)
-        frame_resized = cv2.resize(frame_rgb, (self.width, self.height))
-        input_data = np.expand_dims(frame_resized, axis=0)   
-        if self.floating_model:
-            input_data = (np.float32(input_data) - self.input_mean) / self.input_std
-        self.interpreter.set_tensor(self.input_details[0]['index'],input_data)
+        if frame1 is None:
+            frame1 = self.video_stream.read()
+        self.set_current_frame(frame1)
+        if self.inference_client:
+            self.frame_preprocessor.preprocess_into(frame1, self.input_buffer[0])
+            self.detection_results = self.inference_client.detect(self.input_buffer)
+            return
+        self.frame_preprocessor.preprocess_into_interpreter(self.interpreter, self.input_details[0]['index'], frame1)
         self.interpreter.invoke()
     
+    def set_current_frame(self, frame: np.ndarray):
+        """Sets the frame post-processing annotates and crops people from."""
+        # Only the GUI preview is annotated, so the frame is only copied when the preview is visible
+        self.preview_visible = self.gui_window is not None
+        self.frame = frame.copy() if self.preview_visible else frame
+        return
+
     def get_boxes_classes_and_scores_from_current_frame(self):
         """Using the get_tensor method from the Interpreter class, we are able to grab the coordinates for the boxes yet to be drawn around each object, the class of each object detected, and the score associated with the detection."""
 
         if self.video_stream.stopped:
             return
+        if self.inference_client:
+            return self.detection_results
         boxes = self.interpreter.get_tensor(self.output_details[self.boxes_idx]['index'])[0] # Bounding box coordinates of detected objects
         classes = self.interpreter.get_tensor(self.output_details[self.classes_idx]['index'])[0] # Class index of detected objects
         scores = self.interpreter.get_tensor(self.output_details[self.scores_idx]['index'])[0] # Confidence of detected objects
@@ -586,6 +696,16 @@ class ObjectDetectionModel:
             self.boxes_idx, self.classes_idx, self.scores_idx = 0, 1, 2
         return
     
+    def set_input_details_from_inference_client(self)->None:
+        """Sets the input size and type of the detection model from the details reported by the workers of the inference service."""
+        model_details = self.inference_client.model_details
+        self.height = model_details['height']
+        self.width = model_details['width']
+        self.floating_model = model_details['floating_model']
+        self.frame_preprocessor = FramePreprocessor(self.width, self.height, self.floating_model, self.input_mean, self.input_std)
+        self.input_buffer = self.frame_preprocessor.create_input_buffer()
+        return
+
     def set_input_details(self)->None:
         """UPDATE"""
         self.input_details = self.interpreter.get_input_details()
@@ -594,6 +714,7 @@ class ObjectDetectionModel:
         self.width = self.input_details[0]['shape'][2]
         self.floating_model = (self.input_details[0]['dtype'] == np.float32)
         self.outname = self.output_details[0]['name']
+        self.frame_preprocessor = FramePreprocessor(self.width, self.height, self.floating_model, self.input_mean, self.input_std)
 
 
     def load_edge_tpu_model(self, model_path: str)->None:
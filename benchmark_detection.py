@@ -0,0 +1,72 @@
+"""Measures end-to-end throughput of the ObjectDetectionModel on a recorded video file or a directory of images, so the detection pipeline can be benchmarked
+without a physical camera.
+
+Example:
+    python benchmark_detection.py --video people.mp4
+    python benchmark_detection.py --images frames/ --realtime
+    python benchmark_detection.py --video people.mp4 --target_fps 30"""
+import argparse
+import os
+import time
+from ObjectDetectionModel import ObjectDetectionModel
+from frame_sources import VideoFileFrameSource, ImageDirectoryFrameSource
+from detection_pipeline import BoundedFrameQueue
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def set_command_line_arguments()->argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--video", help='Path of an MP4/AVI file to replay', action='store')
+    source.add_argument("--images", help='Path of a directory of images to replay', action='store')
+    parser.add_argument("--realtime", help="(Optional) Replay at the recorded framerate instead of as fast as possible", action="store_true")
+    parser.add_argument("--pipelined", help="(Optional) Run detection as a concurrent pipeline of stages", action="store_true")
+    parser.add_argument("--framerate", help="(Optional) Framerate used when replaying images in realtime", type=float, default=30)
+    parser.add_argument("--model_path", help='(Optional) Path of the detection model', default=os.path.join(REPO_DIR, 'detect.tflite'))
+    parser.add_argument("--label_path", help='(Optional) Path of the detection labels', default=os.path.join(REPO_DIR, 'labelmap.txt'))
+    parser.add_argument("--number_of_leds", help='(Optional) Number of LEDs of the subsystem', type=int, default=256)
+    parser.add_argument("--number_of_sections", help='(Optional) Number of LED sections of the subsystem', type=int, default=8)
+    parser.add_argument("--detection_interval", help='(Optional) Run detection every N frames and move the boxes with optical flow in between', type=int, default=1)
+    parser.add_argument("--target_fps", help='(Optional) Adapt the detection interval to reach this framerate, 0 to keep --detection_interval', type=float, default=0)
+    return parser
+
+
+def create_frame_source(args: argparse.Namespace):
+    """Creates the replay frame source selected on the command line."""
+    if args.video:
+        return VideoFileFrameSource(args.video, realtime=args.realtime)
+    return ImageDirectoryFrameSource(args.images, framerate=args.framerate if args.realtime else None)
+
+
+def run_benchmark(object_detection_model: ObjectDetectionModel)->dict[str, float]:
+    """Runs detection until the frame source is exhausted and returns the throughput and frame statistics."""
+    start_time = time.perf_counter()
+    object_detection_model.start_detection()
+    object_detection_model.detection_thread.join()
+    elapsed = time.perf_counter() - start_time
+    results = {'frames_processed': object_detection_model.frames_processed, 'seconds': elapsed,
+               'fps': object_detection_model.frames_processed / elapsed if elapsed else 0.0}
+    results.update(object_detection_model.video_stream.get_frame_stats())
+    return results
+
+
+if __name__ == '__main__':
+    parser = set_command_line_arguments()
+    args = parser.parse_args()
+    frame_source = create_frame_source(args)
+    object_detection_model = ObjectDetectionModel(model_path=args.model_path, use_edge_tpu=False, camera_index=0, label_path=args.label_path,
+                                                  resolution=(frame_source.video_width, frame_source.video_heigth), frame_source=frame_source, pipelined=args.pipelined,
+                                                  # Replaying as fast as possible must not drop frames inside the pipeline either
+                                                  pipeline_queue_policy=BoundedFrameQueue.DROP_OLDEST if args.realtime else BoundedFrameQueue.BLOCK,
+                                                  keypoint_classifier_path=os.path.join(REPO_DIR, 'keypoint_classifier.tflite'),
+                                                  keypoint_classifier_label_path=os.path.join(REPO_DIR, 'keypoint_classifier_label.csv'),
+                                                  detection_interval=args.detection_interval, target_fps=args.target_fps)
+    object_detection_model.set_led_ranges_for_objects(args.number_of_leds, args.number_of_sections)
+    results = run_benchmark(object_detection_model)
+    for name, value in results.items():
+        print(f'{name}: {value:.2f}' if isinstance(value, float) else f'{name}: {value}')
+    for stage_stats in object_detection_model.get_pipeline_stats():
+        print(stage_stats)
+    for name, value in object_detection_model.get_detection_interval_stats().items():
+        print(f'{name}: {value:.2f}' if isinstance(value, float) else f'{name}: {value}')
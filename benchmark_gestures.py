@@ -0,0 +1,165 @@
+"""Compares hand gesture recognition with a single static image mode MediaPipe Hands instance, which runs palm detection on every crop, against a video mode instance
+per person from a HandsContextPool, which only runs palm detection until it finds a hand and then tracks it from crop to crop.
+
+People are detected in every frame of a recorded clip and followed across frames by an ObjectTracker, which gives them the ids the pool keeps their instances
+under. Both modes see exactly the same crops, and the time each spends finding the hands of a crop is measured separately. The gestures
+found by tracking are compared against the ones found by static palm detection to show how often tracking changes the result.
+
+Example:
+    python benchmark_gestures.py --video people.mp4
+    python benchmark_gestures.py --video people.mp4 --max_frames 300 --use_edge_tpu"""
+import argparse
+import csv
+import os
+import time
+import cv2
+import numpy as np
+from detection_postprocessing import DetectionPostProcessor
+from frame_preprocessing import FramePreprocessor
+from frame_sources import VideoFileFrameSource
+from gesture_recognition import HandsContextPool, KeyPointClassifier, calc_landmark_list
+from inference_service import create_interpreter, get_detection_model_details
+from object_tracker import ObjectTracker
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def set_command_line_arguments()->argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--video", help='Path of an MP4/AVI file with several people in it to replay', action='store', required=True)
+    parser.add_argument("--max_frames", help='(Optional) Number of frames replayed, 0 for the whole clip', type=int, default=0)
+    parser.add_argument("--model_path", help='(Optional) Path of the detection model', default=os.path.join(REPO_DIR, 'detect.tflite'))
+    parser.add_argument("--label_path", help='(Optional) Path of the detection labels', default=os.path.join(REPO_DIR, 'labelmap.txt'))
+    parser.add_argument("--use_edge_tpu", help="(Optional) Run the detection model on an EdgeTPU", action="store_true")
+    parser.add_argument("--keypoint_classifier_path", help='(Optional) Path of the hand gesture model', default=os.path.join(REPO_DIR, 'keypoint_classifier.tflite'))
+    parser.add_argument("--keypoint_classifier_label_path", help='(Optional) Path of the hand gesture labels',
+                        default=os.path.join(REPO_DIR, 'keypoint_classifier_label.csv'))
+    parser.add_argument("--min_conf_threshold", help='(Optional) Confidence a person detection must exceed', type=float, default=0.5)
+    parser.add_argument("--min_iou", help='(Optional) Overlap a box needs with the predicted box of a person to keep their id', type=float, default=0.3)
+    parser.add_argument("--max_contexts", help='(Optional) Most video mode Hands instances open at once', type=int, default=8)
+    return parser
+
+
+def load_labels(label_path: str)->list[str]:
+    with open(label_path, 'r') as f:
+        labels = [line.strip() for line in f.readlines()]
+    if labels[0] == '???':
+        del(labels[0])
+    return labels
+
+
+def load_gesture_labels(label_path: str)->list[str]:
+    with open(label_path, encoding='utf-8-sig') as f:
+        return [row[0] for row in csv.reader(f)]
+
+
+class HandsModeResults:
+    """The time a mode spent finding hands in every crop and the gestures it found."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: list[float] = []
+        self.gestures: list[tuple[int]] = []
+        return
+
+    def record(self, latency: float, gestures: tuple[int]):
+        self.latencies.append(latency)
+        self.gestures.append(gestures)
+        return
+
+
+def classify_hands(results, cropped_image: np.ndarray, keypoint_classifier: KeyPointClassifier)->tuple[int]:
+    """Returns the gesture ids of the hands in the MediaPipe results of a crop."""
+    if not results.multi_hand_landmarks:
+        return ()
+    landmarks = np.array([calc_landmark_list(cropped_image, hand_landmarks) for hand_landmarks in results.multi_hand_landmarks])
+    return tuple(keypoint_classifier.classify_batch(landmarks)[0].tolist())
+
+
+def detect_people(interpreter, model_details: dict, frame_preprocessor: FramePreprocessor, detection_postprocessor: DetectionPostProcessor,
+                  frame: np.ndarray)->tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the xmin, ymin, xmax, ymax pixel boxes, class indexes, and scores of the people in the frame."""
+    frame_preprocessor.preprocess_into_interpreter(interpreter, model_details['input_index'], frame)
+    interpreter.invoke()
+    return detection_postprocessor.filter_detections(interpreter.get_tensor(model_details['boxes_index'])[0], interpreter.get_tensor(model_details['classes_index'])[0],
+                                                     interpreter.get_tensor(model_details['scores_index'])[0])
+
+
+def run_benchmark(args: argparse.Namespace)->tuple[HandsModeResults, HandsModeResults, dict]:
+    """Replays the clip, running both modes on the crop of every person found, and returns the results of both modes and the stats of the pool."""
+    frame_source = VideoFileFrameSource(args.video, realtime=False)
+    interpreter = create_interpreter(args.model_path, args.use_edge_tpu)
+    model_details = get_detection_model_details(interpreter)
+    frame_preprocessor = FramePreprocessor(model_details['width'], model_details['height'], model_details['floating_model'])
+    detection_postprocessor = DetectionPostProcessor(load_labels(args.label_path), min_conf_threshold=args.min_conf_threshold)
+    detection_postprocessor.configure(frame_source.video_width, frame_source.video_heigth, frame_source.focal_length, frame_source.hfov)
+    keypoint_classifier = KeyPointClassifier(args.keypoint_classifier_path)
+    static_hands = HandsContextPool(static_image_mode=True)
+    tracking_hands = HandsContextPool(args.max_contexts, static_image_mode=False)
+    static_results, tracking_results = HandsModeResults('static'), HandsModeResults('tracking')
+    object_tracker = ObjectTracker(min_iou=args.min_iou)
+    frames = 0
+    while not args.max_frames or frames < args.max_frames:
+        grabbed, frame = frame_source.grab_frame()
+        if not grabbed:
+            break
+        frames += 1
+        tracks = object_tracker.update(*detect_people(interpreter, model_details, frame_preprocessor, detection_postprocessor, frame))
+        for track_id in object_tracker.removed_track_ids:
+            tracking_hands.evict(track_id)
+        for track in tracks:
+            if track.misses:
+                continue
+            xmin, ymin, xmax, ymax = track.box.astype(np.int64).tolist()
+            cropped_image = frame[ymin:ymax, xmin:xmax]
+            if cropped_image.size == 0:
+                continue
+            cropped_image_rgb = cv2.cvtColor(cropped_image, cv2.COLOR_BGR2RGB)
+            for hands_pool, mode_results in ((static_hands, static_results), (tracking_hands, tracking_results)):
+                start_time = time.perf_counter()
+                results = hands_pool.process(track.track_id, cropped_image_rgb)
+                latency = time.perf_counter() - start_time
+                mode_results.record(latency, classify_hands(results, cropped_image, keypoint_classifier))
+    pool_stats = tracking_hands.get_stats()
+    pool_stats['frames'] = frames
+    static_hands.close()
+    tracking_hands.close()
+    frame_source.release()
+    return static_results, tracking_results, pool_stats
+
+
+def summarize(mode_results: HandsModeResults)->str:
+    latencies = 1000 * np.array(mode_results.latencies)
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) if len(latencies) else (0.0, 0.0, 0.0)
+    hands_found = sum(1 for gestures in mode_results.gestures if gestures)
+    return (f'{mode_results.name}: {len(latencies)} crops, hands found in {hands_found}, latency ms mean {latencies.mean() if len(latencies) else 0.0:.2f} '
+            f'p50 {p50:.2f} p90 {p90:.2f} p99 {p99:.2f}')
+
+
+def compare_gestures(static_results: HandsModeResults, tracking_results: HandsModeResults, gesture_labels: list[str])->list[str]:
+    """Returns how often tracking found the same gestures as static palm detection, overall, on the crops where static palm detection found a hand, and per gesture."""
+    pairs = list(zip(static_results.gestures, tracking_results.gestures))
+    agreed = sum(1 for static_gestures, tracking_gestures in pairs if static_gestures == tracking_gestures)
+    with_hands = [(static_gestures, tracking_gestures) for static_gestures, tracking_gestures in pairs if static_gestures]
+    agreed_with_hands = sum(1 for static_gestures, tracking_gestures in with_hands if static_gestures == tracking_gestures)
+    lines = [f'agreement: {agreed}/{len(pairs)} crops ({100 * agreed / max(len(pairs), 1):.1f}%), '
+             f'{agreed_with_hands}/{len(with_hands)} crops with a hand found by static mode ({100 * agreed_with_hands / max(len(with_hands), 1):.1f}%)']
+    for hand_sign_id, label in enumerate(gesture_labels):
+        static_count = sum(static_gestures.count(hand_sign_id) for static_gestures, _ in pairs)
+        tracking_count = sum(tracking_gestures.count(hand_sign_id) for _, tracking_gestures in pairs)
+        if static_count or tracking_count:
+            lines.append(f'  {label}: static {static_count}, tracking {tracking_count}')
+    return lines
+
+
+if __name__ == '__main__':
+    parser = set_command_line_arguments()
+    args = parser.parse_args()
+    static_results, tracking_results, pool_stats = run_benchmark(args)
+    print(f'frames: {pool_stats["frames"]}, tracking instances created: {pool_stats["created"]}, tracking instances evicted: {pool_stats["evicted"]}')
+    print(summarize(static_results))
+    print(summarize(tracking_results))
+    static_latency, tracking_latency = np.mean(static_results.latencies or [0.0]), np.mean(tracking_results.latencies or [0.0])
+    print(f'speedup of tracking: {static_latency / tracking_latency if tracking_latency else 0.0:.2f}x')
+    for line in compare_gestures(static_results, tracking_results, load_gesture_labels(args.keypoint_classifier_label_path)):
+        print(line)
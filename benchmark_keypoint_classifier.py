@@ -0,0 +1,81 @@
+"""Compares classifying hand gestures one hand at a time, with pre_process_landmark and a single hand invoke of the KeyPointClassifier per hand, against classifying
+every hand of a frame at once with KeyPointClassifier.classify_batch, for a range of numbers of hands.
+
+The landmarks are synthetic hands: 21 points spread around a wrist at random positions and sizes, which is all the classifier and the normalization care about. The
+gesture ids of both paths are checked to match. With --preprocessing_only the model is not loaded, and only the normalization is compared.
+
+Example:
+    python benchmark_keypoint_classifier.py --hands 1 2 4 8 16 --repeats 500
+    python benchmark_keypoint_classifier.py --preprocessing_only"""
+import argparse
+import os
+import time
+import numpy as np
+from gesture_recognition import KeyPointClassifier, NUM_HAND_LANDMARKS, pre_process_landmark, pre_process_landmarks
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def set_command_line_arguments()->argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hands", help='(Optional) Numbers of hands in a frame to benchmark', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument("--repeats", help='(Optional) Number of frames classified for every number of hands', type=int, default=500)
+    parser.add_argument("--model_path", help='(Optional) Path of the hand gesture model', default=os.path.join(REPO_DIR, 'keypoint_classifier.tflite'))
+    parser.add_argument("--num_threads", help='(Optional) Number of threads of the interpreter', type=int, default=1)
+    parser.add_argument("--preprocessing_only", help="(Optional) Only compare the normalization of the landmarks, without loading the model", action="store_true")
+    parser.add_argument("--seed", help='(Optional) Seed of the synthetic hands', type=int, default=0)
+    return parser
+
+
+def create_synthetic_hands(number_of_hands: int, rng: np.random.Generator)->np.ndarray:
+    """Returns (number_of_hands, 21, 2) int pixel coordinates of hands at random positions and sizes in a 640x480 frame."""
+    wrists = rng.uniform((100, 100), (540, 380), size=(number_of_hands, 1, 2))
+    sizes = rng.uniform(20, 100, size=(number_of_hands, 1, 1))
+    offsets = rng.uniform(-1, 1, size=(number_of_hands, NUM_HAND_LANDMARKS, 2))
+    offsets[:, 0] = 0
+    return (wrists + sizes * offsets).astype(np.int64)
+
+
+def time_per_frame(function, frames: list)->float:
+    """Returns the mean number of seconds the function takes on a frame."""
+    start_time = time.perf_counter()
+    for frame in frames:
+        function(frame)
+    return (time.perf_counter() - start_time) / len(frames)
+
+
+def classify_per_hand(keypoint_classifier: KeyPointClassifier, landmarks: np.ndarray)->list[int]:
+    """The path used before batching: every hand is a list of lists, normalized with pre_process_landmark and classified with its own invoke."""
+    return [int(keypoint_classifier(pre_process_landmark(landmark_list))) for landmark_list in landmarks.tolist()]
+
+
+def run_benchmark(args: argparse.Namespace)->list[str]:
+    rng = np.random.default_rng(args.seed)
+    # The per hand path gets an interpreter of its own, so it never pays for resizing the input between a batch of hands and a single hand
+    per_hand_classifier = None if args.preprocessing_only else KeyPointClassifier(args.model_path, num_threads=args.num_threads)
+    keypoint_classifier = None if args.preprocessing_only else KeyPointClassifier(args.model_path, num_threads=args.num_threads)
+    lines = []
+    for number_of_hands in args.hands:
+        frames = [create_synthetic_hands(number_of_hands, rng) for _ in range(args.repeats)]
+        if not np.allclose(pre_process_landmarks(frames[0]), [pre_process_landmark(landmark_list) for landmark_list in frames[0].tolist()], atol=1e-6):
+            raise AssertionError('pre_process_landmarks does not match pre_process_landmark')
+        per_hand_time = time_per_frame(lambda landmarks: [pre_process_landmark(landmark_list) for landmark_list in landmarks.tolist()], frames)
+        batched_time = time_per_frame(pre_process_landmarks, frames)
+        lines.append(f'{number_of_hands} hands, normalization: per hand {1e6 * per_hand_time:.1f} us/frame, batched {1e6 * batched_time:.1f} us/frame, '
+                     f'{per_hand_time / batched_time:.1f}x')
+        if keypoint_classifier is None:
+            continue
+        if classify_per_hand(per_hand_classifier, frames[0]) != keypoint_classifier.classify_batch(frames[0])[0].tolist():
+            raise AssertionError('classify_batch does not match the gestures classified one hand at a time')
+        per_hand_time = time_per_frame(lambda landmarks: classify_per_hand(per_hand_classifier, landmarks), frames)
+        batched_time = time_per_frame(keypoint_classifier.classify_batch, frames)
+        lines.append(f'{number_of_hands} hands, classification: per hand {1e6 * per_hand_time:.1f} us/frame ({1e6 * per_hand_time / number_of_hands:.1f} us/hand), '
+                     f'batched {1e6 * batched_time:.1f} us/frame ({1e6 * batched_time / number_of_hands:.1f} us/hand), {per_hand_time / batched_time:.1f}x')
+    return lines
+
+
+if __name__ == '__main__':
+    parser = set_command_line_arguments()
+    args = parser.parse_args()
+    for line in run_benchmark(args):
+        print(line)
@@ -0,0 +1,163 @@
+"""Replays a stream of LED packets through a LITSubsystemServer and LEDPanels backed by a SimulatedNeoPixel, so the LED path can be tuned without a Raspberry Pi.
+Reports packets per second, pixels written per second, and the latency of every AUTO packet from the moment the client sends it to its write to the strip.
+
+The stream is either synthetic, people walking across the sections of the panels with the occasional manual change, or a recording: a file of LIT frames written
+back to back, as saved with --save. AUTO packets are stamped with the time they are sent when replayed.
+
+Example:
+    python benchmark_led_server.py --packets 2000 --rate 60 --realtime
+    python benchmark_led_server.py --replay stream.lit"""
+import argparse
+import asyncio
+import random
+import socket
+import time
+import numpy as np
+from led_backends import SimulatedNeoPixel
+from led_manager_with_classes import LEDPanels
+from led_topology import LEDTopology
+from lit_protocol import encode_auto, encode_manual, encode_hello, encode_packet, FrameDecoder, AutoLEDPacket, HelloPacket, ManualLEDPacket
+from server_with_classes import LITSubsystemServer
+from utils import IntervalSet
+
+
+def set_command_line_arguments()->argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packets", help='(Optional) Number of synthetic packets sent', type=int, default=2000)
+    parser.add_argument("--rate", help='(Optional) Packets sent per second, 0 to send as fast as possible', type=float, default=60)
+    parser.add_argument("--people", help='(Optional) Number of people walking across the panels in the synthetic stream', type=int, default=3)
+    parser.add_argument("--manual_fraction", help='(Optional) Fraction of synthetic packets that are manual changes', type=float, default=0.05)
+    parser.add_argument("--number_of_sections", help='(Optional) Number of LED sections people are lit in', type=int, default=8)
+    parser.add_argument("--num_of_leds", help='(Optional) Number of LEDs of the simulated strip', type=int, default=800)
+    parser.add_argument("--realtime", help="(Optional) Block every write of the strip for the WS2812 transfer time, like the Pi does", action="store_true")
+    parser.add_argument("--replay", help='(Optional) Path of a recorded stream of LIT frames to replay instead of a synthetic stream', action='store')
+    parser.add_argument("--save", help='(Optional) Path to save the stream sent to, for replaying it later', action='store')
+    parser.add_argument("--seed", help='(Optional) Seed of the synthetic stream', type=int, default=0)
+    return parser
+
+
+def create_synthetic_packets(number_of_packets: int, number_of_people: int, manual_fraction: float, logical_size: int, number_of_sections: int,
+                             rng: random.Random)->list:
+    """Creates the packets of people walking back and forth across the panels, each lit in the section they are in, with manual changes mixed in."""
+    section_width = logical_size // number_of_sections
+    positions = [rng.uniform(0, logical_size) for _ in range(number_of_people)]
+    speeds = [rng.uniform(0.5, 3) * rng.choice((-1, 1)) for _ in range(number_of_people)]
+    packets = []
+    for sequence in range(1, number_of_packets + 1):
+        if rng.random() < manual_fraction:
+            first_led = rng.randrange(0, logical_size)
+            packets.append(ManualLEDPacket([(first_led, rng.randrange(first_led + 1, logical_size + 1))], round(rng.random(), 2), []))
+            continue
+        led_data = []
+        for idx in range(number_of_people):
+            positions[idx] += speeds[idx]
+            if not 0 <= positions[idx] < logical_size:
+                speeds[idx] = -speeds[idx]
+                positions[idx] = min(max(positions[idx], 0), logical_size - 1)
+            section = int(positions[idx]) // section_width
+            led_data.append(((section * section_width, (section + 1) * section_width), 1.0))
+        turn_off_ranges = IntervalSet([led_range for led_range, _ in led_data]).complement(0, logical_size).to_list()
+        packets.append(AutoLEDPacket(sequence, 0.0, led_data, turn_off_ranges))
+    return packets
+
+
+def load_packets(path: str)->list:
+    """Loads a recorded stream of LIT frames, skipping the HELLO frames."""
+    with open(path, 'rb') as stream_file:
+        return [packet for packet in FrameDecoder().feed(stream_file.read()) if not isinstance(packet, HelloPacket)]
+
+
+def save_packets(path: str, packets: list):
+    with open(path, 'wb') as stream_file:
+        stream_file.write(b''.join(encode_packet(packet) for packet in packets))
+    return
+
+
+class BenchmarkServer(LITSubsystemServer):
+    """A LITSubsystemServer that records the latency of every AUTO packet it renders."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies: list[float] = []
+        return
+
+    def render_packets(self, packets: list):
+        super().render_packets(packets)
+        rendered_time = time.time()
+        self.latencies.extend(rendered_time - packet.timestamp for packet in packets if isinstance(packet, AutoLEDPacket))
+        return
+
+
+def send_packets(port: int, packets: list, rate: float):
+    """Sends the packets over a single connection at the rate provided, stamping AUTO packets with the time they are sent."""
+    conn = socket.create_connection(('127.0.0.1', port))
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    conn.sendall(encode_hello('BENCHMARK'))
+    start_time = time.perf_counter()
+    for idx, packet in enumerate(packets, 1):
+        if isinstance(packet, AutoLEDPacket):
+            conn.sendall(encode_auto(packet.sequence, time.time(), packet.led_data, packet.turn_off_ranges))
+        else:
+            conn.sendall(encode_manual(packet.led_ranges, packet.brightness, packet.turn_off_ranges))
+        if rate > 0:
+            sleep_time = start_time + idx / rate - time.perf_counter()
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+    return conn
+
+
+def find_free_port()->int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+async def run_benchmark(packets: list, rate: float, num_of_leds: int, realtime: bool)->tuple[BenchmarkServer, SimulatedNeoPixel, float]:
+    """Serves a simulated subsystem, sends the packets to it from another thread, and waits until every packet was rendered. Returns the server, the simulated strip,
+    and the number of seconds it took."""
+    simulated_pixels = SimulatedNeoPixel(n=num_of_leds, auto_write=False, realtime=realtime)
+    lit_server = BenchmarkServer(LEDPanels(None, num_of_leds=num_of_leds, backend=simulated_pixels), find_free_port(), host='127.0.0.1')
+    await lit_server.start()
+    start_time = time.perf_counter()
+    conn = await asyncio.get_running_loop().run_in_executor(None, send_packets, lit_server.port, packets, rate)
+    # The HELLO is received too, and the last render has to finish before the pending list is empty
+    while lit_server.packets_received < len(packets) + 1 or lit_server.pending_packets or lit_server.packets_rendered + lit_server.packets_coalesced < len(packets):
+        await asyncio.sleep(0.005)
+    elapsed = time.perf_counter() - start_time
+    conn.close()
+    while lit_server.sessions:
+        await asyncio.sleep(0.005)
+    lit_server.server.close()
+    lit_server.datagram_transport.close()
+    lit_server.render_task.cancel()
+    lit_server.executor.shutdown(wait=True)
+    return lit_server, simulated_pixels, elapsed
+
+
+def summarize(lit_server: BenchmarkServer, simulated_pixels: SimulatedNeoPixel, elapsed: float, number_of_packets: int)->list[str]:
+    server_stats = lit_server.get_stats()
+    render_stats = lit_server.lit_subsystem_leds.get_render_stats()
+    latencies = 1000 * np.array(lit_server.latencies)
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) if len(latencies) else (0.0, 0.0, 0.0)
+    return [f'packets: {number_of_packets} in {elapsed:.2f} s, {number_of_packets / elapsed:.1f} packets/s, rendered {server_stats["rendered"]}, '
+            f'coalesced {server_stats["coalesced"]}, renders {server_stats["renders"]}, max queue depth {server_stats["max_queue_depth"]}',
+            f'pixels: {render_stats["written_pixels"] / elapsed:.0f} written/s, {render_stats["skipped_pixels"] / elapsed:.0f} skipped/s, '
+            f'{simulated_pixels.transmitted_pixels / elapsed:.0f} transmitted/s, modeled strip transfer time {1000 * simulated_pixels.transfer_time:.1f} ms '
+            f'({100 * simulated_pixels.transfer_time / elapsed:.1f}% of the run)',
+            f'frames: shown {render_stats["frames_shown"]}, skipped {render_stats["frames_skipped"]}',
+            f'auto latency ms: p50 {p50:.2f} p90 {p90:.2f} p99 {p99:.2f} max {latencies.max() if len(latencies) else 0.0:.2f} over {len(latencies)} packets']
+
+
+if __name__ == '__main__':
+    parser = set_command_line_arguments()
+    args = parser.parse_args()
+    if args.replay:
+        packets = load_packets(args.replay)
+    else:
+        packets = create_synthetic_packets(args.packets, args.people, args.manual_fraction, LEDTopology.default().logical_size, args.number_of_sections,
+                                           random.Random(args.seed))
+    if args.save:
+        save_packets(args.save, packets)
+    lit_server, simulated_pixels, elapsed = asyncio.run(run_benchmark(packets, args.rate, args.num_of_leds, args.realtime))
+    for line in summarize(lit_server, simulated_pixels, elapsed, len(packets)):
+        print(line)
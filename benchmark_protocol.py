@@ -0,0 +1,96 @@
+"""Compares the binary LIT wire protocol against the pickled lists previously sent to the LED subsystem servers: encode and decode time, bytes per message, and how
+many messages survive a TCP stream that coalesces and splits writes.
+
+Example:
+    python benchmark_protocol.py --messages 20000 --people 4"""
+import argparse
+import pickle
+import random
+import time
+from lit_protocol import encode_auto, encode_manual, FrameDecoder
+
+
+def set_command_line_arguments()->argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", help='(Optional) Number of messages encoded and decoded', type=int, default=20000)
+    parser.add_argument("--people", help='(Optional) Number of people detected in every AUTO message', type=int, default=4)
+    parser.add_argument("--number_of_leds", help='(Optional) Number of LEDs of the subsystem', type=int, default=256)
+    parser.add_argument("--max_chunk", help='(Optional) Largest chunk the simulated TCP stream is split into', type=int, default=4096)
+    parser.add_argument("--seed", help='(Optional) Seed of the random messages and chunk sizes', type=int, default=0)
+    return parser
+
+
+def create_messages(number_of_messages: int, number_of_people: int, number_of_leds: int, rng: random.Random)->list[list]:
+    """Creates a mix of AUTO and MANUAL messages in the list format the client pickled."""
+    section_width = number_of_leds // 8
+    messages = []
+    for _ in range(number_of_messages):
+        if rng.random() < 0.9:
+            led_data = [((section * section_width, (section + 1) * section_width), round(rng.random(), 2)) for section in rng.sample(range(8), min(8, number_of_people))]
+            messages.append([1, led_data, [(0, section_width - 1), (3 * section_width, number_of_leds)]])
+        else:
+            messages.append([0, [(0, section_width), (4 * section_width, 5 * section_width)], round(rng.random(), 2), [(section_width + 1, 4 * section_width - 1)]])
+    return messages
+
+
+def encode_binary(messages: list[list])->list[bytes]:
+    frames = []
+    for sequence, message in enumerate(messages):
+        if message[0] == 1:
+            frames.append(encode_auto(sequence, time.time(), message[1], message[2]))
+        else:
+            frames.append(encode_manual(message[1], message[2], message[3]))
+    return frames
+
+
+def split_stream(stream: bytes, max_chunk: int, rng: random.Random)->list[bytes]:
+    """Splits a byte stream into chunks of random size, as a TCP receiver may see it."""
+    chunks = []
+    offset = 0
+    while offset < len(stream):
+        chunk_size = rng.randint(1, max_chunk)
+        chunks.append(stream[offset:offset + chunk_size])
+        offset += chunk_size
+    return chunks
+
+
+def decode_pickle_chunks(chunks: list[bytes])->int:
+    """Decodes chunks the way the server did before framing, unpickling every recv as one message. Returns the number of messages recovered."""
+    recovered = 0
+    for chunk in chunks:
+        try:
+            pickle.loads(chunk)
+            recovered += 1
+        except:
+            pass
+    return recovered
+
+
+def time_it(function, *args)->tuple[float, object]:
+    start_time = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start_time, result
+
+
+if __name__ == '__main__':
+    parser = set_command_line_arguments()
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    messages = create_messages(args.messages, args.people, args.number_of_leds, rng)
+
+    pickle_encode_time, pickled = time_it(lambda: [pickle.dumps(message) for message in messages])
+    pickle_decode_time, _ = time_it(lambda: [pickle.loads(data) for data in pickled])
+    binary_encode_time, frames = time_it(encode_binary, messages)
+    stream = b''.join(frames)
+    binary_decode_time, packets = time_it(lambda: FrameDecoder().feed(stream))
+
+    pickle_chunks = split_stream(b''.join(pickled), args.max_chunk, rng)
+    binary_chunks = split_stream(stream, args.max_chunk, rng)
+    frame_decoder = FrameDecoder()
+    binary_recovered = sum(len(frame_decoder.feed(chunk)) for chunk in binary_chunks)
+
+    print(f'messages: {len(messages)}')
+    print(f'pickle: encode {1e6 * pickle_encode_time / len(messages):.2f} us/msg, decode {1e6 * pickle_decode_time / len(messages):.2f} us/msg, '
+          f'{sum(map(len, pickled)) / len(messages):.1f} bytes/msg, {decode_pickle_chunks(pickle_chunks)} recovered from a split stream')
+    print(f'binary: encode {1e6 * binary_encode_time / len(messages):.2f} us/msg, decode {1e6 * binary_decode_time / len(messages):.2f} us/msg, '
+          f'{sum(map(len, frames)) / len(messages):.1f} bytes/msg, {binary_recovered} recovered from a split stream')
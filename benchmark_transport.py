@@ -0,0 +1,204 @@
+"""Compares the latency of AUTO LED frames sent over TCP against UDP datagrams on localhost, with a proxy between the client and the receiver standing in for a lossy
+network.
+
+Localhost never loses packets, so the proxies inject the loss. The UDP proxy simply drops a datagram. TCP never loses data, it retransmits it, so the TCP proxy holds a
+lost chunk back for a retransmission timeout, and everything sent after it waits behind it just like on a real connection (head-of-line blocking).
+
+Example:
+    python benchmark_transport.py --frames 600 --rate 30 --loss 0.02"""
+import argparse
+import collections
+import random
+import socket
+import threading
+import time
+import numpy as np
+from lit_protocol import encode_auto, encode_datagram, FrameDecoder, decode_datagram, sequence_is_newer, AutoLEDPacket
+
+
+def set_command_line_arguments()->argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", help='(Optional) Number of AUTO frames sent over each transport', type=int, default=600)
+    parser.add_argument("--rate", help='(Optional) Frames sent per second, the camera framerate', type=float, default=30)
+    parser.add_argument("--loss", help='(Optional) Probability of a packet being lost', type=float, default=0.02)
+    parser.add_argument("--retransmission_timeout", help='(Optional) Seconds before TCP resends lost data, Linux uses at least 0.2', type=float, default=0.2)
+    parser.add_argument("--seed", help='(Optional) Seed of the injected loss', type=int, default=0)
+    return parser
+
+
+class LatencyRecorder:
+    """Records the latency of every AUTO frame a receiver applies, discarding frames older than the last one applied like the LED server does."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: list[float] = []
+        self.out_of_order: int = 0
+        self.last_sequence = None
+        return
+
+    def record(self, packet: AutoLEDPacket):
+        received_time = time.time()
+        with self.lock:
+            if not sequence_is_newer(packet.sequence, self.last_sequence):
+                self.out_of_order += 1
+                return
+            self.last_sequence = packet.sequence
+            self.latencies.append(received_time - packet.timestamp)
+        return
+
+
+def run_tcp_receiver(listener: socket.socket, recorder: LatencyRecorder):
+    conn, _ = listener.accept()
+    frame_decoder = FrameDecoder()
+    while True:
+        data = conn.recv(65536)
+        if not data:
+            break
+        for packet in frame_decoder.feed(data):
+            recorder.record(packet)
+    conn.close()
+    return
+
+
+def run_udp_receiver(receiver: socket.socket, recorder: LatencyRecorder, stop: threading.Event):
+    receiver.settimeout(0.1)
+    while not stop.is_set():
+        try:
+            datagram = receiver.recv(65536)
+        except socket.timeout:
+            continue
+        recorder.record(decode_datagram(datagram)[1])
+    return
+
+
+def run_lossy_tcp_proxy(listener: socket.socket, target: tuple, loss: float, retransmission_timeout: float, rng: random.Random):
+    """Forwards a TCP connection, holding back a lost chunk and everything after it for the retransmission timeout."""
+    client_conn, _ = listener.accept()
+    target_conn = socket.create_connection(target)
+    target_conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    pending = collections.deque()
+    condition = threading.Condition()
+    finished = []
+
+    def forward():
+        while True:
+            with condition:
+                condition.wait_for(lambda: pending or finished)
+                if not pending:
+                    break
+                release_time, data = pending[0]
+            delay = release_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            with condition:
+                pending.popleft()
+            target_conn.sendall(data)
+        target_conn.close()
+        return
+
+    forward_thread = threading.Thread(target=forward, daemon=True)
+    forward_thread.start()
+    release_time = 0.0
+    while True:
+        data = client_conn.recv(65536)
+        if not data:
+            break
+        now = time.time()
+        release_time = max(release_time, now + retransmission_timeout if rng.random() < loss else now)
+        with condition:
+            pending.append((release_time, data))
+            condition.notify()
+    with condition:
+        finished.append(True)
+        condition.notify()
+    forward_thread.join()
+    client_conn.close()
+    return
+
+
+def run_lossy_udp_proxy(proxy: socket.socket, target: tuple, loss: float, rng: random.Random, stop: threading.Event):
+    """Forwards datagrams, dropping each one with the probability provided."""
+    proxy.settimeout(0.1)
+    forward_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    while not stop.is_set():
+        try:
+            datagram = proxy.recv(65536)
+        except socket.timeout:
+            continue
+        if rng.random() >= loss:
+            forward_socket.sendto(datagram, target)
+    forward_socket.close()
+    return
+
+
+def bind_socket(kind: int)->socket.socket:
+    bound_socket = socket.socket(socket.AF_INET, kind)
+    bound_socket.bind(('127.0.0.1', 0))
+    if kind == socket.SOCK_STREAM:
+        bound_socket.listen(1)
+    return bound_socket
+
+
+def send_frames(send_function, frames: int, rate: float):
+    """Sends AUTO frames at the rate provided, each one stamped with the time it was sent."""
+    start_time = time.perf_counter()
+    for sequence in range(1, frames + 1):
+        send_function(encode_auto(sequence, time.time(), [((32 * (sequence % 8), 32 * (sequence % 8) + 32), 1.0)], [(0, 32 * (sequence % 8))]))
+        sleep_time = start_time + sequence / rate - time.perf_counter()
+        if sleep_time > 0:
+            time.sleep(sleep_time)
+    return
+
+
+def benchmark_tcp(args: argparse.Namespace)->LatencyRecorder:
+    recorder = LatencyRecorder()
+    receiver_listener, proxy_listener = bind_socket(socket.SOCK_STREAM), bind_socket(socket.SOCK_STREAM)
+    receiver_thread = threading.Thread(target=run_tcp_receiver, args=(receiver_listener, recorder), daemon=True)
+    proxy_thread = threading.Thread(target=run_lossy_tcp_proxy, args=(proxy_listener, receiver_listener.getsockname(), args.loss, args.retransmission_timeout,
+                                                                      random.Random(args.seed)), daemon=True)
+    receiver_thread.start()
+    proxy_thread.start()
+    client_conn = socket.create_connection(proxy_listener.getsockname())
+    client_conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    send_frames(client_conn.sendall, args.frames, args.rate)
+    client_conn.close()
+    proxy_thread.join()
+    receiver_thread.join()
+    receiver_listener.close()
+    proxy_listener.close()
+    return recorder
+
+
+def benchmark_udp(args: argparse.Namespace)->LatencyRecorder:
+    recorder = LatencyRecorder()
+    stop = threading.Event()
+    receiver, proxy = bind_socket(socket.SOCK_DGRAM), bind_socket(socket.SOCK_DGRAM)
+    receiver_thread = threading.Thread(target=run_udp_receiver, args=(receiver, recorder, stop), daemon=True)
+    proxy_thread = threading.Thread(target=run_lossy_udp_proxy, args=(proxy, receiver.getsockname(), args.loss, random.Random(args.seed), stop), daemon=True)
+    receiver_thread.start()
+    proxy_thread.start()
+    client_conn = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client_conn.connect(proxy.getsockname())
+    send_frames(lambda frame: client_conn.send(encode_datagram(1, frame)), args.frames, args.rate)
+    time.sleep(0.2)
+    stop.set()
+    proxy_thread.join()
+    receiver_thread.join()
+    client_conn.close()
+    receiver.close()
+    proxy.close()
+    return recorder
+
+
+def summarize(name: str, recorder: LatencyRecorder, frames: int)->str:
+    latencies = 1000 * np.array(recorder.latencies)
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) if len(latencies) else (0.0, 0.0, 0.0)
+    return (f'{name}: applied {len(latencies)}/{frames}, out of order {recorder.out_of_order}, latency ms p50 {p50:.2f} p90 {p90:.2f} p99 {p99:.2f} '
+            f'max {latencies.max() if len(latencies) else 0.0:.2f}')
+
+
+if __name__ == '__main__':
+    parser = set_command_line_arguments()
+    args = parser.parse_args()
+    print(summarize('tcp', benchmark_tcp(args), args.frames))
+    print(summarize('udp', benchmark_udp(args), args.frames))
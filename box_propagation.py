@@ -0,0 +1,248 @@
+import math
+import typing
+import cv2
+import numpy as np
+
+
+def downscale_gray(frame: np.ndarray, max_width: int = 320)->tuple[np.ndarray, float]:
+    """Converts a BGR frame to grayscale, shrunk to at most max_width pixels wide, which is all optical flow and motion detection need.
+
+    Returns:
+    The grayscale frame and the factor frame coordinates are multiplied by to get its coordinates."""
+
+    scale = min(1.0, max_width / frame.shape[1])
+    if scale < 1.0:
+        frame = cv2.resize(frame, (round(frame.shape[1] * scale), round(frame.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), scale
+
+
+class OpticalFlowBoxPropagator:
+    """Moves the boxes of the people tracked from one frame to the next with sparse Lucas-Kanade optical flow, in frames the detection model does not run on. Corners
+    are picked inside every box of the previous frame, followed into the new frame, and followed back again. Points that do not return to where they started are
+    discarded, and the box is moved by the median displacement of the points left and scaled by the median change of their distances to their center, the way the
+    median flow tracker does. The points of every box are followed in a single call, on frames shrunk to the width of downscale_gray.
+
+    Attributes:
+    - propagated (int): The number of boxes moved.
+    - lost (int): The number of boxes with too few points left to move them."""
+
+    def __init__(self, max_points_per_box: int = 30, min_points: int = 4, max_forward_backward_error: float = 1.0):
+        """
+        Parameters:
+        - max_points_per_box (int): The most corners followed inside a single box.
+        - min_points (int): The fewest points that have to be followed successfully for a box to be moved.
+        - max_forward_backward_error (float): The distance in pixels of the shrunk frame a point may end up from where it started after being followed forward and
+        backward."""
+
+        self.max_points_per_box = max_points_per_box
+        self.min_points = min_points
+        self.max_forward_backward_error = max_forward_backward_error
+        self.lk_params = {'winSize': (15, 15), 'maxLevel': 2, 'criteria': (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)}
+        self.previous_gray: typing.Union[np.ndarray, None] = None
+        self.propagated: int = 0
+        self.lost: int = 0
+        return
+
+    def set_reference(self, gray: np.ndarray):
+        """Sets the frame the next boxes are propagated from, such as a frame detection ran on.
+
+        Parameters:
+        - gray (np.ndarray): The frame, as returned by downscale_gray."""
+
+        self.previous_gray = gray
+        return
+
+    def find_points(self, box: np.ndarray)->np.ndarray:
+        """Returns up to max_points_per_box corners inside a box of the previous frame, given in the coordinates of the shrunk frame, as a (N, 2) float32 array."""
+        height, width = self.previous_gray.shape
+        xmin, ymin = max(0, int(box[0])), max(0, int(box[1]))
+        xmax, ymax = min(width, int(math.ceil(box[2]))), min(height, int(math.ceil(box[3])))
+        if xmax - xmin < 3 or ymax - ymin < 3:
+            return np.empty((0, 2), dtype=np.float32)
+        corners = cv2.goodFeaturesToTrack(self.previous_gray[ymin:ymax, xmin:xmax], self.max_points_per_box, 0.01, 3)
+        if corners is None:
+            return np.empty((0, 2), dtype=np.float32)
+        return corners.reshape(-1, 2) + np.array([xmin, ymin], dtype=np.float32)
+
+    def propagate(self, gray: np.ndarray, scale: float, boxes: np.ndarray)->tuple[np.ndarray, np.ndarray]:
+        """Moves boxes of the previous frame into the new frame, which becomes the reference of the next call.
+
+        Parameters:
+        - gray (np.ndarray): The new frame, as returned by downscale_gray.
+        - scale (float): The scale returned by downscale_gray.
+        - boxes (np.ndarray): (N, 4) array of the xmin, ymin, xmax, ymax boxes in the previous frame, in frame coordinates.
+
+        Returns:
+        The moved boxes, in frame coordinates, and a boolean mask of the boxes that could be moved. Boxes that could not be moved are returned unchanged."""
+
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        new_boxes, moved = boxes.copy(), np.zeros(len(boxes), dtype=bool)
+        if self.previous_gray is None or self.previous_gray.shape != gray.shape or not len(boxes):
+            self.previous_gray = gray
+            self.lost += len(boxes)
+            return new_boxes, moved
+        points_per_box = [self.find_points(box * scale) for box in boxes]
+        points = np.concatenate(points_per_box).astype(np.float32)
+        box_idxs = np.repeat(np.arange(len(boxes)), [len(box_points) for box_points in points_per_box])
+        if len(points):
+            new_points, status, _ = cv2.calcOpticalFlowPyrLK(self.previous_gray, gray, points.reshape(-1, 1, 2), None, **self.lk_params)
+            returned_points, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.previous_gray, new_points, None, **self.lk_params)
+            forward_backward_errors = np.linalg.norm(returned_points.reshape(-1, 2) - points, axis=1)
+            good = (status.ravel() == 1) & (back_status.ravel() == 1) & (forward_backward_errors < self.max_forward_backward_error)
+            new_points = new_points.reshape(-1, 2)
+            for box_idx in range(len(boxes)):
+                box_good = good & (box_idxs == box_idx)
+                if np.count_nonzero(box_good) < self.min_points:
+                    continue
+                old_box_points, new_box_points = points[box_good], new_points[box_good]
+                shift = np.median(new_box_points - old_box_points, axis=0) / scale
+                old_spread = np.linalg.norm(old_box_points - old_box_points.mean(axis=0), axis=1)
+                new_spread = np.linalg.norm(new_box_points - new_box_points.mean(axis=0), axis=1)
+                spread_ratios = new_spread[old_spread > 1] / old_spread[old_spread > 1]
+                box_scale = float(np.median(spread_ratios)) if len(spread_ratios) else 1.0
+                center = (boxes[box_idx, :2] + boxes[box_idx, 2:]) / 2 + shift
+                half_size = (boxes[box_idx, 2:] - boxes[box_idx, :2]) / 2 * box_scale
+                new_boxes[box_idx] = np.concatenate([center - half_size, center + half_size])
+                moved[box_idx] = True
+        self.propagated += int(np.count_nonzero(moved))
+        self.lost += len(boxes) - int(np.count_nonzero(moved))
+        self.previous_gray = gray
+        return new_boxes, moved
+
+    def get_stats(self)->dict[str, int]:
+        """Returns the number of boxes moved and lost."""
+        return {'propagated': self.propagated, 'lost': self.lost}
+
+
+class DetectionScheduler:
+    """Decides which frames the detection model runs on when it only runs every few frames, with the boxes of the people propagated in between. Detection runs once
+    interval frames passed since it last ran, or earlier once the frame differs from the frame it last ran on by more than motion_threshold, such as when someone
+    walks in.
+
+    A frame picked for detection only counts as detected once record_detection confirms detection ran on it, so a frame dropped on its way through a pipeline does
+    not delay the next detection by a whole interval. While a picked frame is on its way, no other frame is picked, and once a later frame is recorded first, the
+    picked frame is known to be lost and the next frame is picked instead.
+
+    With a target_fps, the interval adapts to the measured cost of both kinds of frames, from the start of their processing until their LED data is sent. A cycle of
+    interval frames takes one detection and interval - 1 propagations, so the interval is the smallest one whose mean frame time fits in 1 / target_fps, between
+    min_interval and max_interval.
+
+    Attributes:
+    - interval (int): The current number of frames between detections.
+    - detections (int): The number of frames detection ran on.
+    - motion_detections (int): The number of those frames detection ran on early because of motion.
+    - propagations (int): The number of frames the boxes were propagated on.
+    - lost_detections (int): The number of frames picked for detection that were dropped before detection ran on them."""
+
+    def __init__(self, min_interval: int = 1, max_interval: int = 10, target_fps: float = 0.0, motion_threshold: float = 0.1, smoothing: float = 0.2):
+        """
+        Parameters:
+        - min_interval (int): The number of frames between detections, the shortest interval when adapting to target_fps.
+        - max_interval (int): The longest interval when adapting to target_fps.
+        - target_fps (float): The framerate the interval adapts to, 0 to keep the interval at min_interval.
+        - motion_threshold (float): The mean absolute difference (0.00-1.00) between the frame and the frame detection last ran on that triggers detection early, 0 to
+        never trigger detection early.
+        - smoothing (float): The weight (0.00-1.00) of a new measurement in the moving averages of the frame times."""
+
+        self.min_interval = max(1, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.target_fps = target_fps
+        self.motion_threshold = motion_threshold
+        self.smoothing = smoothing
+        self.interval: int = self.min_interval
+        self.detection_gray: typing.Union[np.ndarray, None] = None
+        self.frames_scheduled: int = 0
+        self.detection_frame: int = 0
+        self.pending_sequence: typing.Union[int, None] = None
+        self.pending_frame: int = 0
+        self.pending_motion: bool = False
+        self.detection_time: typing.Union[float, None] = None
+        self.propagation_time: typing.Union[float, None] = None
+        self.detections: int = 0
+        self.motion_detections: int = 0
+        self.propagations: int = 0
+        self.lost_detections: int = 0
+        return
+
+    def reset(self):
+        """Runs detection on the next frame, such as when detection is restarted."""
+        self.detection_gray = None
+        self.pending_sequence = None
+        return
+
+    def motion(self, gray: np.ndarray)->float:
+        """Returns the mean absolute difference (0.00-1.00) between the frame and the frame detection last ran on."""
+        return float(cv2.absdiff(gray, self.detection_gray).mean()) / 255
+
+    def should_detect(self, gray: np.ndarray, sequence: int)->bool:
+        """Returns True if detection has to run on the frame. Called once for every frame, in order, before it is processed.
+
+        Parameters:
+        - gray (np.ndarray): The frame, as returned by downscale_gray.
+        - sequence (int): The sequence number of the frame, which increases from one frame to the next."""
+
+        self.frames_scheduled += 1
+        if self.pending_sequence is not None:
+            return False
+        detect = self.detection_gray is None or self.detection_gray.shape != gray.shape or self.frames_scheduled - self.detection_frame >= self.interval
+        motion = not detect and self.motion_threshold > 0 and self.motion(gray) > self.motion_threshold
+        if detect or motion:
+            self.pending_sequence = sequence
+            self.pending_frame = self.frames_scheduled
+            self.pending_motion = motion
+        return detect or motion
+
+    def record_detection(self, sequence: int, gray: np.ndarray, seconds: float):
+        """Confirms detection ran on a frame picked by should_detect, which becomes the frame motion is measured against, and adds the time the frame took to its
+        moving average.
+
+        Parameters:
+        - sequence (int): The sequence number of the frame.
+        - gray (np.ndarray): The frame, as returned by downscale_gray.
+        - seconds (float): The time spent on the frame, from downscaling it to sending its LED data."""
+
+        if sequence == self.pending_sequence:
+            self.detection_frame = self.pending_frame
+            self.motion_detections += int(self.pending_motion)
+            self.pending_sequence = None
+        self.detection_gray = gray
+        self.detections += 1
+        self.detection_time = seconds if self.detection_time is None else (1 - self.smoothing) * self.detection_time + self.smoothing * seconds
+        self.adapt_interval()
+        return
+
+    def record_propagation(self, sequence: int, seconds: float):
+        """Records a frame the boxes were propagated on and adds the time it took to its moving average. A frame recorded after the frame picked for detection means the
+        picked frame was dropped, and the next frame is picked instead.
+
+        Parameters:
+        - sequence (int): The sequence number of the frame.
+        - seconds (float): The time spent on the frame, from downscaling it to sending its LED data."""
+
+        if self.pending_sequence is not None and sequence > self.pending_sequence:
+            self.pending_sequence = None
+            self.lost_detections += 1
+        self.propagations += 1
+        self.propagation_time = seconds if self.propagation_time is None else (1 - self.smoothing) * self.propagation_time + self.smoothing * seconds
+        self.adapt_interval()
+        return
+
+    def adapt_interval(self):
+        if self.target_fps <= 0 or self.detection_time is None:
+            return
+        frame_budget = 1 / self.target_fps
+        propagation_time = self.propagation_time if self.propagation_time is not None else 0.0
+        if self.detection_time <= frame_budget:
+            self.interval = self.min_interval
+        elif propagation_time >= frame_budget:
+            self.interval = self.max_interval
+        else:
+            # (detection_time + (interval - 1) * propagation_time) / interval <= frame_budget
+            interval = math.ceil((self.detection_time - propagation_time) / (frame_budget - propagation_time))
+            self.interval = min(max(interval, self.min_interval), self.max_interval)
+        return
+
+    def get_stats(self)->dict[str, typing.Union[int, float]]:
+        """Returns the current interval, the number of frames detected, propagated, and lost, and the mean time of both kinds of frames in milliseconds."""
+        return {'interval': self.interval, 'detections': self.detections, 'motion_detections': self.motion_detections, 'propagations': self.propagations,
+                'lost_detections': self.lost_detections, 'detection_ms': 1000 * (self.detection_time or 0.0), 'propagation_ms': 1000 * (self.propagation_time or 0.0)}
@@ -0,0 +1,250 @@
+import collections
+import threading
+import time
+import typing
+
+
+class BoundedFrameQueue:
+    """A bounded queue placed between two pipeline stages. When the queue is full, the overflow policy decides whether the oldest queued item is dropped to make room
+    for the new one, or the producer blocks until the consumer catches up. Items can be protected from DROP_OLDEST, such as frames detection runs on, in which case
+    the oldest unprotected item is dropped instead.
+
+    Attributes:
+    - maxsize (int): The maximum number of items held in the queue.
+    - policy (str): Either DROP_OLDEST or BLOCK.
+    - dropped (int): The number of items dropped because the queue was full."""
+
+    DROP_OLDEST: str = 'drop_oldest'
+    BLOCK: str = 'block'
+
+    def __init__(self, maxsize: int = 2, policy: str = DROP_OLDEST, is_protected: typing.Union[typing.Callable[[typing.Any], bool], None] = None):
+        """
+        Parameters:
+        - maxsize (int): The maximum number of items held in the queue.
+        - policy (str): The overflow policy, either BoundedFrameQueue.DROP_OLDEST or BoundedFrameQueue.BLOCK.
+        - is_protected (typing.Union[typing.Callable[[typing.Any], bool], None]): Returns True for items DROP_OLDEST only drops once every queued item is protected."""
+
+        if policy not in (self.DROP_OLDEST, self.BLOCK):
+            raise ValueError(f'Unknown queue policy {policy}')
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.is_protected = is_protected
+        self.items = collections.deque()
+        self.condition = threading.Condition()
+        self.dropped: int = 0
+        self.closed: bool = False
+        return
+
+    def put(self, item, timeout: typing.Union[float, None] = None)->bool:
+        """Adds an item to the queue, applying the overflow policy if the queue is full.
+
+        Parameters:
+        - item: The item to add.
+        - timeout (typing.Union[float, None]): With the BLOCK policy, the maximum number of seconds to wait for room in the queue.
+
+        Returns:
+        True if the item was queued, False if the queue was closed, the timeout expired, or the item was dropped because every queued item is protected."""
+
+        with self.condition:
+            if self.policy == self.BLOCK:
+                if not self.condition.wait_for(lambda: self.closed or len(self.items) < self.maxsize, timeout):
+                    return False
+            elif len(self.items) >= self.maxsize:
+                if not self.drop_oldest(item):
+                    return False
+            if self.closed:
+                return False
+            self.items.append(item)
+            self.condition.notify_all()
+            return True
+
+    def drop_oldest(self, new_item)->bool:
+        """Makes room for a new item by dropping the oldest queued item that is not protected. If every queued item is protected, the new item is dropped instead,
+        unless it is protected too, in which case the oldest item is dropped.
+
+        Returns:
+        False if the new item was dropped."""
+
+        self.dropped += 1
+        if self.is_protected is None:
+            self.items.popleft()
+            return True
+        drop_idx = next((idx for idx, item in enumerate(self.items) if not self.is_protected(item)), None)
+        if drop_idx is None:
+            if not self.is_protected(new_item):
+                return False
+            drop_idx = 0
+        del self.items[drop_idx]
+        return True
+
+    def get(self, timeout: typing.Union[float, None] = None):
+        """Removes and returns the oldest item of the queue, waiting for one if the queue is empty.
+
+        Parameters:
+        - timeout (typing.Union[float, None]): The maximum number of seconds to wait for an item.
+
+        Returns:
+        The item, or None if the timeout expired or the queue was closed."""
+
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.closed or self.items, timeout):
+                return None
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def qsize(self)->int:
+        """Returns the number of items currently queued."""
+        with self.condition:
+            return len(self.items)
+
+    def close(self):
+        """Wakes up every producer and consumer waiting on this queue and discards any queued items."""
+        with self.condition:
+            self.closed = True
+            self.items.clear()
+            self.condition.notify_all()
+        return
+
+
+class PipelineStage:
+    """A single stage of a DetectionPipeline. The stage runs on its own thread, takes items from its input queue, passes each one to its work function, and forwards the
+    returned item to its output queue. Returning None from the work function ends the item's trip through the pipeline."""
+
+    def __init__(self, name: str, work_function: typing.Callable, input_queue: BoundedFrameQueue, output_queue: typing.Union[BoundedFrameQueue, None] = None):
+        """
+        Parameters:
+        - name (str): The name the stage is reported under.
+        - work_function (typing.Callable): The function applied to every item taken from the input queue.
+        - input_queue (BoundedFrameQueue): The queue this stage takes items from.
+        - output_queue (typing.Union[BoundedFrameQueue, None]): The queue this stage forwards items to, or None for the last stage."""
+
+        self.name = name
+        self.work_function = work_function
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.active = threading.Event()
+        self.thread = None
+        self.stats_lock = threading.Lock()
+        self.processed: int = 0
+        self.errors: int = 0
+        self.total_latency: float = 0.0
+        self.last_latency: float = 0.0
+        self.max_latency: float = 0.0
+        return
+
+    def start(self):
+        """Starts the thread running this stage."""
+        self.active.set()
+        self.thread = threading.Thread(target=self.run, name=f'{self.name}_stage', daemon=True)
+        self.thread.start()
+        return
+
+    def stop(self):
+        """Signals the thread running this stage to exit."""
+        self.active.clear()
+        return
+
+    def run(self):
+        """Takes items from the input queue and processes them until the stage is stopped."""
+        while self.active.is_set():
+            item = self.input_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            start_time = time.perf_counter()
+            try:
+                result = self.work_function(item)
+            except Exception:
+                result = None
+                with self.stats_lock:
+                    self.errors += 1
+            latency = time.perf_counter() - start_time
+            with self.stats_lock:
+                self.processed += 1
+                self.total_latency += latency
+                self.last_latency = latency
+                self.max_latency = max(self.max_latency, latency)
+            if result is not None and self.output_queue is not None:
+                self.output_queue.put(result, timeout=0.5)
+        return
+
+    def get_stats(self)->dict[str, typing.Union[str, int, float]]:
+        """Returns the depth and drop count of this stage's input queue, and the number of items processed and their latencies in milliseconds."""
+        with self.stats_lock:
+            return {'stage': self.name, 'queue_depth': self.input_queue.qsize(), 'dropped': self.input_queue.dropped, 'processed': self.processed, 'errors': self.errors,
+                    'mean_latency_ms': 1000 * self.total_latency / self.processed if self.processed else 0.0,
+                    'last_latency_ms': 1000 * self.last_latency, 'max_latency_ms': 1000 * self.max_latency}
+
+
+class DetectionPipeline:
+    """A chain of PipelineStages connected by bounded queues, so every stage works on a different frame at the same time. While frame N is being annotated and sent,
+    inference can already run on frame N+1, which makes the per-frame latency bound by the slowest stage instead of the sum of all stages."""
+
+    def __init__(self, stages: list[tuple[str, typing.Callable]], queue_size: int = 2, queue_policy: str = BoundedFrameQueue.DROP_OLDEST,
+                 is_protected: typing.Union[typing.Callable[[typing.Any], bool], None] = None):
+        """
+        Parameters:
+        - stages (list[tuple[str, typing.Callable]]): The name and work function of every stage, in the order items flow through them.
+        - queue_size (int): The maximum number of items queued in front of each stage.
+        - queue_policy (str): The overflow policy of every queue, either BoundedFrameQueue.DROP_OLDEST or BoundedFrameQueue.BLOCK.
+        - is_protected (typing.Union[typing.Callable[[typing.Any], bool], None]): Returns True for items every queue only drops once all its queued items are protected."""
+
+        self.queues = [BoundedFrameQueue(queue_size, queue_policy, is_protected) for _ in stages]
+        self.stages: list[PipelineStage] = []
+        for idx, (name, work_function) in enumerate(stages):
+            output_queue = self.queues[idx + 1] if idx + 1 < len(stages) else None
+            self.stages.append(PipelineStage(name, work_function, self.queues[idx], output_queue))
+        return
+
+    def start(self):
+        """Starts every stage of the pipeline."""
+        for stage in self.stages:
+            stage.start()
+        return
+
+    def stop(self):
+        """Stops every stage of the pipeline and waits for their threads to exit."""
+        for stage in self.stages:
+            stage.stop()
+        for queue in self.queues:
+            queue.close()
+        for stage in self.stages:
+            if stage.thread:
+                stage.thread.join(timeout=1)
+        return
+
+    def submit(self, item)->bool:
+        """Adds an item to the queue of the first stage. Returns False if it could not be queued."""
+        return self.queues[0].put(item, timeout=0.5)
+
+    def get_stats(self)->list[dict[str, typing.Union[str, int, float]]]:
+        """Returns the statistics of every stage, in pipeline order."""
+        return [stage.get_stats() for stage in self.stages]
+
+
+class FramePacket:
+    """Carries a single frame and everything computed from it from one pipeline stage to the next."""
+
+    def __init__(self, sequence: int, timestamp: float, frame, preview_visible: bool):
+        """
+        Parameters:
+        - sequence (int): The sequence number the frame source tagged the frame with.
+        - timestamp (float): The time the frame was captured.
+        - frame (np.ndarray): The frame, which is annotated by later stages if the preview is visible.
+        - preview_visible (bool): True if the frame is displayed in the GUI preview."""
+
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.frame = frame
+        self.preview_visible = preview_visible
+        self.input_data = None
+        self.boxes = None
+        self.classes = None
+        self.scores = None
+        self.run_detection: bool = True
+        self.gray = None
+        self.gray_scale: float = 1.0
+        self.processing_time: float = 0.0
+        return
@@ -0,0 +1,169 @@
+import typing
+import cv2
+import numpy as np
+from led_mapping import FovSectionIndex, BrightnessCurve, brightness_based_on_distance_array
+
+
+class DetectionResults:
+    """The detections of a single frame that passed the class and score filters, stored as arrays with one entry per detection.
+
+    Attributes:
+    - boxes (np.ndarray): (N, 4) int array of the pixel vertices of each box, as xmin, ymin, xmax, ymax.
+    - class_ids (np.ndarray): The class index of each detection.
+    - scores (np.ndarray): The confidence score of each detection.
+    - widths (np.ndarray): The width in pixels of each box.
+    - mid_points_x (np.ndarray): The horizontal center of each box in pixels.
+    - mid_points_y (np.ndarray): The vertical center of each box in pixels.
+    - distances (np.ndarray): The estimated distance of each detection in meters.
+    - angles (np.ndarray): The horizontal angle of each detection in reference to the center of the camera.
+    - brightnesses (np.ndarray): The brightness (0.00-1.00) to illuminate each detection with.
+    - led_section_idxs (np.ndarray): The index of the LED section each detection lies in.
+    - track_ids (typing.Union[np.ndarray, None]): The id an ObjectTracker gave each detection, which stays the same across frames, or None if not tracked."""
+
+    def __init__(self, boxes: np.ndarray, class_ids: np.ndarray, scores: np.ndarray, widths: np.ndarray, mid_points_x: np.ndarray, mid_points_y: np.ndarray,
+                 distances: np.ndarray, angles: np.ndarray, brightnesses: np.ndarray, led_section_idxs: np.ndarray, track_ids: typing.Union[np.ndarray, None] = None):
+        self.boxes = boxes
+        self.class_ids = class_ids
+        self.scores = scores
+        self.widths = widths
+        self.mid_points_x = mid_points_x
+        self.mid_points_y = mid_points_y
+        self.distances = distances
+        self.angles = angles
+        self.brightnesses = brightnesses
+        self.led_section_idxs = led_section_idxs
+        self.track_ids = track_ids
+        return
+
+    def __len__(self)->int:
+        return len(self.scores)
+
+    def select(self, mask: np.ndarray)->'DetectionResults':
+        """Returns the detections selected by a boolean mask or index array."""
+        return DetectionResults(self.boxes[mask], self.class_ids[mask], self.scores[mask], self.widths[mask], self.mid_points_x[mask], self.mid_points_y[mask],
+                                self.distances[mask], self.angles[mask], self.brightnesses[mask], self.led_section_idxs[mask],
+                                self.track_ids[mask] if self.track_ids is not None else None)
+
+
+class DetectionPostProcessor:
+    """Turns the raw boxes, classes, and scores output by the detection model into a DetectionResults of the people in the frame, computing the pixel boxes, widths,
+    midpoints, distances, horizontal angles, brightnesses, and LED sections of every detection at once with NumPy instead of one object at a time."""
+
+    def __init__(self, labels: list[str], target_label: str = 'person', min_conf_threshold: float = 0.5, ref_person_width: int = 20,
+                 brightness_function: typing.Union[typing.Callable[[np.ndarray], np.ndarray], None] = None):
+        """
+        Parameters:
+        - labels (list[str]): The labels of the detection model, indexed by class index.
+        - target_label (str): The label of the objects kept, all other classes are filtered out.
+        - min_conf_threshold (float): The confidence a detection must exceed to be kept.
+        - ref_person_width (int): The width of the reference person for determining distance in inches.
+        - brightness_function (typing.Union[typing.Callable[[np.ndarray], np.ndarray], None]): Maps an array of distances in meters to an array of brightnesses,
+        such as a BrightnessCurve. Defaults to the lookup table of BrightnessCurve.default()."""
+
+        self.target_class_ids = np.array([idx for idx, label in enumerate(labels) if label == target_label], dtype=np.int64)
+        self.min_conf_threshold = min_conf_threshold
+        self.ref_person_width = ref_person_width
+        self.brightness_function = brightness_function if brightness_function is not None else BrightnessCurve.default()
+        self.fov_section_index = None
+        self.configure(640, 480, 0, 78)
+        return
+
+    def configure(self, video_width: int, video_height: int, focal_length: float, hfov: int, fov_section_index: typing.Union[FovSectionIndex, None] = None):
+        """Sets the geometry of the frames and camera the detections come from, and the index used to find the LED section of each detection.
+
+        Parameters:
+        - video_width (int): The width of the frames in pixels.
+        - video_height (int): The height of the frames in pixels.
+        - focal_length (float): The focal length of the camera in pixels.
+        - hfov (int): The horizontal field of view of the camera.
+        - fov_section_index (typing.Union[FovSectionIndex, None]): The precomputed FOV sections of the camera."""
+
+        self.video_width = video_width
+        self.video_height = video_height
+        self.focal_length = focal_length
+        self.hfov = hfov
+        if fov_section_index is not None:
+            self.fov_section_index = fov_section_index
+        return
+
+    def find_led_section_idxs(self, angles: np.ndarray)->np.ndarray:
+        """Returns the index of the FOV section each angle lies in, or -1 for angles outside of the field of view."""
+        if self.fov_section_index is None:
+            return np.full(len(angles), -1, dtype=np.int64)
+        return self.fov_section_index.lookup_idxs(angles)
+
+    def process(self, boxes: np.ndarray, classes: np.ndarray, scores: np.ndarray)->DetectionResults:
+        """Filters the model output by class and score, and computes the LED mapping of every detection left.
+
+        Parameters:
+        - boxes (np.ndarray): The normalized ymin, xmin, ymax, xmax of every detection.
+        - classes (np.ndarray): The class index of every detection.
+        - scores (np.ndarray): The confidence score of every detection.
+
+        Returns:
+        The DetectionResults of every detection kept. Detections with an empty box are dropped."""
+
+        return self.map_detections(*self.filter_detections(boxes, classes, scores))
+
+    def filter_detections(self, boxes: np.ndarray, classes: np.ndarray, scores: np.ndarray)->tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Filters the model output by class and score, and converts the boxes kept to pixels.
+
+        Parameters:
+        - boxes (np.ndarray): The normalized ymin, xmin, ymax, xmax of every detection.
+        - classes (np.ndarray): The class index of every detection.
+        - scores (np.ndarray): The confidence score of every detection.
+
+        Returns:
+        The xmin, ymin, xmax, ymax pixel boxes, class indexes, and scores of every detection kept. Detections with an empty box are dropped."""
+
+        class_ids = np.asarray(classes).astype(np.int64)
+        scores = np.asarray(scores)
+        keep = np.isin(class_ids, self.target_class_ids) & (scores > self.min_conf_threshold) & (scores <= 1.0)
+        kept_boxes = np.asarray(boxes)[keep]
+        frame_size = np.array([self.video_height, self.video_width, self.video_height, self.video_width], dtype=np.float64)
+        pixel_boxes = kept_boxes * frame_size
+        pixel_boxes[:, :2] = np.maximum(1, pixel_boxes[:, :2])
+        pixel_boxes[:, 2:] = np.minimum(frame_size[2:], pixel_boxes[:, 2:])
+        pixel_boxes = pixel_boxes.astype(np.int64)[:, [1, 0, 3, 2]]
+        non_empty = pixel_boxes[:, 2] > pixel_boxes[:, 0]
+        return pixel_boxes[non_empty], class_ids[keep][non_empty], scores[keep][non_empty]
+
+    def map_detections(self, pixel_boxes: np.ndarray, class_ids: np.ndarray, scores: np.ndarray, track_ids: typing.Union[np.ndarray, None] = None)->DetectionResults:
+        """Computes the widths, midpoints, distances, horizontal angles, brightnesses, and LED sections of detections already filtered by filter_detections.
+
+        Parameters:
+        - pixel_boxes (np.ndarray): (N, 4) int array of the xmin, ymin, xmax, ymax pixel boxes, none of them empty.
+        - class_ids (np.ndarray): The class index of every detection.
+        - scores (np.ndarray): The confidence score of every detection.
+        - track_ids (typing.Union[np.ndarray, None]): The track id of every detection, if tracked."""
+
+        widths = pixel_boxes[:, 2] - pixel_boxes[:, 0]
+        mid_points_x = pixel_boxes[:, 0] + .5 * widths
+        mid_points_y = pixel_boxes[:, 1] + .5 * (pixel_boxes[:, 3] - pixel_boxes[:, 1])
+        distances = (((self.ref_person_width * self.focal_length) / widths) * 2.54) / 100
+        angles = self.hfov * (mid_points_x / self.video_width - 0.5)
+        brightnesses = self.brightness_function(distances)
+        led_section_idxs = self.find_led_section_idxs(angles)
+        return DetectionResults(pixel_boxes, class_ids, scores, widths, mid_points_x, mid_points_y, distances, angles, brightnesses, led_section_idxs, track_ids)
+
+
+def draw_detections(frame: np.ndarray, detection_results: DetectionResults, labels: list[str]):
+    """Draws a box around every detection and places a label with the name of the object, its track id if tracked, and its confidence score above it.
+
+    Parameters:
+    - frame (np.ndarray): The frame to draw on.
+    - detection_results (DetectionResults): The detections to draw.
+    - labels (list[str]): The labels of the detection model, indexed by class index."""
+
+    track_ids = detection_results.track_ids.tolist() if detection_results.track_ids is not None else [None] * len(detection_results)
+    for (xmin, ymin, xmax, ymax), class_id, score, track_id in zip(detection_results.boxes.tolist(), detection_results.class_ids.tolist(),
+                                                                   detection_results.scores.tolist(), track_ids):
+        cv2.rectangle(frame, (xmin,ymin), (xmax,ymax), (10, 255, 0), 2)
+        label = '%s: %d%%' % (labels[class_id], int(score*100)) # Example: 'person: 72%'
+        if track_id is not None:
+            label = '%s %d: %d%%' % (labels[class_id], track_id, int(score*100)) # Example: 'person 3: 72%'
+        labelSize, baseLine = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2) # Get font size
+        label_ymin = max(ymin, labelSize[1] + 10) # Make sure not to draw label too close to top of window
+        cv2.rectangle(frame, (xmin, label_ymin-labelSize[1]-10), (xmin+labelSize[0], label_ymin+baseLine-10), (255, 255, 255), cv2.FILLED) # Draw white box to put label text in
+        cv2.putText(frame, label, (xmin, label_ymin-7), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2) # Draw label text
+    return
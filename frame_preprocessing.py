@@ -0,0 +1,69 @@
+import cv2
+import numpy as np
+
+
+class FramePreprocessor:
+    """Resizes and color converts camera frames into the input layout of a TensorFlow Lite detection model without allocating new arrays for every frame.
+
+    The frame is resized first, so the color conversion and the normalization of float models only touch the pixels of the model input. Both steps write into scratch
+    arrays allocated once in the constructor, and the final step writes directly into the destination buffer, which can be the input tensor of an interpreter."""
+
+    def __init__(self, input_width: int, input_height: int, floating_model: bool, input_mean: float = 127.5, input_std: float = 127.5):
+        """
+        Parameters:
+        - input_width (int): The width of the model input in pixels.
+        - input_height (int): The height of the model input in pixels.
+        - floating_model (bool): True if the model takes normalized float32 input, False if it takes uint8 input.
+        - input_mean (float): The mean subtracted from each pixel of a float model input.
+        - input_std (float): The standard deviation each pixel of a float model input is divided by."""
+
+        self.input_width = int(input_width)
+        self.input_height = int(input_height)
+        self.floating_model = floating_model
+        self.input_mean = input_mean
+        self.input_std = input_std
+        self.input_dtype = np.float32 if floating_model else np.uint8
+        self.resized_frame = np.empty((self.input_height, self.input_width, 3), dtype=np.uint8)
+        self.rgb_frame = np.empty((self.input_height, self.input_width, 3), dtype=np.uint8) if floating_model else None
+        return
+
+    def preprocess_into(self, frame: np.ndarray, destination: np.ndarray)->np.ndarray:
+        """Resizes the BGR frame to the model input size, converts it to RGB, and normalizes it for float models, writing the result into destination.
+
+        Parameters:
+        - frame (np.ndarray): The BGR frame read from a frame source.
+        - destination (np.ndarray): A contiguous (height, width, 3) array with the dtype of the model input.
+
+        Returns:
+        The destination array."""
+
+        cv2.resize(frame, (self.input_width, self.input_height), dst=self.resized_frame)
+        if not self.floating_model:
+            cv2.cvtColor(self.resized_frame, cv2.COLOR_BGR2RGB, dst=destination)
+            return destination
+        cv2.cvtColor(self.resized_frame, cv2.COLOR_BGR2RGB, dst=self.rgb_frame)
+        np.subtract(self.rgb_frame, self.input_mean, out=destination)
+        np.divide(destination, self.input_std, out=destination)
+        return destination
+
+    def preprocess_into_interpreter(self, interpreter, input_index: int, frame: np.ndarray)->None:
+        """Writes the preprocessed frame straight into the input tensor of the interpreter, so no input array is allocated and set_tensor does not need to copy one.
+        The view of the input tensor is released before returning, as the interpreter does not allow references to its buffers to be held while invoke is called.
+
+        Parameters:
+        - interpreter: The TensorFlow Lite interpreter whose input tensor is written.
+        - input_index (int): The index of the input tensor of the interpreter.
+        - frame (np.ndarray): The BGR frame read from a frame source."""
+
+        input_tensor = interpreter.tensor(input_index)()
+        self.preprocess_into(frame, input_tensor[0])
+        del input_tensor
+        return
+
+    def create_input_buffer(self, batch_size: int = 1)->np.ndarray:
+        """Returns a new array with the shape and dtype of the model input, used as a preallocated scratch buffer when frames can not be written to the interpreter directly.
+
+        Parameters:
+        - batch_size (int): The number of frames the buffer holds."""
+
+        return np.empty((batch_size, self.input_height, self.input_width, 3), dtype=self.input_dtype)
@@ -0,0 +1,340 @@
+import os
+import threading
+from threading import Thread
+import time
+import typing
+import cv2
+import numpy as np
+from utils import focal_length_finder
+
+
+class FrameSource:
+    """Base class for anything that produces frames for an ObjectDetectionModel, such as a live camera, a recorded video file, or a directory of images.
+
+    A frame source reads frames on its own thread and publishes each one into a single slot guarded by a condition variable. Every frame is tagged with a monotonically
+    increasing sequence number and a capture timestamp. Consumers block on wait_for_new_frame until a frame newer than the last one they read exists, and frames that were
+    overwritten before being read (dropped) or handed out more than once through read (duplicated) are counted.
+
+    Subclasses implement open, grab_frame, and release.
+
+    Attributes:
+    - video_width (int): The width in pixels of the frames produced by this source.
+    - video_heigth (int): The height in pixels of the frames produced by this source.
+    - focal_length (float): The focal length in pixels of the camera that produced the frames.
+    - hfov (int): The horizontal field of view of the camera that produced the frames.
+    - vfov (int): The vertical field of view of the camera that produced the frames.
+    - wait_for_consumer (bool): When True, the next frame is not published until the previous one has been read. Used for deterministic replay where no frame may be dropped.
+    - finished (bool): Set once a finite source has no more frames to produce."""
+
+    retry_delay: float = 0.01
+    wait_for_consumer: bool = False
+
+    def __init__(self, resolution: tuple[int, int] = (640, 480), focal_length: float = 0, hfov: int = 78, vfov: int = 49):
+        """Initializes the frame slot shared by every frame source.
+
+        Parameters:
+        - resolution (tuple[int, int]): The width and height of the frames produced by this source.
+        - focal_length (float): The focal length of the camera. If 0, it is calculated from the frame width and the horizontal field of view.
+        - hfov (int): The horizontal field of view of the camera.
+        - vfov (int): The vertical field of view of the camera."""
+
+        self.video_width = resolution[0]
+        self.video_heigth = resolution[1]
+        self.hfov = hfov
+        self.vfov = vfov
+        self.focal_length = focal_length
+
+        # Single slot holding the newest frame, guarded by a condition variable so consumers can sleep until a new frame is published
+        self.frame_condition = threading.Condition()
+        self.frame = None
+        self.frame_sequence: int = 0
+        self.frame_timestamp: float = 0.0
+        self.last_read_sequence: int = 0
+        self.dropped_frames: int = 0
+        self.duplicate_frames: int = 0
+        self.grabbed: bool = False
+        self.released: bool = True
+        self.finished: bool = False
+
+        # Variable to control when the source is stopped
+        self.stopped = False
+        return
+
+    def set_focal_length_from_hfov(self):
+        """Calculates the focal length from the frame width and horizontal field of view if one was not provided."""
+        if not self.focal_length:
+            self.focal_length = focal_length_finder(self.video_width, self.hfov)
+        return
+
+    def open(self)->None:
+        """Acquire the resources needed to produce frames. Called on construction and again by start if the source was released."""
+        raise NotImplementedError
+
+    def grab_frame(self)->tuple[bool, typing.Union[np.ndarray, None]]:
+        """Produce the next frame. Returns a tuple of a flag indicating a frame was produced, and the frame."""
+        raise NotImplementedError
+
+    def release(self)->None:
+        """Release the resources acquired in open."""
+        raise NotImplementedError
+
+    def start(self):
+        """Start the thread that reads frames from the source"""
+        if self.released:
+            self.open()
+        self.stopped = False
+        with self.frame_condition:
+            self.last_read_sequence = self.frame_sequence
+        Thread(target=self.update,args=()).start()
+        return self
+
+    def update(self):
+        """Keep looping indefinitely until the thread is stopped. grab_frame blocks until the next frame is available, so this thread sleeps between frames instead of spinning."""
+        while True:
+            # If the source is stopped, stop the thread
+            if self.stopped:
+                # Close source resources
+                self.release()
+                self.released = True
+                with self.frame_condition:
+                    self.frame_condition.notify_all()
+                return
+
+            if self.wait_for_consumer:
+                with self.frame_condition:
+                    self.frame_condition.wait_for(lambda: self.stopped or self.last_read_sequence >= self.frame_sequence)
+                if self.stopped:
+                    continue
+
+            # Otherwise, grab the next frame from the source
+            (self.grabbed, frame) = self.grab_frame()
+            if not self.grabbed:
+                if self.finished:
+                    self.stop()
+                    continue
+                # Back off instead of hammering a source that is not returning frames
+                time.sleep(self.retry_delay)
+                continue
+            self.publish_frame(frame)
+
+    def publish_frame(self, frame: np.ndarray):
+        """Store a newly produced frame in the frame slot, tag it with the next sequence number and the capture time, and wake up any waiting consumers.
+
+        Parameters:
+        - frame (np.ndarray): The frame produced by the source."""
+
+        with self.frame_condition:
+            self.frame = frame
+            self.frame_sequence += 1
+            self.frame_timestamp = time.time()
+            self.frame_condition.notify_all()
+        return
+
+    def read(self):
+        """Return the most recent frame without waiting. Returning a frame that was already read is counted as a duplicate."""
+        with self.frame_condition:
+            self.mark_frame_as_read()
+            return self.frame
+
+    def wait_for_new_frame(self, timeout: typing.Union[float, None] = 1.0)->typing.Union[tuple[int, float, np.ndarray], None]:
+        """Blocks until a frame newer than the last frame read is available, then returns it with its sequence number and capture timestamp.
+
+        Parameters:
+        - timeout (typing.Union[float, None]): The maximum number of seconds to wait for a new frame, or None to wait indefinitely.
+
+        Returns:
+        A tuple of the sequence number, capture timestamp, and frame, or None if the timeout expired or the source was stopped."""
+
+        with self.frame_condition:
+            has_new_frame = self.frame_condition.wait_for(lambda: self.stopped or self.frame_sequence > self.last_read_sequence, timeout)
+            if not has_new_frame or self.stopped:
+                return None
+            self.mark_frame_as_read()
+            return self.frame_sequence, self.frame_timestamp, self.frame
+
+    def mark_frame_as_read(self):
+        """Updates the dropped and duplicate frame counters for a read of the current frame, and wakes up a producer waiting for its consumer. Must be called while holding the frame condition."""
+        if self.frame_sequence == self.last_read_sequence:
+            self.duplicate_frames += 1
+        else:
+            self.dropped_frames += self.frame_sequence - self.last_read_sequence - 1
+        self.last_read_sequence = self.frame_sequence
+        self.frame_condition.notify_all()
+        return
+
+    def get_frame_stats(self)->dict[str, int]:
+        """Returns the number of frames captured, dropped before being read, and read more than once."""
+        with self.frame_condition:
+            return {'captured': self.frame_sequence, 'dropped': self.dropped_frames, 'duplicated': self.duplicate_frames}
+
+    def stop(self):
+        """Indicate that the source and thread should be stopped"""
+        self.stopped = True
+        with self.frame_condition:
+            self.frame_condition.notify_all()
+
+
+class VideoStream(FrameSource):
+    """Camera object that controls video streaming"""
+
+    def __init__(self, camera_index: int, resolution: tuple[int, int] =(640,480), framerate: int = 30, focal_length: float = 1080.1875, hfov: int = 78, vfov: int = 49):
+        """Creates an Object for that interfaces with the selected camera and stores data from the live feed in real time.
+        Data is stored and the dropped as feed is updated.
+
+        Parameters:
+        - camera_index (int): The device ID of the camera to read frames from.
+        - resolution (tuple[int, int]): The resolution to request from the camera.
+        - framerate (int): The framerate to display the camera feed at.
+        - focal_length (float): The focal length of the camera.
+        - hfov (int): The horizontal field of view of the camera.
+        - vfov (int): The vertical field of view of the camera."""
+
+        FrameSource.__init__(self, resolution, focal_length, hfov, vfov)
+        self.camera_index = camera_index
+        self.resolution = resolution
+        self.set_focal_length_from_hfov()
+        self.open()
+        return
+
+    def open(self):
+        """Initialize the Camera and the camera image stream, and read the first frame."""
+        self.stream = cv2.VideoCapture(self.camera_index)
+        ret = self.stream.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        ret = self.stream.set(3,self.resolution[0])
+        ret = self.stream.set(4,self.resolution[1])
+        self.released = False
+        # Read first frame from the stream
+        (self.grabbed, frame) = self.stream.read()
+        if self.grabbed:
+            self.publish_frame(frame)
+        return
+
+    def grab_frame(self):
+        """VideoCapture.read blocks until the camera delivers the next frame."""
+        return self.stream.read()
+
+    def release(self):
+        """Close camera resources."""
+        self.stream.release()
+        return
+
+
+class VideoFileFrameSource(FrameSource):
+    """Replays a recorded MP4/AVI file as a frame source. Frames are either paced at the file's framerate to mimic a live camera, or produced as fast as the
+    consumer can read them with no frame dropped, which makes runs deterministic for benchmarking and regression testing."""
+
+    def __init__(self, video_path: str, realtime: bool = True, loop: bool = False, focal_length: float = 0, hfov: int = 78, vfov: int = 49):
+        """
+        Parameters:
+        - video_path (str): The path to the video file to replay.
+        - realtime (bool): If True, frames are published at the framerate stored in the file. If False, frames are published as soon as the previous frame was read.
+        - loop (bool): Restart from the first frame once the end of the file is reached.
+        - focal_length (float): The focal length of the camera that recorded the file. If 0, it is calculated from the frame width and hfov.
+        - hfov (int): The horizontal field of view of the camera that recorded the file.
+        - vfov (int): The vertical field of view of the camera that recorded the file."""
+
+        FrameSource.__init__(self, (0, 0), focal_length, hfov, vfov)
+        self.video_path = video_path
+        self.realtime = realtime
+        self.loop = loop
+        self.wait_for_consumer = not realtime
+        self.open()
+        self.set_focal_length_from_hfov()
+        return
+
+    def open(self):
+        """Open the video file and read its resolution and framerate."""
+        self.stream = cv2.VideoCapture(self.video_path)
+        if not self.stream.isOpened():
+            raise FileNotFoundError(f'Unable to open video file {self.video_path}')
+        self.video_width = int(self.stream.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.video_heigth = int(self.stream.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.framerate = self.stream.get(cv2.CAP_PROP_FPS) or 30
+        self.frames_replayed = 0
+        self.replay_start_time = None
+        self.released = False
+        self.finished = False
+        return
+
+    def grab_frame(self):
+        """Reads the next frame of the file, sleeping until its presentation time when replaying in realtime."""
+        grabbed, frame = self.stream.read()
+        if not grabbed and self.loop and self.frames_replayed:
+            self.stream.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            grabbed, frame = self.stream.read()
+        if not grabbed:
+            self.finished = True
+            return False, None
+        if self.realtime:
+            if self.replay_start_time is None:
+                self.replay_start_time = time.perf_counter()
+            delay = self.replay_start_time + self.frames_replayed / self.framerate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        self.frames_replayed += 1
+        return True, frame
+
+    def release(self):
+        """Close the video file."""
+        self.stream.release()
+        return
+
+
+class ImageDirectoryFrameSource(FrameSource):
+    """Replays a directory of images, in file name order, as a frame source."""
+
+    image_extensions: tuple[str] = ('.png', '.jpg', '.jpeg', '.bmp')
+
+    def __init__(self, directory: str, framerate: typing.Union[float, None] = None, loop: bool = False, focal_length: float = 0, hfov: int = 78, vfov: int = 49):
+        """
+        Parameters:
+        - directory (str): The directory containing the images to replay.
+        - framerate (typing.Union[float, None]): The rate to publish images at. If None, images are published as soon as the previous image was read.
+        - loop (bool): Restart from the first image once every image was published.
+        - focal_length (float): The focal length of the camera that took the images. If 0, it is calculated from the image width and hfov.
+        - hfov (int): The horizontal field of view of the camera that took the images.
+        - vfov (int): The vertical field of view of the camera that took the images."""
+
+        FrameSource.__init__(self, (0, 0), focal_length, hfov, vfov)
+        self.directory = directory
+        self.framerate = framerate
+        self.loop = loop
+        self.wait_for_consumer = framerate is None
+        self.image_paths = sorted(os.path.join(directory, file_name) for file_name in os.listdir(directory) if file_name.lower().endswith(self.image_extensions))
+        if not self.image_paths:
+            raise FileNotFoundError(f'No images found in {directory}')
+        first_image = cv2.imread(self.image_paths[0])
+        self.video_heigth, self.video_width = first_image.shape[:2]
+        self.set_focal_length_from_hfov()
+        self.open()
+        return
+
+    def open(self):
+        """Rewind to the first image."""
+        self.image_idx = 0
+        self.replay_start_time = None
+        self.released = False
+        self.finished = False
+        return
+
+    def grab_frame(self):
+        """Reads the next image of the directory, sleeping until its presentation time if a framerate was provided."""
+        if self.image_idx >= len(self.image_paths):
+            if not self.loop:
+                self.finished = True
+                return False, None
+            self.image_idx = 0
+            self.replay_start_time = None
+        frame = cv2.imread(self.image_paths[self.image_idx])
+        if self.framerate:
+            if self.replay_start_time is None:
+                self.replay_start_time = time.perf_counter() - self.image_idx / self.framerate
+            delay = self.replay_start_time + self.image_idx / self.framerate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        self.image_idx += 1
+        return frame is not None, frame
+
+    def release(self):
+        """Nothing is held open between images."""
+        return
@@ -0,0 +1,517 @@
+import collections
+import copy
+import itertools
+import threading
+import time
+import typing
+import numpy as np
+
+NUM_HAND_LANDMARKS: int = 21
+
+
+def pre_process_landmark(landmark_list):
+    temp_landmark_list = copy.deepcopy(landmark_list)
+
+    # Convert to relative coordinates
+    base_x, base_y = 0, 0
+    for index, landmark_point in enumerate(temp_landmark_list):
+        if index == 0:
+            base_x, base_y = landmark_point[0], landmark_point[1]
+
+        temp_landmark_list[index][0] = temp_landmark_list[index][0] - base_x
+        temp_landmark_list[index][1] = temp_landmark_list[index][1] - base_y
+
+    # Convert to a one-dimensional list
+    temp_landmark_list = list(
+        itertools.chain.from_iterable(temp_landmark_list))
+
+    # Normalization
+    max_value = max(list(map(abs, temp_landmark_list)))
+
+    def normalize_(n):
+        return n / max_value
+
+    temp_landmark_list = list(map(normalize_, temp_landmark_list))
+
+    return temp_landmark_list
+
+def pre_process_landmarks(landmarks: np.ndarray)->np.ndarray:
+    """Vectorized pre_process_landmark for a batch of hands. The landmarks of every hand are made relative to its wrist, flattened, and divided by their largest
+    absolute value, all in a few array operations.
+
+    Parameters:
+    - landmarks (np.ndarray): (N, 21, 2) array of the pixel coordinates of the landmarks of N hands.
+
+    Returns:
+    (N, 42) float32 array, row i equal to pre_process_landmark of hand i."""
+
+    landmarks = np.asarray(landmarks, dtype=np.float64).reshape(-1, NUM_HAND_LANDMARKS, 2)
+    relative_landmarks = (landmarks - landmarks[:, :1]).reshape(len(landmarks), 2 * NUM_HAND_LANDMARKS)
+    max_values = np.abs(relative_landmarks).max(axis=1, keepdims=True)
+    return np.divide(relative_landmarks, max_values, out=np.zeros_like(relative_landmarks), where=max_values > 0).astype(np.float32)
+
+
+def calc_landmark_list(image, landmarks):
+    image_width, image_height = image.shape[1], image.shape[0]
+
+    landmark_point = []
+
+    # Keypoint
+    for _, landmark in enumerate(landmarks.landmark):
+        landmark_x = min(int(landmark.x * image_width), image_width - 1)
+        landmark_y = min(int(landmark.y * image_height), image_height - 1)
+        # landmark_z = landmark.z
+
+        landmark_point.append([landmark_x, landmark_y])
+
+    return landmark_point
+
+class KeyPointClassifier(object):
+    def __init__(
+        self,
+        model_path=r'C:\Users\brand\Documents\seniordesign\OldLITTest\ModelFiles\keypoint_classifier.tflite',
+        num_threads=1,
+    ):
+        from tensorflow.lite.python.interpreter import Interpreter
+        self.interpreter = Interpreter(model_path=model_path,
+                                               num_threads=num_threads)
+
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+        self.batch_size = 1
+        self.batching_supported = True
+        self.input_buffer = np.zeros((1, int(self.input_details[0]['shape'][1])), dtype=np.float32)
+
+    def __call__(
+        self,
+        landmark_list,
+    ):
+        result = self.invoke_batch(np.array([landmark_list], dtype=np.float32))
+
+        result_index = np.argmax(np.squeeze(result))
+
+        return result_index
+
+    def resize_batch(self, batch_size: int):
+        """Resizes the input tensor of the interpreter to hold exactly batch_size hands. Tensors are only reallocated when the number of hands changes, so every invoke
+        runs only the hands classified.
+
+        Parameters:
+        - batch_size (int): The number of hands the input tensor has to hold."""
+
+        if batch_size == self.batch_size:
+            return
+        self.interpreter.resize_tensor_input(self.input_details[0]['index'], [batch_size, self.input_buffer.shape[1]])
+        self.interpreter.allocate_tensors()
+        self.input_buffer = np.zeros((batch_size, self.input_buffer.shape[1]), dtype=np.float32)
+        self.batch_size = batch_size
+        return
+
+    def invoke_batch(self, pre_processed_landmarks: np.ndarray)->np.ndarray:
+        """Runs the model on the pre-processed landmarks of several hands with a single invoke and returns the scores of every gesture for every hand. If the model
+        turns out not to support a batch dimension, batching is disabled and the hands are run one at a time.
+
+        Parameters:
+        - pre_processed_landmarks (np.ndarray): (N, 42) float32 array of the output of pre_process_landmarks."""
+
+        batch_size = len(pre_processed_landmarks)
+        if batch_size > 1 and not self.batching_supported:
+            return np.concatenate([self.invoke_batch(pre_processed_landmarks[idx:idx + 1]) for idx in range(batch_size)])
+        try:
+            self.resize_batch(batch_size)
+        except Exception as e:
+            print(f'Batched inference is not supported by the keypoint classifier, classifying hands one at a time: {e!r}')
+            self.batching_supported = False
+            self.batch_size = None
+            self.resize_batch(1)
+            return self.invoke_batch(pre_processed_landmarks)
+        self.input_buffer[:] = pre_processed_landmarks
+        self.interpreter.set_tensor(self.input_details[0]['index'], self.input_buffer)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_details[0]['index'])
+
+    def classify_batch(self, landmarks: np.ndarray)->tuple[np.ndarray, np.ndarray]:
+        """Classifies the gestures of several hands at once, such as every hand found in a frame.
+
+        Parameters:
+        - landmarks (np.ndarray): (N, 21, 2) array of the pixel coordinates of the landmarks of every hand, as returned by calc_landmark_list.
+
+        Returns:
+        The gesture id of every hand and the score of that gesture."""
+
+        pre_processed_landmarks = pre_process_landmarks(landmarks)
+        if not len(pre_processed_landmarks):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        result = self.invoke_batch(pre_processed_landmarks)
+        return np.argmax(result, axis=1), np.max(result, axis=1)
+
+
+def classify_hands_in_crops(hands_contexts: 'HandsContextPool', keypoint_classifier: KeyPointClassifier, cropped_images_rgb: list[np.ndarray],
+                            track_ids: list[typing.Hashable])->list[list[tuple[int, list[list[int]]]]]:
+    """Finds the hands in the RGB crops of several people, each with the Hands instance of its person, then classifies the gestures of every hand found with a single
+    batch of the keypoint classifier.
+
+    Parameters:
+    - hands_contexts (HandsContextPool): The Hands instances of the people.
+    - keypoint_classifier (KeyPointClassifier): The hand gesture classifier.
+    - cropped_images_rgb (list[np.ndarray]): The RGB crop of every person.
+    - track_ids (list[typing.Hashable]): The id of every person, which selects the Hands instance tracking their hands.
+
+    Returns:
+    For every crop, the gesture id and the crop coordinates of the landmarks of every hand found."""
+
+    landmark_lists, crop_idxs = [], []
+    for crop_idx, (cropped_image_rgb, track_id) in enumerate(zip(cropped_images_rgb, track_ids)):
+        results = hands_contexts.process(track_id, cropped_image_rgb)
+        for hand_landmarks in results.multi_hand_landmarks or []:
+            landmark_lists.append(calc_landmark_list(cropped_image_rgb, hand_landmarks))
+            crop_idxs.append(crop_idx)
+    hands_per_crop = [[] for _ in cropped_images_rgb]
+    if landmark_lists:
+        hand_sign_ids, _ = keypoint_classifier.classify_batch(np.array(landmark_lists))
+        for crop_idx, hand_sign_id, landmark_list in zip(crop_idxs, hand_sign_ids.tolist(), landmark_lists):
+            hands_per_crop[crop_idx].append((hand_sign_id, landmark_list))
+    return hands_per_crop
+
+
+class HandsContextPool:
+    """Keeps a MediaPipe Hands instance for every person, so the hands of a person are always tracked by the same instance. In video mode MediaPipe only runs palm
+    detection until it finds a hand, then follows the hand from the landmarks of the previous crop, which is much cheaper than finding the palm again in every crop.
+    Sharing a single instance between people would feed it one person's crop after another's and defeat that tracking.
+
+    Instances are created when a person is first seen and closed when the person is evicted, either explicitly once they leave, after idle_timeout seconds without a
+    crop, or as the least recently used instance once max_contexts are open. In static image mode every crop runs palm detection, so a single instance is shared.
+
+    Attributes:
+    - contexts (collections.OrderedDict): The Hands instance of every person, least recently used first.
+    - created (int): The number of Hands instances created.
+    - evicted (int): The number of Hands instances closed before the pool was closed."""
+
+    def __init__(self, max_contexts: int = 8, static_image_mode: bool = False, max_num_hands: int = 1, min_detection_confidence: float = 0.5,
+                 min_tracking_confidence: float = 0.5, idle_timeout: float = 5.0, hands_factory: typing.Union[typing.Callable[[], typing.Any], None] = None):
+        """
+        Parameters:
+        - max_contexts (int): The most Hands instances open at once.
+        - static_image_mode (bool): True to run palm detection on every crop with a single shared instance, False to track the hands of every person in video mode.
+        - max_num_hands (int): The most hands found in a crop.
+        - min_detection_confidence (float): The confidence palm detection needs to find a hand.
+        - min_tracking_confidence (float): The confidence landmark tracking needs to keep following a hand, below it palm detection runs again.
+        - idle_timeout (float): The number of seconds without a crop after which the instance of a person is closed.
+        - hands_factory (typing.Union[typing.Callable[[], typing.Any], None]): Creates a Hands instance, mediapipe.solutions.hands.Hands with the options above if None."""
+
+        self.max_contexts = max(1, max_contexts)
+        self.static_image_mode = static_image_mode
+        self.max_num_hands = max_num_hands
+        self.min_detection_confidence = min_detection_confidence
+        self.min_tracking_confidence = min_tracking_confidence
+        self.idle_timeout = idle_timeout
+        self.hands_factory = hands_factory if hands_factory is not None else self.create_hands
+        self.contexts: collections.OrderedDict = collections.OrderedDict()
+        self.last_used_times: dict[typing.Hashable, float] = {}
+        self.created: int = 0
+        self.evicted: int = 0
+        return
+
+    def create_hands(self):
+        import mediapipe as mp
+        return mp.solutions.hands.Hands(static_image_mode=self.static_image_mode, max_num_hands=self.max_num_hands,
+                                        min_detection_confidence=self.min_detection_confidence, min_tracking_confidence=self.min_tracking_confidence)
+
+    def process(self, track_id: typing.Hashable, image_rgb: np.ndarray):
+        """Runs the Hands instance of a person on an RGB crop of them and returns the MediaPipe results.
+
+        Parameters:
+        - track_id (typing.Hashable): The id of the person, the same person has to keep the same id across frames.
+        - image_rgb (np.ndarray): The RGB crop of the person."""
+
+        if self.static_image_mode:
+            track_id = None
+        now = time.monotonic()
+        self.evict_idle(now)
+        context = self.contexts.get(track_id)
+        if context is None:
+            if len(self.contexts) >= self.max_contexts:
+                self.evict(next(iter(self.contexts)))
+            context = self.contexts[track_id] = self.hands_factory()
+            self.created += 1
+        else:
+            self.contexts.move_to_end(track_id)
+        self.last_used_times[track_id] = now
+        return context.process(image_rgb)
+
+    def evict(self, track_id: typing.Hashable):
+        """Closes the Hands instance of a person, such as once they left the frame."""
+        context = self.contexts.pop(track_id, None)
+        self.last_used_times.pop(track_id, None)
+        if context is not None:
+            context.close()
+            self.evicted += 1
+        return
+
+    def evict_idle(self, now: float):
+        for track_id in [track_id for track_id, last_used_time in self.last_used_times.items() if now - last_used_time > self.idle_timeout]:
+            self.evict(track_id)
+        return
+
+    def close(self):
+        """Closes every Hands instance."""
+        for context in self.contexts.values():
+            context.close()
+        self.contexts.clear()
+        self.last_used_times.clear()
+        return
+
+    def get_stats(self)->dict[str, int]:
+        """Returns the number of Hands instances open, created, and evicted."""
+        return {'open': len(self.contexts), 'created': self.created, 'evicted': self.evicted}
+
+
+class GestureTrack:
+    """The gesture state of a single person tracked across frames.
+
+    Attributes:
+    - track_id (typing.Hashable): The id of the person.
+    - gesture (typing.Union[str, None]): The label of the gesture last recognized, None if no hand was found.
+    - gesture_start_time (typing.Union[float, None]): The time the current gesture was first recognized.
+    - last_submit_time (float): The time the last crop of this person was accepted for recognition.
+    - last_seen_time (float): The time this person was last submitted, whether or not the crop was accepted.
+    - landmark_points (list[list[list[int]]]): The frame coordinates of the landmarks of every hand found in the last crop recognized."""
+
+    def __init__(self, track_id: typing.Hashable):
+        self.track_id = track_id
+        self.gesture: typing.Union[str, None] = None
+        self.gesture_start_time: typing.Union[float, None] = None
+        self.last_submit_time: float = float('-inf')
+        self.last_seen_time: float = 0.0
+        self.landmark_points: list[list[list[int]]] = []
+        return
+
+
+class GestureRecognizer:
+    """Runs hand gesture recognition on a worker thread of its own, fed with the crops of the people detected, so the detection loop runs at the full frame rate no
+    matter how many people are in view. The crops of every person in a frame are handed over together with submit_frame, so the gestures of all the hands found in
+    the frame are classified in a single batch. Every person is recognized at most rate_per_track times per second, and crops submitted while the worker is still
+    busy are dropped rather than queued, so recognition always works on recent crops and never builds up a backlog.
+
+    Holding hold_gesture for more than hold_duration seconds and then changing gesture calls on_gesture_held, which is how the "Love" gesture turns on all LEDs.
+
+    Attributes:
+    - tracks (dict[typing.Hashable, GestureTrack]): The gesture state of every person seen in the last track_timeout seconds.
+    - submitted (int): The number of crops accepted for recognition.
+    - recognized (int): The number of crops recognized.
+    - batches (int): The number of frames recognized, each as a single batch of crops.
+    - dropped_busy (int): The number of crops dropped because the worker was busy.
+    - rate_limited (int): The number of crops dropped because their person was recognized less than 1 / rate_per_track seconds before.
+    - errors (int): The number of crops in batches the classify function raised on."""
+
+    def __init__(self, classify_function: typing.Callable[[list[np.ndarray], list[typing.Hashable]], list[list[tuple[int, list[list[int]]]]]], labels: list[str],
+                 rate_per_track: float = 5.0, hold_gesture: str = 'Love', hold_duration: float = 3.0,
+                 on_gesture_held: typing.Union[typing.Callable[[typing.Hashable, str, float], None], None] = None, track_timeout: float = 2.0,
+                 on_track_forgotten: typing.Union[typing.Callable[[typing.Hashable], None], None] = None):
+        """
+        Parameters:
+        - classify_function (typing.Callable[[list[np.ndarray], list[typing.Hashable]], list[list[tuple[int, list[list[int]]]]]]): Finds the hands in the BGR crops
+        of the people with the track ids provided and returns, for every crop, the gesture id and the crop coordinates of the landmarks of every hand.
+        - labels (list[str]): The labels of the gestures, indexed by gesture id.
+        - rate_per_track (float): The most crops of a single person recognized per second, 0 for no limit.
+        - hold_gesture (str): The label of the gesture that has to be held.
+        - hold_duration (float): The number of seconds hold_gesture has to be held.
+        - on_gesture_held (typing.Union[typing.Callable[[typing.Hashable, str, float], None], None]): Called from the worker thread with the track id, gesture, and
+        duration once a person changes gesture after holding hold_gesture long enough.
+        - track_timeout (float): The number of seconds after which the state of a person no longer submitted is forgotten.
+        - on_track_forgotten (typing.Union[typing.Callable[[typing.Hashable], None], None]): Called from the worker thread with the track id of every person forgotten,
+        such as to close their HandsContextPool instance."""
+
+        self.classify_function = classify_function
+        self.labels = labels
+        self.rate_per_track = rate_per_track
+        self.hold_gesture = hold_gesture
+        self.hold_duration = hold_duration
+        self.on_gesture_held = on_gesture_held
+        self.track_timeout = track_timeout
+        self.on_track_forgotten = on_track_forgotten
+        self.tracks: dict[typing.Hashable, GestureTrack] = {}
+        self.condition = threading.Condition()
+        self.pending: typing.Union[tuple[list[tuple[GestureTrack, np.ndarray, tuple[int, int]]], float], None] = None
+        self.forgotten_track_ids: list[typing.Hashable] = []
+        self.busy: bool = False
+        self.active: bool = False
+        self.thread = None
+        self.submitted: int = 0
+        self.recognized: int = 0
+        self.batches: int = 0
+        self.dropped_busy: int = 0
+        self.rate_limited: int = 0
+        self.errors: int = 0
+        self.total_latency: float = 0.0
+        return
+
+    def start(self):
+        """Starts the worker thread."""
+        with self.condition:
+            if self.active:
+                return
+            self.active = True
+        self.thread = threading.Thread(target=self.run, name='gesture_recognition', daemon=True)
+        self.thread.start()
+        return
+
+    def stop(self):
+        """Stops the worker thread and forgets every person."""
+        with self.condition:
+            self.active = False
+            self.pending = None
+            self.forgotten_track_ids.clear()
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join(timeout=2)
+        with self.condition:
+            self.tracks.clear()
+        return
+
+    def submit(self, track_id: typing.Hashable, cropped_image: np.ndarray, origin: tuple[int, int] = (0, 0), timestamp: typing.Union[float, None] = None)->bool:
+        """Hands the crop of a single person to the worker, see submit_frame.
+
+        Returns:
+        True if the crop was accepted for recognition."""
+
+        return self.submit_frame([(track_id, cropped_image, origin)], timestamp) == 1
+
+    def submit_frame(self, crops: list[tuple[typing.Hashable, np.ndarray, tuple[int, int]]], timestamp: typing.Union[float, None] = None)->int:
+        """Hands the crops of the people in a frame to the worker as a single batch, leaving out the people recognized too recently. The whole frame is dropped if the
+        worker is busy. Never blocks.
+
+        Parameters:
+        - crops (list[tuple[typing.Hashable, np.ndarray, tuple[int, int]]]): The track id of every person, their BGR crop, copied if accepted, and the frame
+        coordinates of the top left corner of the crop. The same person has to keep the same track id across frames.
+        - timestamp (typing.Union[float, None]): The time the frame was captured, the current time if None.
+
+        Returns:
+        The number of crops accepted for recognition."""
+
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.condition:
+            if not self.active:
+                return 0
+            accepted_crops = []
+            for track_id, cropped_image, origin in crops:
+                track = self.tracks.get(track_id)
+                if track is None:
+                    track = self.tracks[track_id] = GestureTrack(track_id)
+                track.last_seen_time = timestamp
+                if self.rate_per_track > 0 and timestamp - track.last_submit_time < 1 / self.rate_per_track:
+                    self.rate_limited += 1
+                    continue
+                accepted_crops.append((track, cropped_image, origin))
+            if not accepted_crops:
+                return 0
+            if self.busy or self.pending is not None:
+                self.dropped_busy += len(accepted_crops)
+                return 0
+            for track, _, _ in accepted_crops:
+                track.last_submit_time = timestamp
+            self.pending = ([(track, cropped_image.copy(), origin) for track, cropped_image, origin in accepted_crops], timestamp)
+            self.submitted += len(accepted_crops)
+            self.condition.notify_all()
+            return len(accepted_crops)
+
+    def forget_tracks(self, track_ids: list[typing.Hashable]):
+        """Forgets the gesture state of people right away, such as once an ObjectTracker removed their tracks, instead of waiting for track_timeout. on_track_forgotten
+        is still called from the worker thread, so it never runs concurrently with the classify function.
+
+        Parameters:
+        - track_ids (list[typing.Hashable]): The ids of the people to forget."""
+
+        if not track_ids:
+            return
+        with self.condition:
+            for track_id in track_ids:
+                if self.tracks.pop(track_id, None) is not None:
+                    self.forgotten_track_ids.append(track_id)
+            self.condition.notify_all()
+        return
+
+    def run(self):
+        """Recognizes the gestures of every batch of crops handed to the worker until stopped."""
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: not self.active or self.pending is not None or self.forgotten_track_ids)
+                if not self.active:
+                    return
+                forgotten_track_ids, self.forgotten_track_ids = self.forgotten_track_ids, []
+                pending, self.pending = self.pending, None
+                self.busy = pending is not None
+            if self.on_track_forgotten:
+                for track_id in forgotten_track_ids:
+                    self.on_track_forgotten(track_id)
+            if pending is None:
+                continue
+            crops, timestamp = pending
+            start_time = time.perf_counter()
+            try:
+                hands_per_crop = self.classify_function([cropped_image for _, cropped_image, _ in crops], [track.track_id for track, _, _ in crops])
+            except Exception:
+                hands_per_crop = None
+            latency = time.perf_counter() - start_time
+            held_gestures = []
+            with self.condition:
+                self.busy = False
+                if hands_per_crop is None:
+                    self.errors += len(crops)
+                    continue
+                self.recognized += len(crops)
+                self.batches += 1
+                self.total_latency += latency
+                for (track, _, origin), hands in zip(crops, hands_per_crop):
+                    track.landmark_points = [[[origin[0] + x, origin[1] + y] for x, y in landmark_list] for _, landmark_list in hands]
+                    held_gesture = self.update_track_gesture(track, [hand_sign_id for hand_sign_id, _ in hands], timestamp)
+                    if held_gesture:
+                        held_gestures.append((track.track_id, *held_gesture))
+                forgotten_track_ids = self.forget_stale_tracks(timestamp)
+            if self.on_gesture_held:
+                for held_gesture in held_gestures:
+                    self.on_gesture_held(*held_gesture)
+            if self.on_track_forgotten:
+                for track_id in forgotten_track_ids:
+                    self.on_track_forgotten(track_id)
+        return
+
+    def update_track_gesture(self, track: GestureTrack, hand_sign_ids: list[int], timestamp: float)->typing.Union[tuple[str, float], None]:
+        """Updates the gesture of a person with the gestures recognized in their crop, the last hand found wins. Returns the gesture and how long it was held if the
+        person just stopped holding hold_gesture after holding it for more than hold_duration seconds."""
+        if not hand_sign_ids:
+            track.gesture = None
+            return None
+        gesture = self.labels[hand_sign_ids[-1]]
+        if gesture == track.gesture:
+            return None
+        held_gesture = None
+        if track.gesture and track.gesture_start_time is not None:
+            duration = timestamp - track.gesture_start_time
+            print(f'Detected {track.gesture} for {duration}')
+            if duration > self.hold_duration and track.gesture == self.hold_gesture:
+                held_gesture = (track.gesture, duration)
+        track.gesture_start_time = timestamp
+        track.gesture = gesture
+        return held_gesture
+
+    def forget_stale_tracks(self, timestamp: float)->list[typing.Hashable]:
+        """Forgets every person not submitted in the last track_timeout seconds and returns their track ids."""
+        forgotten_track_ids = [track_id for track_id, track in self.tracks.items() if timestamp - track.last_seen_time > self.track_timeout]
+        for track_id in forgotten_track_ids:
+            del self.tracks[track_id]
+        return forgotten_track_ids
+
+    def get_landmark_points(self)->list[list[list[int]]]:
+        """Returns the frame coordinates of the landmarks of every hand found in the last crop recognized of every person."""
+        with self.condition:
+            return [landmark_list for track in self.tracks.values() for landmark_list in track.landmark_points]
+
+    def get_stats(self)->dict[str, typing.Union[int, float]]:
+        """Returns the number of crops accepted, recognized, dropped because the worker was busy, dropped by the per person rate, and failed, the number of frames
+        recognized, the number of people tracked, and the mean recognition latency of a frame in milliseconds."""
+        with self.condition:
+            return {'submitted': self.submitted, 'recognized': self.recognized, 'batches': self.batches, 'dropped_busy': self.dropped_busy,
+                    'rate_limited': self.rate_limited, 'errors': self.errors, 'tracks': len(self.tracks),
+                    'mean_latency_ms': 1000 * self.total_latency / self.batches if self.batches else 0.0}
@@ -0,0 +1,484 @@
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+import typing
+import numpy as np
+
+
+DETECT_REQUEST: str = 'DETECT'
+HAND_GESTURE_REQUEST: str = 'HAND_GESTURE'
+FORGET_HANDS_REQUEST: str = 'FORGET_HANDS'
+WORKER_QUEUE_POLL_INTERVAL: float = 0.002
+
+
+def create_interpreter(model_path: str, use_edge_tpu: bool = False):
+    """Creates a TensorFlow Lite interpreter for the model provided, using an EdgeTPU or the CPU, and allocates its tensors.
+
+    Parameters:
+    - model_path (str): The file path to the TensorFlow Lite model.
+    - use_edge_tpu (bool): A flag for creating an interpreter that uses an edgeTPU to perfrom computations."""
+
+    from tensorflow.lite.python.interpreter import Interpreter
+    from tensorflow.lite.python.interpreter import load_delegate
+    if use_edge_tpu:
+        interpreter = Interpreter(model_path=model_path, experimental_delegates=[load_delegate('edgetpu.dll')])
+    else:
+        interpreter = Interpreter(model_path=model_path)
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+def get_detection_model_details(interpreter)->dict[str, typing.Union[int, bool]]:
+    """Returns the input size and type of a detection interpreter, and the indexes of its boxes, classes, and scores outputs."""
+    input_details = interpreter.get_input_details()
+    output_details = interpreter.get_output_details()
+    if 'StatefulPartitionedCall' in output_details[0]['name']: # This is a TF2 model
+        boxes_idx, classes_idx, scores_idx = 1, 3, 0
+    else: # This is a TF1 model
+        boxes_idx, classes_idx, scores_idx = 0, 1, 2
+    return {'height': int(input_details[0]['shape'][1]), 'width': int(input_details[0]['shape'][2]), 'floating_model': input_details[0]['dtype'] == np.float32,
+            'input_index': input_details[0]['index'], 'boxes_index': output_details[boxes_idx]['index'], 'classes_index': output_details[classes_idx]['index'],
+            'scores_index': output_details[scores_idx]['index']}
+
+
+class InferenceWorker:
+    """The models held by a single worker process of an InferenceService: one detection interpreter, and optionally a HandsContextPool and one KeyPointClassifier."""
+
+    def __init__(self, config: dict):
+        """
+        Parameters:
+        - config (dict): The model paths and options passed to the InferenceService."""
+
+        self.config = config
+        self.interpreter = create_interpreter(config['model_path'], config['use_edge_tpu'])
+        self.details = get_detection_model_details(self.interpreter)
+        self.max_batch_size = max(1, config.get('max_batch_size', 1))
+        self.batching_supported = self.max_batch_size > 1
+        # One interpreter allocated for every batch size in use, so a batch only runs the frames it holds and a size is only allocated the first time it appears
+        self.batch_interpreters: dict[int, typing.Any] = {1: self.interpreter}
+        self.batch_buffers: dict[int, np.ndarray] = {}
+        self.hands_contexts = None
+        self.keypoint_classifier = None
+        if config['keypoint_classifier_path']:
+            from gesture_recognition import KeyPointClassifier, HandsContextPool
+            self.hands_contexts = HandsContextPool(config.get('max_hands_contexts', 8), static_image_mode=not config.get('hands_tracking', True), max_num_hands=1,
+                                                   min_detection_confidence=0.5)
+            self.keypoint_classifier = KeyPointClassifier(config['keypoint_classifier_path'])
+        return
+
+    def get_batch_interpreter(self, batch_size: int):
+        """Returns the detection interpreter whose input tensor holds batch_size frames, creating and allocating it the first time a batch of that size is run.
+
+        Parameters:
+        - batch_size (int): The number of frames in the batch."""
+
+        interpreter = self.batch_interpreters.get(batch_size)
+        if interpreter is None:
+            interpreter = create_interpreter(self.config['model_path'], self.config['use_edge_tpu'])
+            interpreter.resize_tensor_input(self.details['input_index'], [batch_size, self.details['height'], self.details['width'], 3])
+            interpreter.allocate_tensors()
+            self.batch_interpreters[batch_size] = interpreter
+            self.batch_buffers[batch_size] = np.zeros((batch_size, self.details['height'], self.details['width'], 3),
+                                                      dtype=np.float32 if self.details['floating_model'] else np.uint8)
+        return interpreter
+
+    def disable_batching(self, error: Exception):
+        """Runs frames one at a time from now on, after the model turned out not to support a batch dimension."""
+        print(f'Batched inference is not supported by this model, running frames one at a time: {error!r}')
+        self.batching_supported = False
+        self.batch_interpreters = {1: self.interpreter}
+        self.batch_buffers = {}
+        return
+
+    def detect_batch(self, input_batch: list[np.ndarray])->list[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Runs the detection model on several preprocessed frames with a single invoke, and returns the boxes, classes, and scores of each frame in the order provided.
+        If the model turns out not to support a batch dimension, batching is disabled and the frames are run one at a time.
+
+        Parameters:
+        - input_batch (list[np.ndarray]): The preprocessed frames, each with a batch dimension of 1."""
+
+        max_batch_size = self.max_batch_size if self.batching_supported else 1
+        if len(input_batch) > max_batch_size:
+            return [result for idx in range(0, len(input_batch), max_batch_size) for result in self.detect_batch(input_batch[idx:idx + max_batch_size])]
+        batch_size = len(input_batch)
+        try:
+            interpreter = self.get_batch_interpreter(batch_size)
+            if batch_size == 1:
+                interpreter.set_tensor(self.details['input_index'], input_batch[0])
+            else:
+                batch_buffer = self.batch_buffers[batch_size]
+                for idx, input_data in enumerate(input_batch):
+                    batch_buffer[idx] = input_data[0]
+                interpreter.set_tensor(self.details['input_index'], batch_buffer)
+            interpreter.invoke()
+            boxes = interpreter.get_tensor(self.details['boxes_index'])
+            classes = interpreter.get_tensor(self.details['classes_index'])
+            scores = interpreter.get_tensor(self.details['scores_index'])
+            if len(boxes) != batch_size:
+                raise ValueError(f'Model returned {len(boxes)} results for a batch of {batch_size}')
+        except Exception as e:
+            if batch_size == 1:
+                raise
+            self.disable_batching(e)
+            return self.detect_batch(input_batch)
+        return [(boxes[idx], classes[idx], scores[idx]) for idx in range(batch_size)]
+
+    def detect(self, input_data: np.ndarray)->tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Runs the detection model on a preprocessed frame and returns its boxes, classes, and scores."""
+        return self.detect_batch([input_data])[0]
+
+    def classify_hand_gestures(self, cropped_images_rgb: list[np.ndarray], track_keys: list[typing.Hashable])->list[list[tuple[int, list[list[int]]]]]:
+        """Finds the hands in the RGB crops of the people in a frame and classifies their gestures in a single batch. Returns, for every crop, the gesture id and pixel
+        landmarks of every hand found.
+
+        Parameters:
+        - cropped_images_rgb (list[np.ndarray]): The RGB crop of every person.
+        - track_keys (list[typing.Hashable]): The client and track id of every person, which selects the Hands instance tracking their hands. The crops of a person
+        are always routed to the same worker."""
+        from gesture_recognition import classify_hands_in_crops
+        if self.hands_contexts is None:
+            return [[] for _ in cropped_images_rgb]
+        return classify_hands_in_crops(self.hands_contexts, self.keypoint_classifier, cropped_images_rgb, track_keys)
+
+    def forget_hands_contexts(self, track_keys: list[typing.Hashable]):
+        """Closes the Hands instances of people who left, instead of waiting for them to go idle."""
+        if self.hands_contexts is None:
+            return
+        for track_key in track_keys:
+            self.hands_contexts.evict(track_key)
+        return
+
+    def handle_request(self, kind: str, payload, client_id: typing.Union[int, None] = None):
+        """Runs the request on the matching model and returns its result."""
+        if kind == DETECT_REQUEST:
+            return self.detect(payload)
+        elif kind == HAND_GESTURE_REQUEST:
+            track_ids, cropped_images_rgb = payload
+            return self.classify_hand_gestures(cropped_images_rgb, [(client_id, track_id) for track_id in track_ids])
+        elif kind == FORGET_HANDS_REQUEST:
+            return self.forget_hands_contexts([(client_id, track_id) for track_id in payload])
+        raise ValueError(f'Unknown inference request {kind}')
+
+
+def run_inference_worker(config: dict, request_queue: multiprocessing.Queue, worker_queue: typing.Union[multiprocessing.Queue, None],
+                         response_queues: dict[int, multiprocessing.Queue], ready_queue: multiprocessing.Queue):
+    """Target of every worker process of an InferenceService. Loads the models once, reports the details of the detection model, then serves requests from any client
+    until a None sentinel is received.
+
+    Parameters:
+    - config (dict): The model paths and options passed to the InferenceService.
+    - request_queue (multiprocessing.Queue): The queue shared by every client and worker, containing tuples of client id, request id, request kind, and payload.
+    - worker_queue (typing.Union[multiprocessing.Queue, None]): The queue of the requests routed to this worker only, such as the hand requests of the people it
+    tracks, or None if the service has a single worker.
+    - response_queues (dict[int, multiprocessing.Queue]): The queue of every client, keyed by client id, where results are returned.
+    - ready_queue (multiprocessing.Queue): The queue the model details are reported on once the models are loaded."""
+
+    worker = InferenceWorker(config)
+    ready_queue.put(worker.details)
+    while True:
+        request = get_next_request(request_queue, worker_queue)
+        if request is None:
+            return
+        if request[2] != DETECT_REQUEST or worker.max_batch_size == 1:
+            serve_request(worker, request, response_queues)
+            continue
+        detect_requests, other_requests, received_sentinel = gather_detect_batch(request, request_queue, worker.max_batch_size, config.get('batch_window', 0.005))
+        serve_detect_batch(worker, detect_requests, response_queues)
+        for other_request in other_requests:
+            serve_request(worker, other_request, response_queues)
+        if received_sentinel:
+            return
+
+
+def get_next_request(request_queue: multiprocessing.Queue, worker_queue: typing.Union[multiprocessing.Queue, None])->typing.Union[tuple, None]:
+    """Returns the next request for a worker, serving the requests routed to it before the ones any worker can serve. A process cannot block on two queues at once,
+    so the shared queue is polled every WORKER_QUEUE_POLL_INTERVAL seconds while both are empty."""
+    if worker_queue is None:
+        return request_queue.get()
+    while True:
+        try:
+            return worker_queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return request_queue.get(timeout=WORKER_QUEUE_POLL_INTERVAL)
+        except queue.Empty:
+            continue
+
+
+def serve_request(worker: InferenceWorker, request: tuple, response_queues: dict[int, multiprocessing.Queue]):
+    """Runs a single request on the worker and returns the result to the client that submitted it, unless it was submitted without a request id."""
+    client_id, request_id, kind, payload = request
+    try:
+        result = (True, worker.handle_request(kind, payload, client_id))
+    except Exception as e:
+        result = (False, repr(e))
+    if request_id is not None:
+        response_queues[client_id].put((request_id, result))
+    return
+
+
+def gather_detect_batch(first_request: tuple, request_queue: multiprocessing.Queue, max_batch_size: int, batch_window: float)->tuple[list[tuple], list[tuple], bool]:
+    """Collects detection requests submitted within batch_window seconds of the first one, up to max_batch_size requests, so frames from several cameras captured at about
+    the same time run in a single invoke.
+
+    Returns:
+    The detection requests, any other requests received while gathering, and whether the stop sentinel was received."""
+
+    detect_requests = [first_request]
+    other_requests = []
+    deadline = time.perf_counter() + batch_window
+    while len(detect_requests) < max_batch_size:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        try:
+            request = request_queue.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if request is None:
+            return detect_requests, other_requests, True
+        if request[2] == DETECT_REQUEST:
+            detect_requests.append(request)
+        else:
+            other_requests.append(request)
+    return detect_requests, other_requests, False
+
+
+def serve_detect_batch(worker: InferenceWorker, detect_requests: list[tuple], response_queues: dict[int, multiprocessing.Queue]):
+    """Runs a batch of detection requests with a single invoke and returns each frame's boxes, classes, and scores to the client that submitted it."""
+    try:
+        results = [(True, result) for result in worker.detect_batch([request[3] for request in detect_requests])]
+    except Exception as e:
+        results = [(False, repr(e))] * len(detect_requests)
+    for (client_id, request_id, _, _), result in zip(detect_requests, results):
+        response_queues[client_id].put((request_id, result))
+    return
+
+
+class InferenceClient:
+    """The handle a camera uses to submit requests to an InferenceService. Clients are created by InferenceService.create_client before the service is started, and can be
+    passed to the processes running the cameras once it has started. A client can be used from several threads at once, such as the detection loop and the worker
+    thread of the gesture recognizer."""
+
+    def __init__(self, client_id: int, request_queue: multiprocessing.Queue, response_queue: multiprocessing.Queue,
+                 worker_queues: typing.Union[list[multiprocessing.Queue], None] = None, hands_tracking: bool = True):
+        """
+        Parameters:
+        - client_id (int): The id the service routes responses to this client with.
+        - request_queue (multiprocessing.Queue): The request queue shared by every client of the service.
+        - response_queue (multiprocessing.Queue): The queue the workers return results for this client on.
+        - worker_queues (typing.Union[list[multiprocessing.Queue], None]): The queue of every worker, which the hand requests of a person are routed to so the same
+        worker always tracks their hands, or None to send every request to the shared queue.
+        - hands_tracking (bool): Whether the workers track the hands of every person in video mode, which needs a stable track id per person."""
+
+        self.client_id = client_id
+        self.request_queue = request_queue
+        self.response_queue = response_queue
+        self.worker_queues = worker_queues or []
+        self.hands_tracking = hands_tracking
+        self.model_details: dict[str, typing.Union[int, bool]] = {}
+        self.request_ids = itertools.count()
+        self.response_condition = threading.Condition()
+        self.reading_responses = False
+        self.responses: dict[int, tuple[bool, typing.Any]] = {}
+        self.abandoned_request_ids: set[int] = set()
+        return
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['request_ids']
+        del state['response_condition']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.request_ids = itertools.count()
+        self.response_condition = threading.Condition()
+        return
+
+    def send(self, kind: str, payload, request_queue: typing.Union[multiprocessing.Queue, None] = None, expect_response: bool = True)->typing.Union[int, None]:
+        """Submits a request to the service without waiting for its result, and returns its request id, or None if no response is expected.
+
+        Parameters:
+        - kind (str): The kind of request, DETECT_REQUEST, HAND_GESTURE_REQUEST, or FORGET_HANDS_REQUEST.
+        - payload: The data the request runs on.
+        - request_queue (typing.Union[multiprocessing.Queue, None]): The queue of the worker the request is routed to, or None for the shared queue.
+        - expect_response (bool): A flag for requests the workers do not return a result for."""
+
+        request_id = next(self.request_ids) if expect_response else None
+        (request_queue or self.request_queue).put((self.client_id, request_id, kind, payload))
+        return request_id
+
+    def receive(self, request_ids: list[int], kind: str, timeout: float = 5.0)->list:
+        """Blocks until the workers returned the results of every request provided and returns them in order. One thread at a time reads the response queue, and hands
+        the results of the requests of other threads over to them. Responses to earlier requests that timed out are discarded.
+
+        Parameters:
+        - request_ids (list[int]): The ids returned by send.
+        - kind (str): The kind of the requests, used in errors.
+        - timeout (float): The maximum number of seconds to wait for the results."""
+
+        deadline = time.perf_counter() + timeout
+        with self.response_condition:
+            while not all(request_id in self.responses for request_id in request_ids):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self.abandoned_request_ids.update(request_id for request_id in request_ids if request_id not in self.responses)
+                    for request_id in request_ids:
+                        self.responses.pop(request_id, None)
+                    raise TimeoutError(f'Inference request {kind} timed out after {timeout} seconds')
+                if self.reading_responses:
+                    self.response_condition.wait(remaining)
+                    continue
+                self.reading_responses = True
+                self.response_condition.release()
+                try:
+                    response = self.response_queue.get(timeout=remaining)
+                except queue.Empty:
+                    response = None
+                finally:
+                    self.response_condition.acquire()
+                    self.reading_responses = False
+                    self.response_condition.notify_all()
+                if response is None:
+                    continue
+                response_id, result = response
+                if response_id in self.abandoned_request_ids:
+                    self.abandoned_request_ids.discard(response_id)
+                else:
+                    self.responses[response_id] = result
+            results = [self.responses.pop(request_id) for request_id in request_ids]
+        for succeeded, result in results:
+            if not succeeded:
+                raise RuntimeError(result)
+        return [result for _, result in results]
+
+    def submit(self, kind: str, payload, timeout: float = 5.0):
+        """Submits a request to the service and blocks until a worker returns its result.
+
+        Parameters:
+        - kind (str): The kind of request, DETECT_REQUEST or HAND_GESTURE_REQUEST.
+        - payload: The data the request runs on.
+        - timeout (float): The maximum number of seconds to wait for the result."""
+
+        return self.receive([self.send(kind, payload)], kind, timeout)[0]
+
+    def worker_queue_idx(self, track_id: typing.Hashable)->int:
+        """Returns the index of the worker that tracks the hands of a person. Integer track ids are handed out in order, so consecutive people go to consecutive
+        workers."""
+        if isinstance(track_id, int):
+            return (self.client_id + track_id) % len(self.worker_queues)
+        return hash((self.client_id, track_id)) % len(self.worker_queues)
+
+    def detect(self, input_data: np.ndarray)->tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Runs the detection model on a preprocessed frame and returns its boxes, classes, and scores."""
+        return self.submit(DETECT_REQUEST, input_data)
+
+    def classify_hand_gestures(self, cropped_images_rgb: list[np.ndarray], track_ids: list[typing.Hashable],
+                               timeout: float = 5.0)->list[list[tuple[int, list[list[int]]]]]:
+        """Returns, for every RGB crop of the people in a frame, the gesture id and pixel landmarks of every hand found, tracking the hands of every person with the
+        track id provided. The crops of a person always go to the same worker, which keeps their Hands instance, and the gestures of all the hands a worker is sent
+        are classified in a single batch."""
+
+        if not self.worker_queues:
+            return self.submit(HAND_GESTURE_REQUEST, (list(track_ids), cropped_images_rgb), timeout)
+        crop_idxs_per_worker: dict[int, list[int]] = {}
+        for crop_idx, track_id in enumerate(track_ids):
+            crop_idxs_per_worker.setdefault(self.worker_queue_idx(track_id), []).append(crop_idx)
+        request_ids = [self.send(HAND_GESTURE_REQUEST, ([track_ids[crop_idx] for crop_idx in crop_idxs], [cropped_images_rgb[crop_idx] for crop_idx in crop_idxs]),
+                                 self.worker_queues[worker_idx]) for worker_idx, crop_idxs in crop_idxs_per_worker.items()]
+        hands_per_crop = [[] for _ in cropped_images_rgb]
+        for crop_idxs, worker_hands_per_crop in zip(crop_idxs_per_worker.values(), self.receive(request_ids, HAND_GESTURE_REQUEST, timeout)):
+            for crop_idx, hands in zip(crop_idxs, worker_hands_per_crop):
+                hands_per_crop[crop_idx] = hands
+        return hands_per_crop
+
+    def forget_hands_contexts(self, track_ids: list[typing.Hashable]):
+        """Tells the workers tracking the hands of people who left to close their Hands instances, without waiting for an answer."""
+        track_ids_per_worker: dict[int, list[typing.Hashable]] = {}
+        for track_id in track_ids:
+            track_ids_per_worker.setdefault(self.worker_queue_idx(track_id) if self.worker_queues else -1, []).append(track_id)
+        for worker_idx, worker_track_ids in track_ids_per_worker.items():
+            self.send(FORGET_HANDS_REQUEST, worker_track_ids, self.worker_queues[worker_idx] if worker_idx >= 0 else None, expect_response=False)
+        return
+
+
+class InferenceService:
+    """A pool of worker processes, each holding one set of models, that serves detection and hand gesture requests from any number of cameras. The number of workers is
+    independent of the number of cameras, so memory scales with the workers, and adding a camera only adds an InferenceClient instead of another full model load.
+
+    Usage:
+        service = InferenceService(model_path, num_workers=2)
+        clients = [service.create_client(camera_idx) for camera_idx in camera_idxs]
+        service.start()"""
+
+    def __init__(self, model_path: str, use_edge_tpu: bool = False, num_workers: int = 1, keypoint_classifier_path: typing.Union[str, None] = None,
+                 max_batch_size: int = 1, batch_window: float = 0.005, hands_tracking: bool = True, max_hands_contexts: int = 8):
+        """
+        Parameters:
+        - model_path (str): The file path to the TensorFlow Lite detection model.
+        - use_edge_tpu (bool): A flag for creating interpreters that use an edgeTPU to perfrom computations.
+        - num_workers (int): The number of worker processes serving requests.
+        - keypoint_classifier_path (typing.Union[str, None]): The path to the tflite model used to classify hand gestures. If None, the workers only serve detection requests.
+        - max_batch_size (int): The maximum number of frames a worker stacks into a single invoke. Batching is only used if the model supports a batch dimension larger than 1.
+        - batch_window (float): The number of seconds a worker waits after the first frame of a batch for frames from other cameras.
+        - hands_tracking (bool): Give every person a MediaPipe Hands instance of their own in video mode, on the worker their hand requests are routed to, instead of one
+        shared instance in static image mode.
+        - max_hands_contexts (int): The most Hands instances each worker keeps open at once when tracking hands."""
+
+        self.config = {'model_path': model_path, 'use_edge_tpu': use_edge_tpu, 'keypoint_classifier_path': keypoint_classifier_path,
+                       'max_batch_size': max_batch_size, 'batch_window': batch_window, 'hands_tracking': hands_tracking, 'max_hands_contexts': max_hands_contexts}
+        self.num_workers = num_workers
+        self.request_queue = multiprocessing.Queue()
+        self.worker_queues = [multiprocessing.Queue() for _ in range(num_workers)] if num_workers > 1 else []
+        self.ready_queue = multiprocessing.Queue()
+        self.clients: dict[int, InferenceClient] = {}
+        self.worker_processes: list[multiprocessing.Process] = []
+        self.model_details: dict[str, typing.Union[int, bool]] = {}
+        return
+
+    def create_client(self, client_id: int)->InferenceClient:
+        """Creates the client a camera submits its requests with. Must be called before the service is started, as the workers are given every client's response queue
+        when they are spawned.
+
+        Parameters:
+        - client_id (int): A unique id for the client, such as the camera index."""
+
+        if self.worker_processes:
+            raise RuntimeError('Clients must be created before the InferenceService is started')
+        if client_id in self.clients:
+            raise ValueError(f'A client with id {client_id} already exists')
+        client = InferenceClient(client_id, self.request_queue, multiprocessing.Queue(), self.worker_queues, self.config['hands_tracking'])
+        self.clients[client_id] = client
+        return client
+
+    def start(self, timeout: float = 120.0):
+        """Spawns the worker processes and waits until every worker has loaded its models.
+
+        Parameters:
+        - timeout (float): The maximum number of seconds to wait for a worker to load its models."""
+
+        response_queues = {client_id: client.response_queue for client_id, client in self.clients.items()}
+        for worker_idx in range(self.num_workers):
+            worker_queue = self.worker_queues[worker_idx] if self.worker_queues else None
+            process = multiprocessing.Process(target=run_inference_worker, args=(self.config, self.request_queue, worker_queue, response_queues, self.ready_queue),
+                                              daemon=True)
+            process.start()
+            self.worker_processes.append(process)
+        for _ in range(self.num_workers):
+            self.model_details = self.ready_queue.get(timeout=timeout)
+        for client in self.clients.values():
+            client.model_details = self.model_details
+        return self
+
+    def stop(self):
+        """Signals every worker to exit and waits for them."""
+        for _ in self.worker_processes:
+            self.request_queue.put(None)
+        for process in self.worker_processes:
+            process.join(timeout=5)
+        self.worker_processes = []
+        return
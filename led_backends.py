@@ -0,0 +1,143 @@
+import time
+import typing
+import numpy as np
+
+NEOPIXEL_BACKEND: str = 'neopixel'
+SIMULATED_BACKEND: str = 'simulated'
+
+WS2812_BIT_RATE: int = 800000
+WS2812_RESET_TIME: float = 300e-6
+
+
+class SimulatedNeoPixel:
+    """A software stand-in for neopixel.NeoPixel that records every write instead of driving a strip, so the LED server can be imported, run, and benchmarked off a
+    Raspberry Pi. It supports the parts of the NeoPixel interface LEDPanels uses: item and slice assignment of packed 0xRRGGBB ints or (r, g, b) tuples, fill(), and
+    show().
+
+    The time show() takes on the real strip is modeled after WS2812 timing. The strip has no addressing, every show() shifts all the pixels out at 800 kHz, 24 bits
+    each, followed by the reset time that latches the colors, no matter how many pixels changed. With realtime set, show() also blocks for that long like the real
+    driver does, so the latency measured through the server is the one the Pi would see.
+
+    Attributes:
+    - pixels (np.ndarray): (n, 3) uint8 array of the colors assigned to every pixel.
+    - shown_pixels (np.ndarray): (n, 3) uint8 array of the colors on the strip as of the last show().
+    - assignments (int): The number of item and slice assignments.
+    - pixels_assigned (int): The number of pixels set by those assignments.
+    - shows (int): The number of times the strip was written.
+    - transmitted_pixels (int): The number of pixels shifted out to the strip, n for every show().
+    - transfer_time (float): The total number of seconds the strip writes would have taken."""
+
+    def __init__(self, pin: typing.Any = None, n: int = 800, brightness: float = 1, auto_write: bool = True, bpp: int = 3, bit_rate: int = WS2812_BIT_RATE,
+                 reset_time: float = WS2812_RESET_TIME, realtime: bool = False):
+        """
+        Parameters:
+        - pin (typing.Any): The board pin of the strip, only kept for reference.
+        - n (int): The number of pixels of the strip.
+        - brightness (float): The brightness (0.00-1.00) of the strip.
+        - auto_write (bool): True to write the strip on every assignment, like the NeoPixel default.
+        - bpp (int): The number of bytes per pixel, 3 for RGB strips.
+        - bit_rate (int): The number of bits shifted out to the strip per second.
+        - reset_time (float): The number of seconds the data line is held low after every write to latch the colors.
+        - realtime (bool): True to block in show() for the modeled transfer time."""
+
+        self.pin = pin
+        self.n = n
+        self.brightness = brightness
+        self.auto_write = auto_write
+        self.bpp = bpp
+        self.bit_rate = bit_rate
+        self.reset_time = reset_time
+        self.realtime = realtime
+        self.pixels = np.zeros((n, 3), dtype=np.uint8)
+        self.shown_pixels = np.zeros((n, 3), dtype=np.uint8)
+        self.assignments: int = 0
+        self.pixels_assigned: int = 0
+        self.shows: int = 0
+        self.transmitted_pixels: int = 0
+        self.transfer_time: float = 0.0
+        return
+
+    @property
+    def frame_transfer_time(self)->float:
+        """The number of seconds a single write of the whole strip takes."""
+        return self.n * 8 * self.bpp / self.bit_rate + self.reset_time
+
+    def __len__(self)->int:
+        return self.n
+
+    def __getitem__(self, index: typing.Union[int, slice])->typing.Union[tuple[int, int, int], list[tuple[int, int, int]]]:
+        if isinstance(index, slice):
+            return [tuple(color) for color in self.pixels[index].tolist()]
+        return tuple(self.pixels[index].tolist())
+
+    def __setitem__(self, index: typing.Union[int, slice], color: typing.Union[int, tuple[int, int, int], list]):
+        if isinstance(index, slice):
+            colors = self.to_rgb(color)
+            if len(colors) != len(range(*index.indices(self.n))):
+                raise ValueError('The number of colors does not match the number of pixels of the slice')
+            self.pixels[index] = colors
+            self.pixels_assigned += len(colors)
+        else:
+            self.pixels[index] = self.to_rgb([color])[0]
+            self.pixels_assigned += 1
+        self.assignments += 1
+        if self.auto_write:
+            self.show()
+        return
+
+    @staticmethod
+    def to_rgb(colors: list)->np.ndarray:
+        """Converts a list of packed 0xRRGGBB ints or (r, g, b) tuples to a (len(colors), 3) uint8 array."""
+        if len(colors) and isinstance(colors[0], (int, np.integer)):
+            packed_colors = np.asarray(colors, dtype=np.uint32)
+            return np.stack([(packed_colors >> 16) & 255, (packed_colors >> 8) & 255, packed_colors & 255], axis=1).astype(np.uint8)
+        return np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+
+    def fill(self, color: typing.Union[int, tuple[int, int, int]]):
+        self.pixels[:] = self.to_rgb([color])[0]
+        self.pixels_assigned += self.n
+        self.assignments += 1
+        if self.auto_write:
+            self.show()
+        return
+
+    def show(self):
+        """Writes every pixel to the simulated strip, blocking for the transfer time if realtime is set."""
+        transfer_time = self.frame_transfer_time
+        if self.realtime:
+            time.sleep(transfer_time)
+        self.shown_pixels[:] = self.pixels
+        self.shows += 1
+        self.transmitted_pixels += self.n
+        self.transfer_time += transfer_time
+        return
+
+    def deinit(self):
+        return
+
+    def get_stats(self)->dict[str, typing.Union[int, float]]:
+        """Returns the number of assignments, pixels assigned, writes of the strip, pixels transmitted, and the modeled transfer time in milliseconds."""
+        return {'assignments': self.assignments, 'pixels_assigned': self.pixels_assigned, 'shows': self.shows, 'transmitted_pixels': self.transmitted_pixels,
+                'transfer_time_ms': 1000 * self.transfer_time}
+
+
+def create_pixels(backend: typing.Union[str, SimulatedNeoPixel], board_pin: typing.Any, num_of_leds: int, brightness: float = 1, auto_write: bool = False)->typing.Any:
+    """Creates the pixel backend LEDPanels writes to. The neopixel module is only imported when the NeoPixel backend is chosen, since it only exists on the Raspberry Pi.
+
+    Parameters:
+    - backend (typing.Union[str, SimulatedNeoPixel]): NEOPIXEL_BACKEND, SIMULATED_BACKEND, or an already created backend, which is returned as is.
+    - board_pin (typing.Any): The board pin driving the strip, such as board.D18.
+    - num_of_leds (int): The number of LEDs of the strip.
+    - brightness (float): The brightness (0.00-1.00) of the strip.
+    - auto_write (bool): True to write the strip on every assignment."""
+
+    if backend == NEOPIXEL_BACKEND:
+        import neopixel
+        return neopixel.NeoPixel(board_pin, num_of_leds, brightness=brightness, auto_write=auto_write)
+    if backend == SIMULATED_BACKEND:
+        return SimulatedNeoPixel(board_pin, num_of_leds, brightness=brightness, auto_write=auto_write)
+    if isinstance(backend, str):
+        raise ValueError(f'Unknown pixel backend {backend}')
+    if len(backend) != num_of_leds:
+        raise ValueError(f'The pixel backend has {len(backend)} LEDs, but {num_of_leds} were requested')
+    return backend
@@ -1,8 +1,22 @@
 import time
-import board
-import neopixel
-import pickle
 import typing
+import contextlib
+import functools
+import numpy as np
+from lit_protocol import ManualLEDPacket, AutoLEDPacket
+from led_topology import LEDTopology
+from led_backends import NEOPIXEL_BACKEND, SIMULATED_BACKEND, SimulatedNeoPixel, create_pixels
+from utils import IntervalSet
+
+
+def renders_frame(method: typing.Callable)->typing.Callable:
+    """Decorates a method of LEDPanels that changes LEDs, so the changes are only composed into the frame buffer and the strip is written once the outermost decorated
+    call returns. A packet that turns off ranges and lights several people is shown with a single write instead of one per range and panel."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.frame_update():
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 class LEDPanels:
@@ -14,7 +28,13 @@ class LEDPanels:
     - manual_mode_status (bool): Enables/Disables the ability to update the LEDs with user interference such as calling led update methods, or using the GUI in LUIGui Module.
     - manual_brightness (float): Sets the class brightness for any LED that is being manually controlled.
     - manual_led_ranges (list[tuple]): The current list of LED ranges the user is manually turning on in the LITGui Module.
-    - manual_led_with_sliders (tuple): The current range of LEDs the user is manually turning on with the LED slider in the LITGui Module."""
+    - manual_led_with_sliders (tuple): The current range of LEDs the user is manually turning on with the LED slider in the LITGui Module.
+    - board_pixels (typing.Any): The pixel backend written to, a neopixel.NeoPixel on the Raspberry Pi or a SimulatedNeoPixel anywhere else.
+    - topology (LEDTopology): The panels of the subsystem, mapping every logical LED range to the pixels showing it on every panel.
+    - frame_buffer (np.ndarray): (num_of_leds, 3) uint8 array of the RGB color of every pixel, written to the strip by show().
+    - rendered_frame (typing.Union[np.ndarray, None]): The frame last written to the strip, None until the first write.
+    - frames_shown (int): The number of times the frame buffer was written to the strip.
+    - frames_skipped (int): The number of times show() found nothing changed and skipped writing to the strip."""
 
     auto_mode_status: bool = False
     manual_mode_status: bool = False
@@ -22,12 +42,102 @@ class LEDPanels:
     manual_led_ranges: list[tuple] = [(0, 0)]
     manual_led_with_sliders: tuple = (0, 0)
 
-    def __init__(self, board_pin: board, num_of_leds: int = 800, brightness: float = 1):
-        """Using a board pin, this initializes the current class and an instance of the NeoPixel class."""
-        self.board_pixels = neopixel.NeoPixel(board_pin, num_of_leds, brightness=brightness)
+    def __init__(self, board_pin: typing.Any, num_of_leds: int = 800, brightness: float = 1, topology: typing.Union[LEDTopology, None] = None,
+                 backend: typing.Union[str, SimulatedNeoPixel] = NEOPIXEL_BACKEND):
+        """Using a board pin, this initializes the current class and an instance of the NeoPixel class. The NeoPixel does not write to the strip on every assignment,
+        changes are composed into the frame buffer and written at once by show(). If no topology is provided, LEDTopology.default() is used.
+
+        Parameters:
+        - board_pin (typing.Any): The board pin driving the strip, such as board.D18. Unused by the simulated backend, None can be passed.
+        - num_of_leds (int): The number of LEDs of the strip.
+        - brightness (float): The brightness (0.00-1.00) of the strip.
+        - topology (typing.Union[LEDTopology, None]): The panels of the subsystem.
+        - backend (typing.Union[str, SimulatedNeoPixel]): NEOPIXEL_BACKEND to drive the strip, SIMULATED_BACKEND to record the writes in a SimulatedNeoPixel instead,
+        or an already created SimulatedNeoPixel."""
+        self.topology = topology if topology is not None else LEDTopology.default()
+        if self.topology.num_of_leds > num_of_leds:
+            raise ValueError(f'The panels of the topology need {self.topology.num_of_leds} LEDs, but the strip only has {num_of_leds}')
+        self.num_of_leds = num_of_leds
+        self.board_pixels = create_pixels(backend, board_pin, num_of_leds, brightness=brightness, auto_write=False)
+        self.frame_buffer = np.zeros((num_of_leds, 3), dtype=np.uint8)
+        self.rendered_frame: typing.Union[np.ndarray, None] = None
+        self.frame_update_depth: int = 0
+        self.frames_shown: int = 0
+        self.frames_skipped: int = 0
+        self.written_pixels: int = 0
+        self.skipped_pixels: int = 0
+        self.stats_window_start: float = time.perf_counter()
+        self.stats_window_written: int = 0
+        self.stats_window_skipped: int = 0
+        self.written_pixels_per_second: float = 0.0
+        self.skipped_pixels_per_second: float = 0.0
+        return
+
+    @contextlib.contextmanager
+    def frame_update(self):
+        """Context manager grouping LED changes into a single write to the strip, made when the outermost frame_update exits."""
+        self.frame_update_depth += 1
+        try:
+            yield self.frame_buffer
+        finally:
+            self.frame_update_depth -= 1
+            if self.frame_update_depth == 0:
+                self.show()
         return
 
+    def fill_range(self, first_led: int, last_led: int, color: tuple[int, int, int]):
+        """Sets the logical LEDs from first_led up to, not including, last_led to the color provided on every panel of the frame buffer."""
+        if last_led > first_led:
+            self.frame_buffer[self.topology.pixel_indices(first_led, last_led)] = color
+        return
 
+    def show(self):
+        """Writes the pixels of the frame buffer that changed since the last write to the strip, then calls show() once. The client resends its full state every
+        detection frame, so when nothing changed the write to the strip is skipped entirely."""
+        if self.rendered_frame is None:
+            changed_pixels = np.arange(self.num_of_leds)
+        else:
+            changed_pixels = np.flatnonzero(np.any(self.frame_buffer != self.rendered_frame, axis=1))
+        self.record_render_stats(len(changed_pixels))
+        if not len(changed_pixels):
+            self.frames_skipped += 1
+            return
+        packed_colors = (self.frame_buffer[:, 0].astype(np.uint32) << 16) | (self.frame_buffer[:, 1].astype(np.uint32) << 8) | self.frame_buffer[:, 2]
+        # Assign each run of consecutive changed pixels with a single slice
+        run_breaks = np.flatnonzero(np.diff(changed_pixels) != 1)
+        run_starts = np.concatenate(([changed_pixels[0]], changed_pixels[run_breaks + 1]))
+        run_ends = np.concatenate((changed_pixels[run_breaks], [changed_pixels[-1]])) + 1
+        for run_start, run_end in zip(run_starts.tolist(), run_ends.tolist()):
+            self.board_pixels[run_start:run_end] = packed_colors[run_start:run_end].tolist()
+        self.board_pixels.show()
+        self.rendered_frame = self.frame_buffer.copy()
+        self.frames_shown += 1
+        return
+
+    def record_render_stats(self, written_pixels: int):
+        """Adds the pixels written and skipped by a call to show() to the totals and to the current one second window of the per second rates."""
+        skipped_pixels = self.num_of_leds - written_pixels
+        self.written_pixels += written_pixels
+        self.skipped_pixels += skipped_pixels
+        self.stats_window_written += written_pixels
+        self.stats_window_skipped += skipped_pixels
+        elapsed = time.perf_counter() - self.stats_window_start
+        if elapsed >= 1:
+            self.written_pixels_per_second = self.stats_window_written / elapsed
+            self.skipped_pixels_per_second = self.stats_window_skipped / elapsed
+            self.stats_window_start += elapsed
+            self.stats_window_written = 0
+            self.stats_window_skipped = 0
+        return
+
+    def get_render_stats(self)->dict[str, typing.Union[int, float]]:
+        """Returns the number of frames written to and skipped for the strip, the total pixels written and skipped, and the pixels written and skipped per second over
+        the last full second."""
+        return {'frames_shown': self.frames_shown, 'frames_skipped': self.frames_skipped, 'written_pixels': self.written_pixels, 'skipped_pixels': self.skipped_pixels,
+                'written_pixels_per_second': self.written_pixels_per_second, 'skipped_pixels_per_second': self.skipped_pixels_per_second}
+
+
+    @renders_frame
     def auto_turn_off_led_ranges(self, turn_off_tuple_list: list[tuple], manual_event = False):
         """Turn off all ranges in the provided turn_off_tuple_list, this will ignore leds that are currently set to be turned on manually if the manual mode is enabled.
         This will update the LEDs in the same column amongst all of the panels.
@@ -44,23 +154,11 @@ class LEDPanels:
                     continue
             
 
-            first_led = turn_off_range[0] 
-            last_led = turn_off_range[-1] 
-
-            first_led_mid_panel = 512 - last_led 
-            last_led_mid_panel = 512 - first_led
-
-            first_led_last_panel = first_led + 511
-            last_led_last_panel = last_led + 512
-
-            self.board_pixels[first_led: last_led] = [(0,0,0)] * (last_led-first_led)
-
-            self.board_pixels[first_led_mid_panel: last_led_mid_panel] = [(0,0,0)] * (last_led_mid_panel-first_led_mid_panel)
-
-            self.board_pixels[first_led_last_panel: last_led_last_panel] = [(0,0,0)] * (last_led_last_panel-first_led_last_panel)
+            self.fill_range(turn_off_range[0], turn_off_range[-1], (0,0,0))
         return
 
 
+    @renders_frame
     def auto_update_leds(self, objs_detect_stats_list_of_dicts: list[dict]):
         """Used as part of the Object Detection Model Subsystem, where this method will update the status of any LED that is not apart of the manually selected LEDs if manual status is enabled, using the data from the Object Detection Model.
         
@@ -76,6 +174,7 @@ class LEDPanels:
             self.update_current_auto_detect_led_tuple_ranges(led_dict)
         return
 
+    @renders_frame
     def turn_on_manual_range(self, manual_led_tuple: tuple[int, int]):
         """Used to manually specify LED Ranges to turn on, called from GUI events, or can be called as a standalone method.
         
@@ -83,16 +182,10 @@ class LEDPanels:
         - manual_led_tuple (tuple[int, int]): A range of LEDs to turn on at the brightness stored in the manual brightness attribute."""
         if not manual_led_tuple:
             return
-        leds_tuple_mid_panel = (512-manual_led_tuple[1], 512-manual_led_tuple[0])
-        leds_tuple_top_panel = (manual_led_tuple[0]+512, manual_led_tuple[1]+512)
-        
-        self.board_pixels[manual_led_tuple[0]:manual_led_tuple[1]] = [(0,0,round(255*self.manual_brightness))] * (manual_led_tuple[1]-manual_led_tuple[0])
-
-        self.board_pixels[leds_tuple_mid_panel[0]:leds_tuple_mid_panel[1]] = [(0,0,round(255*self.manual_brightness))] * (leds_tuple_mid_panel[1]-leds_tuple_mid_panel[0])
-
-        self.board_pixels[leds_tuple_top_panel[0]:leds_tuple_top_panel[1]] = [(0,0,round(255*self.manual_brightness))] * (leds_tuple_top_panel[1]-leds_tuple_top_panel[0])
+        self.fill_range(manual_led_tuple[0], manual_led_tuple[1], (0,0,round(255*self.manual_brightness)))
         return
     
+    @renders_frame
     def update_current_auto_detect_led_tuple_ranges(self, led_dict: dict[float, tuple[int, int]]):
         """Updates the current LED range provided in the dict with the brightness provided. This will update all leds in the specified column (range).
         
@@ -103,16 +196,10 @@ class LEDPanels:
 
         brightness = float(led_dict['brightness'])
         leds_tuple = led_dict['led_tuple']
-        leds_tuple_mid_panel = (512-leds_tuple[1], 512-leds_tuple[0])
-        leds_tuple_top_panel = (leds_tuple[0]+512, leds_tuple[1]+512)
-        
-        self.board_pixels[leds_tuple[0]:leds_tuple[1]] = [(0,0,round(255*brightness))] * (leds_tuple[1]-leds_tuple[0])
-
-        self.board_pixels[leds_tuple_mid_panel[0]:leds_tuple_mid_panel[1]] = [(0,0,round(255*brightness))] * (leds_tuple_mid_panel[1]-leds_tuple_mid_panel[0])
-
-        self.board_pixels[leds_tuple_top_panel[0]:leds_tuple_top_panel[1]] = [(0,0,round(255*brightness))] * (leds_tuple_top_panel[1]-leds_tuple_top_panel[0])
+        self.fill_range(leds_tuple[0], leds_tuple[1], (0,0,round(255*brightness)))
         return
     
+    @renders_frame
     def manual_brightness_adjust_of_manual_ranges(self):
         """Used when the brightness is manually adjusted, this method iterates over all ranges over currently manually controlled LEDs and updates their brightnesses."""
         if self.manual_led_ranges:
@@ -124,28 +211,27 @@ class LEDPanels:
         return
 
 
-    def update_leds_from_data_packets(self, data: list):
-        """Used to update LEDs from a server connection, first the data is assumed to be pickled and therefore must be unpickled. This handles packets received from the ObjectDetectionModel or the LITGui Modules.
+    @renders_frame
+    def update_leds_from_data_packets(self, packet: typing.Union[ManualLEDPacket, AutoLEDPacket]):
+        """Used to update LEDs from a server connection. This handles the packets decoded by the server from the frames sent by the ObjectDetectionModel or the LITGui Modules.
         
         Parameters:
-        - data: UPDATE"""
+        - packet (typing.Union[ManualLEDPacket, AutoLEDPacket]): A MANUAL packet with the LED ranges to turn on at a single brightness, or an AUTO packet with the LED range and
+        brightness of every person detected. Both carry the LED ranges to turn off, which the client has already cleared of any range that has to stay on."""
 
-        try:
-            detect_obj = pickle.loads(data)
-        except:
-            detect_obj = data
-        try:
-            if detect_obj[0] == 'AUTO_LED_DATA':
-                if detect_obj[1]:
-                    self.auto_update_leds(detect_obj[1])
-                if detect_obj[2]:
-                    self.auto_turn_off_led_ranges(detect_obj[2])
-            elif detect_obj[0] == 'UPDATE_AUTO_STATUS':
-                self.update_auto_mode_status(detect_obj[1])
-            elif detect_obj[0] == 'MANUAL':
-                self.handle_manual_mode_event(detect_obj)
-        except:
-            pass
+        if isinstance(packet, AutoLEDPacket):
+            for led_range, brightness in packet.led_data:
+                self.update_current_auto_detect_led_tuple_ranges({'led_tuple': led_range, 'brightness': brightness})
+        elif isinstance(packet, ManualLEDPacket):
+            self.manual_brightness = packet.brightness
+            self.manual_led_ranges = list(packet.led_ranges)
+            for led_range in packet.led_ranges:
+                self.turn_on_manual_range(led_range)
+        else:
+            return
+        if packet.turn_off_ranges:
+            self.auto_turn_off_led_ranges(packet.turn_off_ranges, True)
+        return
 
     def range_is_in_manual_mode_section(self, turn_off_range: tuple[int, int])->bool:
         """Check if a range to be updated automatically is currently being controlled by one of the manually settings.
@@ -153,20 +239,9 @@ class LEDPanels:
         Parameters:
         - turn_off_range (tuple[int, int]): The range of leds to change the status of represented as a tuple of the start and stop points."""
 
-        if self.manual_led_ranges and self.manual_led_with_sliders:
-            if any(is_overlap(turn_off_range, led_range) for led_range in self.manual_led_ranges) or is_overlap(turn_off_range, self.manual_led_with_sliders):
-                return True
-            return False
-        elif self.manual_led_ranges:
-            if any(is_overlap(turn_off_range, led_range) for led_range in self.manual_led_ranges):
-                return True
-            return False
-        elif self.manual_led_with_sliders:
-            if is_overlap(turn_off_range, self.manual_led_with_sliders):
-                return True
-            return False
-        return False
+        return IntervalSet.coerce(self.manual_led_ranges).union(self.manual_led_with_sliders).overlaps(turn_off_range)
     
+    @renders_frame
     def handle_manual_mode_event(self, detect_obj: list[str, str, typing.Union[tuple, float]]):
         """Handles an event in which the user would like to manually update the LEDs from either the LITGui Module, or using this method directly.
         
@@ -193,7 +268,7 @@ class LEDPanels:
             if not self.auto_mode_status:
                 if self.manual_led_with_sliders:
                     self.manual_led_ranges.append(self.manual_led_with_sliders)
-                turn_off_ranges = find_missing_numbers_as_ranges_tuples(self.manual_led_ranges)
+                turn_off_ranges = IntervalSet(self.manual_led_ranges).complement(0, self.topology.logical_size).to_list()
                 self.auto_turn_off_led_ranges(turn_off_ranges, True)
                 if self.manual_led_with_sliders:
                     self.manual_led_ranges.remove(self.manual_led_with_sliders)
@@ -202,54 +277,23 @@ class LEDPanels:
         self.auto_mode_status = auto_mode_status
         return
 
+    @renders_frame
     def handle_update_of_manual_mode_or_auto_mode_status(self):
         """If the LED panel has nothing provided control of the lights anymore, turn them all off."""
         if not self.manual_mode_status and not self.auto_mode_status:
-            self.auto_turn_off_led_ranges([(0, 255)], True)
+            self.auto_turn_off_led_ranges([(0, self.topology.logical_size)], True)
         elif not self.auto_mode_status:
             self.turn_on_manual_range(self.manual_led_with_sliders)
             for led_range in self.manual_led_ranges:
                 self.turn_on_manual_range(led_range)
                 if self.manual_led_with_sliders:
                     self.manual_led_ranges.append(self.manual_led_with_sliders)
-                turn_off_ranges = find_missing_numbers_as_ranges_tuples(self.manual_led_ranges)
+                turn_off_ranges = IntervalSet(self.manual_led_ranges).complement(0, self.topology.logical_size).to_list()
                 self.auto_turn_off_led_ranges(turn_off_ranges, True)
                 if self.manual_led_with_sliders:
                     self.manual_led_ranges.remove(self.manual_led_with_sliders)
         return
 
-def find_missing_numbers_as_ranges_tuples(ranges) -> list[tuple]:
-    # Initialize a set with all numbers from 0 to 256
-    all_numbers = set(range(257))
-    
-    # Remove the numbers present in the given ranges
-    for start, end in ranges:
-        all_numbers -= set(range(start, end + 1))
-    
-    # Convert the set to a sorted list
-    missing_numbers_sorted = sorted(list(all_numbers))
-    
-    # Group the consecutive numbers into ranges
-    missing_ranges = []
-    if missing_numbers_sorted:
-        # Initialize the first range with the first missing number
-        range_start = missing_numbers_sorted[0]
-        range_end = missing_numbers_sorted[0]
-        
-        for number in missing_numbers_sorted[1:]:
-            if number == range_end + 1:
-                # Extend the current range
-                range_end = number
-            else:
-                # Finish the current range and start a new one
-                missing_ranges.append((range_start, range_end))
-                range_start = number
-                range_end = number
-        
-        # Add the last range
-        missing_ranges.append((range_start, range_end))
-    
-    return missing_ranges
 def is_overlap(range1, range2):
     """Check if range1 overlaps with range2."""
     if (range1[0] < range2[1]) and (range1[1] > range2[0]):
@@ -0,0 +1,180 @@
+import bisect
+import typing
+import numpy as np
+
+
+class FovSectionIndex:
+    """Maps horizontal angles of detected objects to the LED section that illuminates them. The edges of the field of view sections are precomputed once, in ascending
+    order, so a lookup is a binary search (bisect for a single angle, np.searchsorted for an array of angles) instead of a linear scan. Sections do not need to be equally
+    wide, so denser LED sections near the center of the field of view cost nothing extra.
+
+    Section 0 covers the most positive angles. An angle lying on the edge between two sections maps to the lower section index, and angles
+    outside of the field of view map to no section."""
+
+    def __init__(self, angle_edges: typing.Union[list[float], np.ndarray], led_sections: list[tuple[int, int]]):
+        """
+        Parameters:
+        - angle_edges (typing.Union[list[float], np.ndarray]): The len(led_sections) + 1 edges of the field of view sections, in any order.
+        - led_sections (list[tuple[int, int]]): The LED range of every section, where section 0 covers the most positive angles."""
+
+        angle_edges = np.sort(np.asarray(angle_edges, dtype=np.float64))
+        if len(angle_edges) != len(led_sections) + 1:
+            raise ValueError(f'{len(led_sections)} LED sections need {len(led_sections) + 1} angle edges, got {len(angle_edges)}')
+        self.angle_edges = angle_edges
+        self.angle_edges_list: list[float] = angle_edges.tolist()
+        self.led_sections = list(led_sections)
+        self.number_of_sections = len(led_sections)
+        return
+
+    @classmethod
+    def uniform(cls, hfov: int, led_sections: list[tuple[int, int]])->'FovSectionIndex':
+        """Creates an index of equally wide sections spanning the field of view, from -round(hfov / 2) to round(hfov / 2) degrees.
+
+        Parameters:
+        - hfov (int): The horizontal field of view of the camera.
+        - led_sections (list[tuple[int, int]]): The LED range of every section."""
+
+        max_positive_fov = round(hfov / 2)
+        max_negative_fov = -max_positive_fov
+        number_of_sections = len(led_sections)
+        # Edges computed from the positive side down, as the original linear scan did, so angles on a section edge keep their section
+        return cls([max_positive_fov - x * (max_positive_fov - max_negative_fov) / number_of_sections for x in range(number_of_sections + 1)], led_sections)
+
+    @classmethod
+    def center_weighted(cls, hfov: int, led_sections: list[tuple[int, int]], center_weight: float = 2.0)->'FovSectionIndex':
+        """Creates an index whose sections get narrower towards the center of the field of view, so the LEDs follow a person more closely where they are usually standing.
+
+        Parameters:
+        - hfov (int): The horizontal field of view of the camera.
+        - led_sections (list[tuple[int, int]]): The LED range of every section.
+        - center_weight (float): How strongly sections are compressed towards the center. 1 gives equally wide sections."""
+
+        max_positive_fov = round(hfov / 2)
+        uniform_edges = np.linspace(-1, 1, len(led_sections) + 1)
+        return cls(max_positive_fov * np.sign(uniform_edges) * np.abs(uniform_edges) ** center_weight, led_sections)
+
+    def lookup_idxs(self, angles: typing.Union[np.ndarray, list[float]])->np.ndarray:
+        """Returns the section index of every angle, or -1 for angles outside of the field of view.
+
+        Parameters:
+        - angles (typing.Union[np.ndarray, list[float]]): The horizontal angles of the objects detected."""
+
+        angles = np.asarray(angles, dtype=np.float64)
+        insertion_idxs = np.searchsorted(self.angle_edges, angles, side='right')
+        insertion_idxs = np.where(angles == self.angle_edges[-1], self.number_of_sections, insertion_idxs)
+        valid = (insertion_idxs >= 1) & (insertion_idxs <= self.number_of_sections)
+        return np.where(valid, self.number_of_sections - insertion_idxs, -1)
+
+    def lookup_idx(self, angle: typing.Union[float, int])->int:
+        """Returns the section index of a single angle, or -1 if it is outside of the field of view."""
+        if angle == self.angle_edges_list[-1]:
+            return 0
+        insertion_idx = bisect.bisect_right(self.angle_edges_list, angle)
+        if insertion_idx < 1 or insertion_idx > self.number_of_sections:
+            return -1
+        return self.number_of_sections - insertion_idx
+
+    def lookup(self, angle: typing.Union[float, int])->typing.Union[tuple[int, int], None]:
+        """Returns the LED range illuminating an object at the angle provided, or None if it is outside of the field of view."""
+        section_idx = self.lookup_idx(angle)
+        if section_idx < 0:
+            return None
+        return self.led_sections[section_idx]
+
+
+def brightness_based_on_distance_array(distances: np.ndarray, minDist=0.01, maxDist=5.0, linear_slope=0.25, exponential_base=2)->np.ndarray:
+    """Returns the brightness (0.00-1.00) of every distance in meters provided: 0 up to minDist, growing linearly to linear_slope at half of maxDist, then exponentially
+    to full brightness at maxDist, rounded to two decimals."""
+    distances = np.asarray(distances, dtype=np.float64)
+    threshold = maxDist / 2
+    linear_brightness = np.minimum((distances - minDist) / (threshold - minDist) * linear_slope, linear_slope)
+    normalized_dist = np.clip((distances - threshold) / (maxDist - threshold), 0, 1)
+    exponential_brightness = linear_slope + (1 - linear_slope) * (normalized_dist ** exponential_base)
+    brightness = np.where(distances <= threshold, linear_brightness, exponential_brightness)
+    brightness = np.where(distances <= minDist, 0, np.where(distances >= maxDist, 1, np.round(brightness, 2)))
+    return brightness
+
+
+class BrightnessCurve:
+    """Maps the distance of a detected object to the brightness used to illuminate it. The curve is sampled once into a lookup table covering 0 to max_distance at a
+    fixed resolution, so evaluating the brightness of every detection in a frame is a single vectorized index instead of branching float math. Distances beyond
+    max_distance use the brightness at max_distance.
+
+    Any curve can be turned into a lookup table, so alternative curves such as inverse-square or piecewise-linear ones loaded from a config cost the same to evaluate."""
+
+    def __init__(self, curve_function: typing.Callable[[np.ndarray], np.ndarray], max_distance: float = 5.0, resolution: float = 0.001):
+        """
+        Parameters:
+        - curve_function (typing.Callable[[np.ndarray], np.ndarray]): Maps an array of distances in meters to brightnesses between 0.00 and 1.00.
+        - max_distance (float): The largest distance in meters covered by the lookup table.
+        - resolution (float): The distance in meters between two entries of the lookup table."""
+
+        if max_distance <= 0 or resolution <= 0:
+            raise ValueError('max_distance and resolution must be positive')
+        self.max_distance = max_distance
+        self.resolution = resolution
+        sample_distances = np.arange(int(round(max_distance / resolution)) + 1) * resolution
+        self.lookup_table = np.clip(np.asarray(curve_function(sample_distances), dtype=np.float64), 0, 1)
+        self.last_idx = len(self.lookup_table) - 1
+        return
+
+    @classmethod
+    def default(cls, minDist=0.01, maxDist=5.0, linear_slope=0.25, exponential_base=2, resolution: float = 0.001)->'BrightnessCurve':
+        """Creates the lookup table of brightness_based_on_distance_array: linear up to half of maxDist, then exponential up to full brightness at maxDist."""
+        return cls(lambda distances: brightness_based_on_distance_array(distances, minDist, maxDist, linear_slope, exponential_base), maxDist, resolution)
+
+    @classmethod
+    def inverse_square(cls, max_distance: float = 5.0, min_brightness: float = 0.0, resolution: float = 0.001)->'BrightnessCurve':
+        """Creates a curve compensating the inverse-square falloff of light, so a person is lit equally at any distance. The brightness grows with the square of the
+        distance, reaching full brightness at max_distance.
+
+        Parameters:
+        - max_distance (float): The distance in meters at which full brightness is reached.
+        - min_brightness (float): The lowest brightness used for people standing right in front of the LEDs."""
+
+        return cls(lambda distances: min_brightness + (1 - min_brightness) * (distances / max_distance) ** 2, max_distance, resolution)
+
+    @classmethod
+    def piecewise_linear(cls, points: list[tuple[float, float]], resolution: float = 0.001)->'BrightnessCurve':
+        """Creates a curve interpolating linearly between the (distance, brightness) points provided. Distances before the first point use its brightness, and the last
+        point sets max_distance.
+
+        Parameters:
+        - points (list[tuple[float, float]]): The distance in meters and brightness of every point of the curve."""
+
+        points = sorted(points)
+        if not points:
+            raise ValueError('A piecewise-linear brightness curve needs at least one point')
+        point_distances = [distance for distance, _ in points]
+        point_brightnesses = [brightness for _, brightness in points]
+        return cls(lambda distances: np.interp(distances, point_distances, point_brightnesses), max(point_distances[-1], resolution), resolution)
+
+    @classmethod
+    def from_config(cls, config: dict)->'BrightnessCurve':
+        """Creates a curve from a config dictionary, such as one loaded from a JSON file.
+
+        Example:
+            {"type": "piecewise_linear", "points": [[0.5, 0.1], [2.5, 0.4], [5.0, 1.0]], "resolution": 0.001}
+
+        Parameters:
+        - config (dict): The "type" of the curve ("default", "inverse_square", or "piecewise_linear"), and the keyword arguments of the matching classmethod."""
+
+        config = dict(config)
+        curve_type = config.pop('type', 'default')
+        if curve_type == 'default':
+            return cls.default(**config)
+        elif curve_type == 'inverse_square':
+            return cls.inverse_square(**config)
+        elif curve_type == 'piecewise_linear':
+            config['points'] = [tuple(point) for point in config['points']]
+            return cls.piecewise_linear(**config)
+        raise ValueError(f'Unknown brightness curve type {curve_type}')
+
+    def __call__(self, distances: typing.Union[np.ndarray, list[float], float])->np.ndarray:
+        """Returns the brightness of every distance in meters provided."""
+        idxs = np.rint(np.asarray(distances, dtype=np.float64) / self.resolution)
+        return self.lookup_table[np.clip(idxs, 0, self.last_idx).astype(np.intp)]
+
+    def brightness_for_distance(self, distance: float)->float:
+        """Returns the brightness of a single distance in meters."""
+        return float(self(distance))
@@ -0,0 +1,82 @@
+import typing
+import numpy as np
+
+
+class PanelSpec:
+    """Describes how a single NeoPixel panel is placed on the strip. The LEDs of a panel are addressed logically in column-major order, so logical index
+    column * height + row, and the same logical LED range lights the same columns on every panel.
+
+    Attributes:
+    - offset (int): The index on the strip of the first pixel of the panel.
+    - width (int): The number of columns of the panel.
+    - height (int): The number of rows of the panel.
+    - mirrored (bool): True if the panel is mounted rotated by 180 degrees, so logical column 0 is wired as the last column of the panel.
+    - serpentine (bool): True if every odd column is wired in reverse row order."""
+
+    def __init__(self, offset: int, width: int = 32, height: int = 8, mirrored: bool = False, serpentine: bool = False):
+        if offset < 0 or width <= 0 or height <= 0:
+            raise ValueError('A panel needs a non-negative offset and a positive width and height')
+        self.offset = offset
+        self.width = width
+        self.height = height
+        self.mirrored = mirrored
+        self.serpentine = serpentine
+        return
+
+    @property
+    def num_of_leds(self)->int:
+        return self.width * self.height
+
+    def pixel_indices(self)->np.ndarray:
+        """Returns the index on the strip of every logical LED of the panel."""
+        logical_idxs = np.arange(self.num_of_leds)
+        columns, rows = logical_idxs // self.height, logical_idxs % self.height
+        if self.mirrored:
+            columns, rows = self.width - 1 - columns, self.height - 1 - rows
+        if self.serpentine:
+            rows = np.where(columns % 2 == 1, self.height - 1 - rows, rows)
+        return self.offset + columns * self.height + rows
+
+    def __repr__(self)->str:
+        return f'PanelSpec(offset={self.offset}, width={self.width}, height={self.height}, mirrored={self.mirrored}, serpentine={self.serpentine})'
+
+
+class LEDTopology:
+    """The panels of a LED subsystem compiled into an index map from logical LEDs to pixels on the strip. Every logical LED range is shown on all panels at once, so
+    rendering a range is a single fancy-indexed write into the frame buffer no matter how many panels there are or how they are mounted.
+
+    Attributes:
+    - panels (list[PanelSpec]): The panels of the subsystem.
+    - logical_size (int): The number of logical LEDs, which is the number of LEDs of the smallest panel.
+    - num_of_leds (int): The number of pixels on the strip needed to reach the end of every panel.
+    - index_map (np.ndarray): (len(panels), logical_size) array of the strip index of every logical LED on every panel."""
+
+    def __init__(self, panels: list[PanelSpec]):
+        if not panels:
+            raise ValueError('A LED topology needs at least one panel')
+        self.panels = list(panels)
+        self.logical_size = min(panel.num_of_leds for panel in self.panels)
+        self.num_of_leds = max(panel.offset + panel.num_of_leds for panel in self.panels)
+        self.index_map = np.stack([panel.pixel_indices()[:self.logical_size] for panel in self.panels])
+        return
+
+    @classmethod
+    def default(cls)->'LEDTopology':
+        """The topology of the LIT subsystem: three 32x8 panels of 256 LEDs chained on a single strip, with the middle panel mounted rotated by 180 degrees."""
+        return cls([PanelSpec(0), PanelSpec(256, mirrored=True), PanelSpec(512)])
+
+    @classmethod
+    def from_config(cls, config: list[dict])->'LEDTopology':
+        """Creates a topology from a list of keyword arguments of PanelSpec, one per panel, such as one loaded from a JSON file.
+
+        Example:
+            [{"offset": 0}, {"offset": 256, "mirrored": true}, {"offset": 512, "width": 32, "height": 8}]"""
+        return cls([PanelSpec(**panel_config) for panel_config in config])
+
+    def pixel_indices(self, first_led: int, last_led: int)->np.ndarray:
+        """Returns the strip index of every pixel showing the logical LEDs from first_led up to, not including, last_led on any panel.
+
+        Parameters:
+        - first_led (int): The first logical LED of the range.
+        - last_led (int): The logical LED following the last one of the range."""
+        return self.index_map[:, max(0, first_led):min(last_led, self.logical_size)].ravel()
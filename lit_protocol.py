@@ -0,0 +1,298 @@
+"""The binary wire protocol spoken between the LIT GUI / ObjectDetectionModel clients and the LED subsystem servers.
+
+Every message is a frame made of a fixed size header followed by a payload:
+
+    header:  payload length (uint32), protocol version (uint8), message type (uint8)
+
+HELLO payload:   priority (uint8), name length (uint8), client name (utf-8), optionally followed by a session token (uint64)
+MANUAL payload:  brightness (uint8), number of ranges (uint16), (start, stop) uint16 pairs, number of turn off ranges (uint16), (start, stop) uint16 pairs
+AUTO payload:    sequence (uint32), timestamp (float64), number of ranges (uint16), (start, stop, brightness) as uint16, uint16, uint8,
+                 number of turn off ranges (uint16), (start, stop) uint16 pairs
+
+AUTO frames may also be sent as UDP datagrams, one frame per datagram, prefixed with the session token (uint64) the client sent in the HELLO of its TCP connection.
+The token ties the datagrams to that connection, so they share its name, priority and ownership of the panels and stop being accepted once it closes. Datagrams can
+be lost or reordered, so receivers use sequence_is_newer to discard any AUTO frame older than the last one they applied from the same sender.
+
+All fields are big-endian and brightnesses are quantized from 0.00-1.00 to 0-255, the resolution the LEDs are addressed with. The length prefix lets the receiver
+split a TCP byte stream back into messages no matter how the stream was coalesced or split by the network."""
+import functools
+import struct
+import typing
+
+PROTOCOL_VERSION: int = 1
+
+MSG_MANUAL: int = 0
+MSG_AUTO: int = 1
+MSG_HELLO: int = 2
+
+HEADER = struct.Struct('>IBB')
+AUTO_PREFIX = struct.Struct('>Id')
+RANGE_COUNT = struct.Struct('>H')
+SESSION_TOKEN = struct.Struct('>Q')
+MAX_PAYLOAD_SIZE: int = 1 << 20
+
+
+class ProtocolError(ValueError):
+    """Raised when a byte stream can no longer be split into frames, such as when a frame claims a payload larger than MAX_PAYLOAD_SIZE."""
+
+
+class ManualLEDPacket:
+    """The LED ranges turned on manually from the GUI at a single brightness, and the ranges to turn off."""
+
+    def __init__(self, led_ranges: list[tuple[int, int]], brightness: float, turn_off_ranges: list[tuple[int, int]]):
+        self.led_ranges = led_ranges
+        self.brightness = brightness
+        self.turn_off_ranges = turn_off_ranges
+        return
+
+    def __eq__(self, other)->bool:
+        return isinstance(other, ManualLEDPacket) and (self.led_ranges, self.brightness, self.turn_off_ranges) == (other.led_ranges, other.brightness, other.turn_off_ranges)
+
+    def __repr__(self)->str:
+        return f'ManualLEDPacket(led_ranges={self.led_ranges}, brightness={self.brightness}, turn_off_ranges={self.turn_off_ranges})'
+
+
+class AutoLEDPacket:
+    """The LED ranges and brightnesses illuminating the people detected in a single frame, and the ranges to turn off.
+
+    Attributes:
+    - sequence (int): Increases by one with every AUTO packet a client sends, so stale packets can be recognized.
+    - timestamp (float): The time the packet was created, as returned by time.time().
+    - led_data (list[tuple[tuple[int, int], float]]): The LED range and brightness of every person detected.
+    - turn_off_ranges (list[tuple[int, int]]): The LED ranges to turn off."""
+
+    def __init__(self, sequence: int, timestamp: float, led_data: list[tuple[tuple[int, int], float]], turn_off_ranges: list[tuple[int, int]]):
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.led_data = led_data
+        self.turn_off_ranges = turn_off_ranges
+        return
+
+    def __eq__(self, other)->bool:
+        return isinstance(other, AutoLEDPacket) and (self.sequence, self.timestamp, self.led_data, self.turn_off_ranges) == (other.sequence, other.timestamp,
+                                                                                                                                 other.led_data, other.turn_off_ranges)
+
+    def __repr__(self)->str:
+        return f'AutoLEDPacket(sequence={self.sequence}, timestamp={self.timestamp}, led_data={self.led_data}, turn_off_ranges={self.turn_off_ranges})'
+
+
+class HelloPacket:
+    """Sent by a client once after connecting to name itself and set the priority its packets are applied with, when several clients address the same panels. A
+    non-zero session_token lets the client send AUTO frames as datagrams on behalf of the connection."""
+
+    def __init__(self, client_name: str, priority: int = 0, session_token: int = 0):
+        self.client_name = client_name
+        self.priority = priority
+        self.session_token = session_token
+        return
+
+    def __eq__(self, other)->bool:
+        return isinstance(other, HelloPacket) and (self.client_name, self.priority, self.session_token) == (other.client_name, other.priority, other.session_token)
+
+    def __repr__(self)->str:
+        return f'HelloPacket(client_name={self.client_name!r}, priority={self.priority}, session_token={self.session_token})'
+
+
+def normalize_ranges(ranges: typing.Union[list[tuple[int, int]], tuple[int, int], None])->list[tuple[int, int]]:
+    """Returns the ranges provided as a list of tuples. A single (start, stop) tuple is wrapped in a list and None becomes an empty list."""
+    if not ranges:
+        return []
+    if isinstance(ranges, tuple) and len(ranges) == 2 and isinstance(ranges[0], int):
+        return [ranges]
+    return list(ranges)
+
+
+def quantize_brightness(brightness: float)->int:
+    """Converts a brightness between 0.00 and 1.00 to the 0-255 value sent over the wire."""
+    return min(255, max(0, round(255 * float(brightness))))
+
+
+@functools.lru_cache(maxsize=None)
+def ranges_struct(count: int)->struct.Struct:
+    """Returns the Struct of a range count followed by count (start, stop) uint16 pairs."""
+    return struct.Struct(f'>H{2 * count}H')
+
+
+@functools.lru_cache(maxsize=None)
+def auto_struct(count: int)->struct.Struct:
+    """Returns the Struct of the AUTO prefix, the number of people, and count (start, stop, brightness) entries."""
+    return struct.Struct(f'>IdH{"HHB" * count}')
+
+
+def pack_ranges(ranges: list[tuple[int, int]])->bytes:
+    """Packs a list of ranges as their count followed by (start, stop) uint16 pairs."""
+    return ranges_struct(len(ranges)).pack(len(ranges), *[value for led_range in ranges for value in led_range])
+
+
+def frame_payload(message_type: int, payload: bytes)->bytes:
+    """Prepends the header to a payload."""
+    return HEADER.pack(len(payload), PROTOCOL_VERSION, message_type) + payload
+
+
+def encode_manual(led_ranges: typing.Union[list[tuple[int, int]], tuple[int, int], None], brightness: float,
+                  turn_off_ranges: typing.Union[list[tuple[int, int]], tuple[int, int], None])->bytes:
+    """Encodes a MANUAL frame.
+
+    Parameters:
+    - led_ranges (typing.Union[list[tuple[int, int]], tuple[int, int], None]): The LED ranges to turn on.
+    - brightness (float): The brightness (0.00-1.00) of every range turned on.
+    - turn_off_ranges (typing.Union[list[tuple[int, int]], tuple[int, int], None]): The LED ranges to turn off."""
+
+    payload = bytes((quantize_brightness(brightness),)) + pack_ranges(normalize_ranges(led_ranges)) + pack_ranges(normalize_ranges(turn_off_ranges))
+    return frame_payload(MSG_MANUAL, payload)
+
+
+def encode_auto(sequence: int, timestamp: float, led_data: list[tuple[tuple[int, int], float]],
+                turn_off_ranges: typing.Union[list[tuple[int, int]], tuple[int, int], None])->bytes:
+    """Encodes an AUTO frame.
+
+    Parameters:
+    - sequence (int): The sequence number of the packet, wrapped to 32 bits.
+    - timestamp (float): The time the packet was created.
+    - led_data (list[tuple[tuple[int, int], float]]): The LED range and brightness of every person detected.
+    - turn_off_ranges (typing.Union[list[tuple[int, int]], tuple[int, int], None]): The LED ranges to turn off."""
+
+    led_values = [value for (start, stop), brightness in led_data for value in (start, stop, quantize_brightness(brightness))]
+    payload = auto_struct(len(led_data)).pack(sequence & 0xFFFFFFFF, timestamp, len(led_data), *led_values) + pack_ranges(normalize_ranges(turn_off_ranges))
+    return frame_payload(MSG_AUTO, payload)
+
+
+def encode_hello(client_name: str, priority: int = 0, session_token: int = 0)->bytes:
+    """Encodes a HELLO frame.
+
+    Parameters:
+    - client_name (str): The name the server reports the client under, truncated to 255 bytes.
+    - priority (int): The priority (0-255) of the client's packets, higher priorities take over the panels from lower ones.
+    - session_token (int): The token (uint64) the client prefixes its datagrams with, 0 if it does not send any."""
+
+    name = client_name.encode('utf-8')[:255]
+    payload = bytes((min(255, max(0, priority)), len(name))) + name
+    if session_token:
+        payload += SESSION_TOKEN.pack(session_token)
+    return frame_payload(MSG_HELLO, payload)
+
+
+def encode_datagram(session_token: int, frame: bytes)->bytes:
+    """Prefixes a frame with the session token of the connection it is sent on behalf of, forming a datagram.
+
+    Parameters:
+    - session_token (int): The token the client sent in the HELLO of its TCP connection.
+    - frame (bytes): A single encoded frame."""
+
+    return SESSION_TOKEN.pack(session_token) + frame
+
+
+def encode_packet(packet: typing.Union[ManualLEDPacket, AutoLEDPacket, HelloPacket])->bytes:
+    """Encodes a ManualLEDPacket, AutoLEDPacket, or HelloPacket as a frame."""
+    if isinstance(packet, HelloPacket):
+        return encode_hello(packet.client_name, packet.priority, packet.session_token)
+    if isinstance(packet, AutoLEDPacket):
+        return encode_auto(packet.sequence, packet.timestamp, packet.led_data, packet.turn_off_ranges)
+    return encode_manual(packet.led_ranges, packet.brightness, packet.turn_off_ranges)
+
+
+def unpack_ranges(payload: bytes, offset: int)->tuple[list[tuple[int, int]], int]:
+    """Unpacks a list of ranges packed by pack_ranges, returning the ranges and the offset following them."""
+    (count,) = RANGE_COUNT.unpack_from(payload, offset)
+    values = ranges_struct(count).unpack_from(payload, offset)
+    return list(zip(values[1::2], values[2::2])), offset + 2 + 4 * count
+
+
+def decode_payload(message_type: int, payload: bytes)->typing.Union[ManualLEDPacket, AutoLEDPacket, HelloPacket]:
+    """Decodes the payload of a single frame.
+
+    Raises:
+    - ProtocolError: If the message type is unknown or the payload is malformed."""
+
+    try:
+        if message_type == MSG_MANUAL:
+            led_ranges, offset = unpack_ranges(payload, 1)
+            turn_off_ranges, offset = unpack_ranges(payload, offset)
+            return ManualLEDPacket(led_ranges, payload[0] / 255, turn_off_ranges)
+        elif message_type == MSG_AUTO:
+            (count,) = RANGE_COUNT.unpack_from(payload, AUTO_PREFIX.size)
+            values = auto_struct(count).unpack_from(payload, 0)
+            led_data = [((start, stop), brightness / 255) for start, stop, brightness in zip(values[3::3], values[4::3], values[5::3])]
+            turn_off_ranges, _ = unpack_ranges(payload, AUTO_PREFIX.size + 2 + 5 * count)
+            sequence, timestamp = values[0], values[1]
+            return AutoLEDPacket(sequence, timestamp, led_data, turn_off_ranges)
+        elif message_type == MSG_HELLO:
+            priority, name_length = payload[0], payload[1]
+            name = payload[2:2 + name_length]
+            session_token = SESSION_TOKEN.unpack_from(payload, 2 + name_length)[0] if len(payload) >= 2 + name_length + SESSION_TOKEN.size else 0
+            return HelloPacket(name.decode('utf-8', errors='replace'), priority, session_token)
+    except (struct.error, IndexError) as error:
+        raise ProtocolError(f'Malformed payload for message type {message_type}: {error}') from error
+    raise ProtocolError(f'Unknown message type {message_type}')
+
+
+def sequence_is_newer(sequence: int, last_sequence: typing.Union[int, None])->bool:
+    """Returns True if the 32 bit sequence number comes after last_sequence, allowing for the sequence wrapping around. Any sequence is newer than None."""
+    if last_sequence is None:
+        return True
+    return 0 < ((sequence - last_sequence) & 0xFFFFFFFF) < 0x80000000
+
+
+def decode_datagram(datagram: bytes)->tuple[int, typing.Union[ManualLEDPacket, AutoLEDPacket, HelloPacket]]:
+    """Decodes a datagram holding a session token followed by exactly one frame, returning the session token and the packet.
+
+    Raises:
+    - ProtocolError: If the datagram is not a session token and a single complete frame of the supported version, or its payload is malformed."""
+
+    frame_start = SESSION_TOKEN.size + HEADER.size
+    if len(datagram) < frame_start:
+        raise ProtocolError(f'Datagram of {len(datagram)} bytes is shorter than a session token and a header')
+    (session_token,) = SESSION_TOKEN.unpack_from(datagram, 0)
+    payload_size, version, message_type = HEADER.unpack_from(datagram, SESSION_TOKEN.size)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f'Unsupported protocol version {version}')
+    if payload_size != len(datagram) - frame_start:
+        raise ProtocolError(f'Datagram of {len(datagram)} bytes does not hold a frame with a {payload_size} byte payload')
+    return session_token, decode_payload(message_type, datagram[frame_start:])
+
+
+class FrameDecoder:
+    """Splits a byte stream received over a socket back into packets. Bytes are fed in as they arrive, in chunks of any size, and every frame completed by a chunk is
+    decoded and returned.
+
+    Attributes:
+    - decoded_frames (int): The number of frames decoded.
+    - skipped_frames (int): The number of frames skipped because of an unsupported version, unknown type, or malformed payload."""
+
+    def __init__(self, max_payload_size: int = MAX_PAYLOAD_SIZE):
+        self.buffer = bytearray()
+        self.max_payload_size = max_payload_size
+        self.decoded_frames: int = 0
+        self.skipped_frames: int = 0
+        return
+
+    def feed(self, data: bytes)->list[typing.Union[ManualLEDPacket, AutoLEDPacket, HelloPacket]]:
+        """Adds the bytes received to the buffer and returns the packets of every complete frame in it, in the order they were sent.
+
+        Raises:
+        - ProtocolError: If a header claims a payload larger than max_payload_size, after which the stream can not be split into frames anymore."""
+
+        self.buffer += data
+        packets = []
+        offset = 0
+        try:
+            while len(self.buffer) - offset >= HEADER.size:
+                payload_size, version, message_type = HEADER.unpack_from(self.buffer, offset)
+                if payload_size > self.max_payload_size:
+                    raise ProtocolError(f'Frame payload of {payload_size} bytes exceeds the maximum of {self.max_payload_size} bytes')
+                frame_end = offset + HEADER.size + payload_size
+                if frame_end > len(self.buffer):
+                    break
+                payload = bytes(self.buffer[offset + HEADER.size:frame_end])
+                offset = frame_end
+                if version != PROTOCOL_VERSION:
+                    self.skipped_frames += 1
+                    continue
+                try:
+                    packets.append(decode_payload(message_type, payload))
+                    self.decoded_frames += 1
+                except ProtocolError:
+                    self.skipped_frames += 1
+        finally:
+            del self.buffer[:offset]
+        return packets
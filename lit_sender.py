@@ -0,0 +1,301 @@
+import collections
+import secrets
+import select
+import socket
+import threading
+import time
+import typing
+from lit_protocol import encode_hello, encode_datagram, HEADER, AUTO_PREFIX
+
+
+def frame_key(frame: bytes, auto_frame: bool)->bytes:
+    """Returns the LED data of a frame, which two frames showing the same LEDs share. AUTO frames are compared without their sequence number and timestamp, which
+    change on every frame."""
+    return frame[:HEADER.size] + frame[HEADER.size + AUTO_PREFIX.size:] if auto_frame else frame
+
+
+class OutboundFrameQueue:
+    """The frames waiting to be sent to a LED subsystem server, in the order they were queued, so the server always applies MANUAL and AUTO frames in the order they
+    were made. AUTO frames are latest-wins: a new AUTO frame replaces the one still waiting and takes its place at the back of the queue, since only the newest
+    detections are worth showing. When the queue is full, the oldest frame is dropped.
+
+    Frames can be skipped when they hold the same LED data as the frame sent right before them, the newest frame waiting, or the last frame taken if none is waiting.
+
+    Attributes:
+    - maxsize (int): The maximum number of frames held in the queue.
+    - dropped (int): The number of frames dropped or replaced before they were sent.
+    - suppressed (int): The number of frames skipped as duplicates."""
+
+    def __init__(self, maxsize: int = 16):
+        """
+        Parameters:
+        - maxsize (int): The maximum number of frames held in the queue."""
+
+        self.maxsize = max(1, maxsize)
+        self.frames: collections.deque[tuple[bytes, bool]] = collections.deque()
+        self.last_taken_key: typing.Union[bytes, None] = None
+        self.condition = threading.Condition()
+        self.dropped: int = 0
+        self.suppressed: int = 0
+        self.closed: bool = False
+        return
+
+    def put(self, frame: bytes, auto_frame: bool, deduplicate: bool = False)->bool:
+        """Adds a frame to the queue. Returns False if the queue was closed or the frame was skipped as a duplicate.
+
+        Parameters:
+        - frame (bytes): The encoded frame.
+        - auto_frame (bool): True for an AUTO frame, False for a MANUAL frame.
+        - deduplicate (bool): Skip the frame if it holds the same LED data as the frame that would be sent right before it."""
+
+        with self.condition:
+            if self.closed:
+                return False
+            if deduplicate:
+                previous_key = frame_key(*self.frames[-1]) if self.frames else self.last_taken_key
+                if frame_key(frame, auto_frame) == previous_key:
+                    self.suppressed += 1
+                    return False
+            if auto_frame:
+                waiting_auto_idx = next((idx for idx, (_, waiting_auto_frame) in enumerate(self.frames) if waiting_auto_frame), None)
+                if waiting_auto_idx is not None:
+                    del self.frames[waiting_auto_idx]
+                    self.dropped += 1
+            if len(self.frames) >= self.maxsize:
+                self.frames.popleft()
+                self.dropped += 1
+            self.frames.append((frame, auto_frame))
+            self.condition.notify_all()
+            return True
+
+    def get(self, timeout: typing.Union[float, None] = None)->typing.Union[tuple[bytes, bool], None]:
+        """Removes and returns the oldest frame waiting and whether it is an AUTO frame. Returns None if the timeout expired or the queue was closed.
+
+        Parameters:
+        - timeout (typing.Union[float, None]): The maximum number of seconds to wait for a frame."""
+
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.closed or self.frames, timeout):
+                return None
+            if not self.frames:
+                return None
+            frame, auto_frame = self.frames.popleft()
+            self.last_taken_key = frame_key(frame, auto_frame)
+            return frame, auto_frame
+
+    def qsize(self)->int:
+        """Returns the number of frames currently waiting."""
+        with self.condition:
+            return len(self.frames)
+
+    def close(self):
+        """Wakes up the sender waiting on this queue and discards any waiting frames."""
+        with self.condition:
+            self.closed = True
+            self.frames.clear()
+            self.condition.notify_all()
+        return
+
+
+class LITSubsystemSender:
+    """Sends the frames of a single LITSubsystemData to its LED subsystem server from a thread of its own, so a slow or unreachable server never blocks the detection
+    thread or the GUI thread, which only add frames to an OutboundFrameQueue. The sender connects in the background and reconnects with exponential backoff whenever
+    the connection is lost. After every reconnect the last MANUAL and AUTO frames are sent again, in the order they were sent, since the server starts the new
+    session with the LEDs off.
+
+    Attributes:
+    - status (str): One of CONNECTING, CONNECTED, or DISCONNECTED.
+    - written (int): The number of frames written to the server.
+    - reconnects (int): The number of connections made after the first one."""
+
+    CONNECTING: str = 'connecting'
+    CONNECTED: str = 'connected'
+    DISCONNECTED: str = 'disconnected'
+
+    def __init__(self, host: str, port: int, client_name: str, client_priority: int = 0, use_datagrams_for_auto: bool = False, queue_size: int = 16,
+                 connect_timeout: float = 2.0, send_timeout: float = 1.0, min_backoff: float = 0.5, max_backoff: float = 8.0,
+                 status_callback: typing.Union[typing.Callable[[str], None], None] = None):
+        """
+        Parameters:
+        - host (str): The IP address of the server.
+        - port (int): The port of the server.
+        - client_name (str): The name the client introduces itself with in its HELLO.
+        - client_priority (int): The priority (0-255) of the client on the server.
+        - use_datagrams_for_auto (bool): True to send AUTO frames as UDP datagrams instead of over the connection.
+        - queue_size (int): The maximum number of MANUAL frames waiting to be sent.
+        - connect_timeout (float): The number of seconds a connection attempt may take.
+        - send_timeout (float): The number of seconds writing a frame may block before the connection is considered dead.
+        - min_backoff (float): The number of seconds waited after the first failed connection attempt.
+        - max_backoff (float): The most seconds waited between connection attempts, the wait doubles after every failed attempt up to this value.
+        - status_callback (typing.Union[typing.Callable[[str], None], None]): Called from the sender thread with the new status whenever it changes."""
+
+        self.host = host
+        self.port = port
+        self.client_name = client_name
+        self.client_priority = client_priority
+        self.use_datagrams_for_auto = use_datagrams_for_auto
+        self.connect_timeout = connect_timeout
+        self.send_timeout = send_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.status_callback = status_callback
+        self.outbound_queue = OutboundFrameQueue(queue_size)
+        self.conn: typing.Union[socket.socket, None] = None
+        self.datagram_conn: typing.Union[socket.socket, None] = None
+        # Drawn anew for every connection and sent in its HELLO, the server only accepts datagrams carrying the token of an open connection
+        self.session_token: int = 0
+        # The last MANUAL and AUTO frame taken from the queue, keyed by whether they are AUTO frames, in the order they were taken
+        self.last_frames: dict[bool, bytes] = {}
+        self.status: str = self.DISCONNECTED
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.written: int = 0
+        self.reconnects: int = 0
+        self.connections: int = 0
+        return
+
+    def start(self):
+        """Starts the thread connecting to the server and sending the queued frames."""
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name=f'{self.host}:{self.port}_sender', daemon=True)
+        self.thread.start()
+        return
+
+    def stop(self):
+        """Stops the sender thread and closes the connection."""
+        self.stop_event.set()
+        self.outbound_queue.close()
+        if self.thread:
+            self.thread.join(timeout=self.connect_timeout + self.send_timeout)
+        self.close_connection()
+        return
+
+    def send_frame(self, frame: bytes, auto_frame: bool, deduplicate: bool = False)->bool:
+        """Queues a frame to be sent to the server without waiting for it to be sent. Returns False if the sender was stopped or the frame was skipped as a duplicate.
+
+        Parameters:
+        - frame (bytes): The encoded frame.
+        - auto_frame (bool): True for an AUTO frame, False for a MANUAL frame.
+        - deduplicate (bool): Skip the frame if it holds the same LED data as the frame sent right before it."""
+        return self.outbound_queue.put(frame, auto_frame, deduplicate)
+
+    def set_status_callback(self, status_callback: typing.Union[typing.Callable[[str], None], None]):
+        self.status_callback = status_callback
+        return
+
+    def set_status(self, status: str):
+        if status == self.status:
+            return
+        self.status = status
+        if self.status_callback:
+            try:
+                self.status_callback(status)
+            except Exception:
+                pass
+        return
+
+    def connect(self)->bool:
+        """Opens the connection to the server and introduces the client with a HELLO. Returns True if the server was reached."""
+        self.set_status(self.CONNECTING)
+        try:
+            self.conn = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+            self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.conn.settimeout(self.send_timeout)
+            self.session_token = (secrets.randbits(64) or 1) if self.use_datagrams_for_auto else 0
+            self.conn.sendall(encode_hello(self.client_name, self.client_priority, self.session_token))
+            if self.use_datagrams_for_auto:
+                self.datagram_conn = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.datagram_conn.connect((self.host, self.port))
+        except OSError:
+            self.close_connection()
+            self.set_status(self.DISCONNECTED)
+            return False
+        if self.connections:
+            self.reconnects += 1
+        self.connections += 1
+        self.set_status(self.CONNECTED)
+        return True
+
+    def close_connection(self):
+        for conn in (self.conn, self.datagram_conn):
+            if conn is not None:
+                try:
+                    conn.close()
+                except OSError:
+                    pass
+        self.conn = self.datagram_conn = None
+        return
+
+    def send_datagram(self, frame: bytes):
+        """Sends a frame as a single datagram on behalf of the connection. Datagrams are allowed to get lost, so errors such as the server not listening yet are
+        ignored."""
+        try:
+            self.datagram_conn.send(encode_datagram(self.session_token, frame))
+        except OSError:
+            pass
+        return
+
+    def connection_is_open(self)->bool:
+        """Returns False if the server closed the connection. The server never writes to the connection, so it only becomes readable once it is closed."""
+        try:
+            readable, _, _ = select.select([self.conn], [], [], 0)
+            return not readable or bool(self.conn.recv(1, socket.MSG_PEEK))
+        except (OSError, ValueError):
+            return False
+
+    def write_frame(self, frame: bytes, auto_frame: bool, over_connection: bool = False)->bool:
+        """Writes a frame to the server. Returns False if the connection was lost, which is also checked before sending a datagram since the server only accepts
+        datagrams on behalf of an open connection.
+
+        Parameters:
+        - frame (bytes): The encoded frame.
+        - auto_frame (bool): True for an AUTO frame, which is sent as a datagram when use_datagrams_for_auto is set.
+        - over_connection (bool): True to send an AUTO frame over the connection even when use_datagrams_for_auto is set."""
+        if auto_frame and self.datagram_conn is not None and not over_connection:
+            if not self.connection_is_open():
+                return False
+            self.send_datagram(frame)
+        else:
+            try:
+                self.conn.sendall(frame)
+            except OSError:
+                return False
+        self.written += 1
+        return True
+
+    def restore_last_frames(self)->bool:
+        """Sends the last MANUAL and AUTO frames sent over the previous connection again, in the order they were sent, so the server shows the same LEDs as before the
+        connection was lost. They are sent over the connection, since a datagram could reach the server before the HELLO registering its session token."""
+        for auto_frame, frame in list(self.last_frames.items()):
+            if not self.write_frame(frame, auto_frame, over_connection=True):
+                return False
+        return True
+
+    def run(self):
+        """Connects to the server and sends the queued frames until the sender is stopped, reconnecting with exponential backoff whenever the connection is lost."""
+        backoff = self.min_backoff
+        while not self.stop_event.is_set():
+            if self.conn is None:
+                if not self.connect() or not self.restore_last_frames():
+                    self.close_connection()
+                    self.set_status(self.DISCONNECTED)
+                    self.stop_event.wait(backoff)
+                    backoff = min(2 * backoff, self.max_backoff)
+                    continue
+                backoff = self.min_backoff
+            item = self.outbound_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            frame, auto_frame = item
+            self.last_frames.pop(auto_frame, None)
+            self.last_frames[auto_frame] = frame
+            if not self.write_frame(frame, auto_frame):
+                self.close_connection()
+                self.set_status(self.DISCONNECTED)
+        self.set_status(self.DISCONNECTED)
+        return
+
+    def get_stats(self)->dict[str, typing.Union[str, int]]:
+        """Returns the connection status, the number of frames written, waiting, dropped from the queue, and skipped as duplicates, and the number of reconnects."""
+        return {'status': self.status, 'written': self.written, 'queued': self.outbound_queue.qsize(), 'dropped': self.outbound_queue.dropped,
+                'suppressed': self.outbound_queue.suppressed, 'reconnects': self.reconnects}
@@ -0,0 +1,261 @@
+import itertools
+import typing
+import numpy as np
+from detection_postprocessing import DetectionPostProcessor, DetectionResults
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray)->np.ndarray:
+    """Returns the (A, B) intersection over union of every xmin, ymin, xmax, ymax box of an (A, 4) array with every box of a (B, 4) array."""
+    boxes_a, boxes_b = boxes_a[:, None], boxes_b[None]
+    widths = np.clip(np.minimum(boxes_a[..., 2], boxes_b[..., 2]) - np.maximum(boxes_a[..., 0], boxes_b[..., 0]), 0, None)
+    heights = np.clip(np.minimum(boxes_a[..., 3], boxes_b[..., 3]) - np.maximum(boxes_a[..., 1], boxes_b[..., 1]), 0, None)
+    intersections = widths * heights
+    areas_a = (boxes_a[..., 2] - boxes_a[..., 0]) * (boxes_a[..., 3] - boxes_a[..., 1])
+    areas_b = (boxes_b[..., 2] - boxes_b[..., 0]) * (boxes_b[..., 3] - boxes_b[..., 1])
+    return intersections / np.maximum(areas_a + areas_b - intersections, 1e-9)
+
+
+def centroid_distance_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray)->np.ndarray:
+    """Returns the (A, B) distance between the centers of every box of an (A, 4) array and every box of a (B, 4) array, in multiples of the width of the box of B."""
+    centers_a = (boxes_a[:, None, :2] + boxes_a[:, None, 2:]) / 2
+    centers_b = (boxes_b[None, :, :2] + boxes_b[None, :, 2:]) / 2
+    return np.linalg.norm(centers_a - centers_b, axis=2) / np.maximum(boxes_b[None, :, 2] - boxes_b[None, :, 0], 1)
+
+
+def greedy_assignment(similarities: np.ndarray, min_similarity: float)->tuple[np.ndarray, np.ndarray]:
+    """Matches the rows of a similarity matrix to its columns, the most similar pair first, until no pair left is at least min_similarity similar. Every row and
+    column is matched at most once.
+
+    Returns:
+    The row and column index of every match."""
+
+    similarities = similarities.astype(np.float64, copy=True)
+    rows, columns = [], []
+    while similarities.size:
+        row, column = np.unravel_index(np.argmax(similarities), similarities.shape)
+        if similarities[row, column] < min_similarity:
+            break
+        rows.append(row)
+        columns.append(column)
+        similarities[row, :] = -np.inf
+        similarities[:, column] = -np.inf
+    return np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)
+
+
+class Track:
+    """A single object followed across frames by an ObjectTracker, with the LED mapping computed for it the last time it moved.
+
+    Attributes:
+    - track_id (int): The id of the object, which stays the same for as long as it is tracked.
+    - box (np.ndarray): The xmin, ymin, xmax, ymax pixel box of the object, predicted from its velocity in frames it was not detected in.
+    - velocity (np.ndarray): The smoothed change of the box per frame.
+    - hits (int): The number of frames the object was detected in.
+    - misses (int): The number of frames since the object was last detected.
+    - mapped_box (typing.Union[np.ndarray, None]): The box the LED mapping was last computed for, None if it was never computed.
+    - brightness (float): The smoothed brightness (0.00-1.00) to illuminate the object with.
+    - led_section_idx (int): The index of the LED section the object lies in, -1 outside of the field of view."""
+
+    def __init__(self, track_id: int, box: np.ndarray, class_id: int, score: float):
+        self.track_id = track_id
+        self.box = box.astype(np.float64)
+        self.velocity = np.zeros(4, dtype=np.float64)
+        self.class_id = class_id
+        self.score = score
+        self.hits: int = 1
+        self.misses: int = 0
+        self.mapped_box: typing.Union[np.ndarray, None] = None
+        self.needs_mapping: bool = True
+        self.width: float = 0.0
+        self.mid_point_x: float = 0.0
+        self.mid_point_y: float = 0.0
+        self.distance: float = 0.0
+        self.angle: float = 0.0
+        self.brightness: float = 0.0
+        self.led_section_idx: int = -1
+        return
+
+    def predicted_box(self)->np.ndarray:
+        """Returns the box moved by the velocity for one more frame, never narrower or shorter than a pixel."""
+        box = self.box + self.velocity
+        box[2:] = np.maximum(box[2:], box[:2] + 1)
+        return box
+
+
+class ObjectTracker:
+    """Gives the detections of every frame ids that stay the same across frames, SORT style. Every track predicts where its box moves with a constant velocity, then
+    detections are matched to the predicted boxes by IoU, and those left over by the distance between their centers, so fast moving people whose boxes no longer
+    overlap are matched too. Tracks that are not detected keep moving with their velocity for up to max_misses frames, which bridges frames where a box flickers
+    out, before they are removed.
+
+    Every track keeps the LED mapping computed for it, and it is only computed again once the box moved by more than motion_threshold times its width, so people
+    standing still keep their LED section and brightness instead of jumping between sections with the jitter of their box.
+
+    Attributes:
+    - tracks (list[Track]): The objects currently tracked.
+    - removed_track_ids (list[int]): The ids of the tracks removed by the last update.
+    - created (int): The number of tracks created.
+    - removed (int): The number of tracks removed.
+    - mapped (int): The number of times the LED mapping of a track was computed.
+    - reused (int): The number of times the LED mapping of a track was reused because it had not moved."""
+
+    def __init__(self, min_iou: float = 0.3, max_centroid_distance: float = 0.5, max_misses: int = 5, min_hits: int = 1, motion_threshold: float = 0.05,
+                 brightness_smoothing: float = 0.5):
+        """
+        Parameters:
+        - min_iou (float): The IoU a detection needs with the predicted box of a track to be matched to it.
+        - max_centroid_distance (float): The distance between centers, in widths of the predicted box, a detection left over by IoU matching may be from a track.
+        - max_misses (int): The number of frames a track is kept without being detected.
+        - min_hits (int): The number of frames a track has to be detected in before it is reported.
+        - motion_threshold (float): How far the box of a track has to move, as a fraction of its width, before its LED mapping is computed again.
+        - brightness_smoothing (float): The weight (0.00-1.00) of the previous brightness of a track when a new one is computed, 0 for no smoothing."""
+
+        self.min_iou = min_iou
+        self.max_centroid_distance = max_centroid_distance
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.motion_threshold = motion_threshold
+        self.brightness_smoothing = brightness_smoothing
+        self.track_ids = itertools.count()
+        self.tracks: list[Track] = []
+        self.removed_track_ids: list[int] = []
+        self.created: int = 0
+        self.removed: int = 0
+        self.mapped: int = 0
+        self.reused: int = 0
+        return
+
+    def reset(self):
+        """Forgets every track, such as when detection is restarted."""
+        self.removed_track_ids = [track.track_id for track in self.tracks]
+        self.removed += len(self.tracks)
+        self.tracks = []
+        return
+
+    def match(self, boxes: np.ndarray, predicted_boxes: np.ndarray)->tuple[np.ndarray, np.ndarray]:
+        """Matches detections to tracks by IoU, then the ones left over by the distance between their centers. Returns the detection and track index of every match."""
+        detection_idxs, track_idxs = greedy_assignment(iou_matrix(boxes, predicted_boxes), self.min_iou)
+        unmatched_detections = np.setdiff1d(np.arange(len(boxes)), detection_idxs)
+        unmatched_tracks = np.setdiff1d(np.arange(len(predicted_boxes)), track_idxs)
+        if len(unmatched_detections) and len(unmatched_tracks):
+            distances = centroid_distance_matrix(boxes[unmatched_detections], predicted_boxes[unmatched_tracks])
+            extra_detection_idxs, extra_track_idxs = greedy_assignment(-distances, -self.max_centroid_distance)
+            detection_idxs = np.concatenate([detection_idxs, unmatched_detections[extra_detection_idxs]])
+            track_idxs = np.concatenate([track_idxs, unmatched_tracks[extra_track_idxs]])
+        return detection_idxs, track_idxs
+
+    def update(self, boxes: np.ndarray, class_ids: np.ndarray, scores: np.ndarray)->list[Track]:
+        """Matches the detections of a new frame to the tracks, creating a track for every detection left over and removing the tracks missed for too long.
+
+        Parameters:
+        - boxes (np.ndarray): (N, 4) array of the xmin, ymin, xmax, ymax pixel boxes of the detections.
+        - class_ids (np.ndarray): The class index of every detection.
+        - scores (np.ndarray): The confidence score of every detection.
+
+        Returns:
+        The tracks detected in at least min_hits frames, including the ones missed for up to max_misses frames."""
+
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        predicted_boxes = np.array([track.predicted_box() for track in self.tracks], dtype=np.float64).reshape(-1, 4)
+        detection_idxs, track_idxs = self.match(boxes, predicted_boxes)
+        matched_tracks = set(track_idxs.tolist())
+        for detection_idx, track_idx in zip(detection_idxs.tolist(), track_idxs.tolist()):
+            track = self.tracks[track_idx]
+            track.velocity = 0.5 * track.velocity + 0.5 * (boxes[detection_idx] - track.box) / (track.misses + 1)
+            track.box = boxes[detection_idx]
+            track.class_id, track.score = int(class_ids[detection_idx]), float(scores[detection_idx])
+            track.hits += 1
+            track.misses = 0
+        for track_idx, track in enumerate(self.tracks):
+            if track_idx not in matched_tracks:
+                track.box = predicted_boxes[track_idx]
+                track.misses += 1
+        self.remove_missed_tracks()
+        for detection_idx in np.setdiff1d(np.arange(len(boxes)), detection_idxs).tolist():
+            self.tracks.append(Track(next(self.track_ids), boxes[detection_idx], int(class_ids[detection_idx]), float(scores[detection_idx])))
+            self.created += 1
+        return self.report_tracks()
+
+    def propagate(self, boxes: np.ndarray, propagated: np.ndarray)->list[Track]:
+        """Moves every track to a box propagated from the previous frame, such as by optical flow, in frames detection did not run on. Tracks that could not be
+        propagated are predicted from their velocity and count as missed.
+
+        Parameters:
+        - boxes (np.ndarray): (N, 4) array of the propagated box of every track in tracks, in order.
+        - propagated (np.ndarray): Boolean mask of the tracks that could be propagated.
+
+        Returns:
+        The tracks detected in at least min_hits frames, including the ones missed for up to max_misses frames."""
+
+        for track, box, track_propagated in zip(self.tracks, np.asarray(boxes, dtype=np.float64).reshape(-1, 4), np.asarray(propagated).tolist()):
+            if track_propagated:
+                track.velocity = 0.5 * track.velocity + 0.5 * (box - track.box)
+                track.box = box
+            else:
+                track.box = track.predicted_box()
+                track.misses += 1
+        self.remove_missed_tracks()
+        return self.report_tracks()
+
+    def remove_missed_tracks(self):
+        self.removed_track_ids = [track.track_id for track in self.tracks if track.misses > self.max_misses]
+        self.removed += len(self.removed_track_ids)
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+        return
+
+    def report_tracks(self)->list[Track]:
+        tracks = [track for track in self.tracks if track.hits >= self.min_hits]
+        self.flag_moved_tracks(tracks)
+        return tracks
+
+    def flag_moved_tracks(self, tracks: list[Track]):
+        """Flags the tracks whose LED mapping has to be computed again, the ones never mapped and the ones that moved by more than motion_threshold of their width."""
+        mapped_tracks = [track for track in tracks if track.mapped_box is not None]
+        for track in tracks:
+            track.needs_mapping = track.mapped_box is None
+        if not mapped_tracks:
+            return
+        boxes = np.array([track.box for track in mapped_tracks])
+        mapped_boxes = np.array([track.mapped_box for track in mapped_tracks])
+        movements = np.abs(boxes - mapped_boxes).max(axis=1)
+        moved = movements > self.motion_threshold * (mapped_boxes[:, 2] - mapped_boxes[:, 0])
+        for track, track_moved in zip(mapped_tracks, moved.tolist()):
+            track.needs_mapping = track_moved
+        return
+
+    def map_tracks(self, detection_post_processor: DetectionPostProcessor, tracks: list[Track])->DetectionResults:
+        """Computes the LED mapping of the tracks that moved, in a single vectorized call of the post processor, and returns the DetectionResults of every track, reusing
+        the mapping of the tracks that did not move. Boxes are clipped to the frame, and tracks predicted to have left it entirely are left out.
+
+        Parameters:
+        - detection_post_processor (DetectionPostProcessor): The post processor configured for the frames the tracks come from.
+        - tracks (list[Track]): The tracks returned by update."""
+
+        frame_size = np.array([detection_post_processor.video_width, detection_post_processor.video_height] * 2)
+        boxes = np.clip(np.array([track.box for track in tracks]).reshape(-1, 4).round().astype(np.int64), 0, frame_size)
+        in_frame = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+        tracks, boxes = [track for track, track_in_frame in zip(tracks, in_frame.tolist()) if track_in_frame], boxes[in_frame]
+        moved = np.array([track.needs_mapping for track in tracks], dtype=bool)
+        moved_tracks = [track for track in tracks if track.needs_mapping]
+        self.mapped += len(moved_tracks)
+        self.reused += len(tracks) - len(moved_tracks)
+        if moved_tracks:
+            moved_results = detection_post_processor.map_detections(boxes[moved], np.array([track.class_id for track in moved_tracks], dtype=np.int64),
+                                                                    np.array([track.score for track in moved_tracks]))
+            for idx, track in enumerate(moved_tracks):
+                brightness = float(moved_results.brightnesses[idx])
+                if track.mapped_box is not None:
+                    brightness = self.brightness_smoothing * track.brightness + (1 - self.brightness_smoothing) * brightness
+                track.mapped_box = track.box.copy()
+                track.width, track.mid_point_x, track.mid_point_y = float(moved_results.widths[idx]), float(moved_results.mid_points_x[idx]), float(moved_results.mid_points_y[idx])
+                track.distance, track.angle = float(moved_results.distances[idx]), float(moved_results.angles[idx])
+                track.brightness, track.led_section_idx = brightness, int(moved_results.led_section_idxs[idx])
+                track.needs_mapping = False
+        return DetectionResults(boxes, np.array([track.class_id for track in tracks], dtype=np.int64), np.array([track.score for track in tracks]),
+                                np.array([track.width for track in tracks]), np.array([track.mid_point_x for track in tracks]),
+                                np.array([track.mid_point_y for track in tracks]), np.array([track.distance for track in tracks]),
+                                np.array([track.angle for track in tracks]), np.array([track.brightness for track in tracks]),
+                                np.array([track.led_section_idx for track in tracks], dtype=np.int64), np.array([track.track_id for track in tracks], dtype=np.int64))
+
+    def get_stats(self)->dict[str, int]:
+        """Returns the number of tracks open, created, and removed, and the number of times the LED mapping of a track was computed and reused."""
+        return {'tracks': len(self.tracks), 'created': self.created, 'removed': self.removed, 'mapped': self.mapped, 'reused': self.reused}
@@ -1,47 +1,298 @@
 import socket
 from led_manager_with_classes import LEDPanels
 import time
-import board
-import neopixel
 import math
 import threading
-import pickle
 import typing
-from multiprocessing import Process
+import asyncio
+import concurrent.futures
+from lit_protocol import FrameDecoder, ProtocolError, HelloPacket, AutoLEDPacket, decode_datagram, sequence_is_newer
+
+
+class ClientSession:
+    """The state the server keeps for a single connected client.
+
+    Attributes:
+    - address (tuple): The address the client connected from.
+    - client_name (str): The name sent by the client in its HELLO packet, or its address if it sent none.
+    - priority (int): The priority the client's packets are applied with.
+    - session_token (int): The token sent by the client in its HELLO packet that its datagrams carry, 0 if it sends none.
+    - packets_received (int): The number of packets received from the client.
+    - packets_applied (int): The number of packets accepted for rendering on the panels.
+    - packets_rejected (int): The number of packets ignored because a client with a higher priority owned the panels.
+    - packets_out_of_order (int): The number of AUTO packets discarded because a newer one from the client was already accepted.
+    - last_auto_sequence (typing.Union[int, None]): The sequence number of the last AUTO packet accepted from the client."""
+
+    def __init__(self, address: tuple, priority: int = 0):
+        self.address = address
+        self.client_name = str(address)
+        self.priority = priority
+        self.session_token: int = 0
+        self.packets_received: int = 0
+        self.packets_applied: int = 0
+        self.packets_rejected: int = 0
+        self.packets_out_of_order: int = 0
+        self.last_auto_sequence: typing.Union[int, None] = None
+        return
+
+    def get_stats(self)->dict[str, typing.Union[str, int]]:
+        return {'client': self.client_name, 'priority': self.priority, 'received': self.packets_received, 'applied': self.packets_applied,
+                'rejected': self.packets_rejected, 'out_of_order': self.packets_out_of_order}
+
+
+class LITDatagramProtocol(asyncio.DatagramProtocol):
+    """Receives AUTO frames sent as UDP datagrams and hands them to the LITSubsystemServer listening on the same port."""
+
+    def __init__(self, lit_server: 'LITSubsystemServer'):
+        self.lit_server = lit_server
+        return
+
+    def datagram_received(self, data: bytes, addr: tuple):
+        self.lit_server.handle_datagram(data, addr)
+        return
+
 
 class LITSubsystemServer:
+    """Serves a single LED subsystem over TCP. Any number of clients, such as the GUI and the ObjectDetectionModel, can be connected at once and can disconnect and
+    reconnect without restarting the server.
+
+    When several clients address the panels, the last writer wins among clients of the same priority, a client with a higher priority takes over the panels from lower
+    ones, and a lower priority client only gets them back after the owner disconnects or stays silent for owner_timeout seconds. LED writes run on a dedicated single
+    thread executor per subsystem, so the event loop serving the network never blocks on the strip.
+
+    AUTO frames can also be sent as UDP datagrams to the same port, so a lost frame never holds back the newer frames behind it. Each datagram carries the session
+    token the client sent in the HELLO of its TCP connection and is handled as part of that connection's session, sharing its priority, ownership of the panels and
+    sequence numbers. Datagrams stop being accepted as soon as the connection closes, so the server keeps no state for UDP senders of its own. Every client's AUTO
+    packets carry sequence numbers and any packet older than the last one accepted from that client is discarded.
+
+    Clients are read as fast as data arrives, independently of how fast the strip can be written. Accepted packets wait in a pending list until the render task is
+    free: manual packets stay in order, but only the newest AUTO state is kept, since an older detection frame is stale as soon as a newer one arrives. Everything
+    pending is then rendered with a single write to the strip, so the lights never fall behind people when the detector outpaces the Pi."""
+
+    def __init__(self, lit_subsystem_leds: LEDPanels, port: int, host: str='', owner_timeout: float = 2.0):
+        """
+        Parameters:
+        - lit_subsystem_leds (LEDPanels): The panels addressed by the packets received.
+        - port (int): The port the server listens on.
+        - host (str): The interface the server listens on, '' for all interfaces.
+        - owner_timeout (float): The number of seconds without packets after which a lower priority client can take over the panels."""
 
-    def __init__(self, lit_subsystem_leds: LEDPanels, port: int, host: str=''):
         self.lit_subsystem_leds = lit_subsystem_leds
         self.host = host
         self.port = port
-        
-    def main_server_loop(self):
-        s = socket.socket()
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) #avoid reuse error msg
-        s.bind(('', self.port))
-        print("Server started. Waiting for connection...")
-        s.listen(5)
-        c, addr = s.accept()
-        print("Connection from: ",addr)
+        self.owner_timeout = owner_timeout
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'led_panels_{port}')
+        self.sessions: set[ClientSession] = set()
+        self.owner: typing.Union[ClientSession, None] = None
+        self.owner_last_write: float = 0.0
+        self.server = None
+        self.datagram_transport = None
+        self.sessions_by_token: dict[int, ClientSession] = {}
+        self.datagrams_unknown_session: int = 0
+        self.render_task = None
+        self.pending_packets: list = []
+        self.pending_event = None
+        self.stats_lock = threading.Lock()
+        self.packets_received: int = 0
+        self.packets_rendered: int = 0
+        self.packets_coalesced: int = 0
+        self.renders: int = 0
+        self.render_errors: int = 0
+        self.max_queue_depth: int = 0
+        self.last_staleness: float = 0.0
+        self.total_staleness: float = 0.0
+        self.max_staleness: float = 0.0
+        self.auto_packets_rendered: int = 0
+        return
+
+    def accepts_packet_from(self, session: ClientSession)->bool:
+        """Applies the last-writer/priority policy, returning True and making the session the owner of the panels if its packet should be rendered."""
+        now = time.monotonic()
+        owner = self.owner
+        if owner is None or owner is session or owner not in self.sessions or session.priority >= owner.priority or now - self.owner_last_write > self.owner_timeout:
+            self.owner = session
+            self.owner_last_write = now
+            return True
+        return False
+
+    def queue_packet(self, packet):
+        """Adds an accepted packet to the pending list, replacing the pending AUTO packet if there is one, and wakes up the render task."""
+        if isinstance(packet, AutoLEDPacket):
+            for idx, pending_packet in enumerate(self.pending_packets):
+                if isinstance(pending_packet, AutoLEDPacket):
+                    del self.pending_packets[idx]
+                    self.packets_coalesced += 1
+                    break
+        self.pending_packets.append(packet)
+        self.max_queue_depth = max(self.max_queue_depth, len(self.pending_packets))
+        self.pending_event.set()
+        return
+
+    def render_packets(self, packets: list):
+        """Renders packets on the panels with a single write to the strip. Runs on the LED executor."""
+        with self.lit_subsystem_leds.frame_update():
+            for packet in packets:
+                self.lit_subsystem_leds.update_leds_from_data_packets(packet)
+        rendered_time = time.time()
+        with self.stats_lock:
+            self.renders += 1
+            self.packets_rendered += len(packets)
+            for packet in packets:
+                if isinstance(packet, AutoLEDPacket):
+                    # Staleness is measured from the client's clock, so it assumes the clocks of the client and the Pi are synchronized
+                    self.last_staleness = rendered_time - packet.timestamp
+                    self.total_staleness += self.last_staleness
+                    self.max_staleness = max(self.max_staleness, self.last_staleness)
+                    self.auto_packets_rendered += 1
+        return
+
+    async def render_loop(self):
+        """Renders everything pending whenever the previous render is done, until cancelled. A failed render is logged and its packets dropped, so a single error
+        writing to the strip never stops the panels from following the packets received after it."""
+        loop = asyncio.get_running_loop()
         while True:
-            #data is in bytes format, use decode() to transform it into a string
-            data = c.recv(4096)
-            if not data:
-                break
-            self.lit_subsystem_leds.update_leds_from_data_packets(data)
-        print("Disconnected. Exiting.")
+            await self.pending_event.wait()
+            self.pending_event.clear()
+            packets, self.pending_packets = self.pending_packets, []
+            if packets:
+                try:
+                    await loop.run_in_executor(self.executor, self.render_packets, packets)
+                except Exception as error:
+                    self.render_errors += 1
+                    print(f"Rendering {len(packets)} packets failed: {error!r}")
+        return
+
+    def get_stats(self)->dict[str, typing.Union[int, float]]:
+        """Returns the number of packets received, rendered, and coalesced away, the number of renders and failed renders, the current and maximum number of pending
+        packets, the staleness of the AUTO packets rendered, from their creation on the client to their write to the strip, in milliseconds, and the number of datagrams
+        dropped because their session token belongs to no open connection."""
+        with self.stats_lock:
+            return {'received': self.packets_received, 'rendered': self.packets_rendered, 'coalesced': self.packets_coalesced, 'renders': self.renders,
+                    'render_errors': self.render_errors, 'queue_depth': len(self.pending_packets), 'max_queue_depth': self.max_queue_depth,
+                    'last_staleness_ms': 1000 * self.last_staleness,
+                    'mean_staleness_ms': 1000 * self.total_staleness / self.auto_packets_rendered if self.auto_packets_rendered else 0.0,
+                    'max_staleness_ms': 1000 * self.max_staleness, 'datagrams_unknown_session': self.datagrams_unknown_session}
+
+    def handle_packet(self, session: ClientSession, packet):
+        """Handles a single packet received from a client."""
+        session.packets_received += 1
+        self.packets_received += 1
+        if isinstance(packet, HelloPacket):
+            session.client_name = packet.client_name
+            session.priority = packet.priority
+            if session.session_token and self.sessions_by_token.get(session.session_token) is session:
+                del self.sessions_by_token[session.session_token]
+            session.session_token = packet.session_token
+            if packet.session_token:
+                self.sessions_by_token[packet.session_token] = session
+            print(f"Client {session.address} is {session.client_name} with priority {session.priority}")
+            return
+        if isinstance(packet, AutoLEDPacket):
+            if not sequence_is_newer(packet.sequence, session.last_auto_sequence):
+                session.packets_out_of_order += 1
+                return
+            session.last_auto_sequence = packet.sequence
+        if not self.accepts_packet_from(session):
+            session.packets_rejected += 1
+            return
+        self.queue_packet(packet)
+        session.packets_applied += 1
+        return
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Reads frames from a connected client until it disconnects. A recv may return part of a frame or several frames at once, the decoder buffers the bytes until
+        each frame is complete."""
+        session = ClientSession(writer.get_extra_info('peername'))
+        self.sessions.add(session)
+        print("Connection from: ", session.address)
+        frame_decoder = FrameDecoder()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                try:
+                    packets = frame_decoder.feed(data)
+                except ProtocolError as error:
+                    print(f"Closing connection from {session.address}: {error}")
+                    break
+                for packet in packets:
+                    self.handle_packet(session, packet)
+        except ConnectionError as error:
+            print(f"Connection from {session.address} lost: {error}")
+        finally:
+            self.sessions.discard(session)
+            if session.session_token and self.sessions_by_token.get(session.session_token) is session:
+                del self.sessions_by_token[session.session_token]
+            if self.owner is session:
+                self.owner = None
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            print(f"Disconnected: {session.get_stats()}")
+            print(f"Server stats: {self.get_stats()}")
+            print(f"LED render stats: {self.lit_subsystem_leds.get_render_stats()}")
+        return
+
+    def handle_datagram(self, data: bytes, addr: tuple):
+        """Handles a datagram, which holds a session token and a single frame. Only AUTO frames are accepted over UDP, manual commands and HELLOs must use the
+        reliable connection. The frame is handled as part of the session of the open connection whose HELLO carried the token, and dropped if there is none."""
+        try:
+            session_token, packet = decode_datagram(data)
+        except ProtocolError:
+            return
+        if not isinstance(packet, AutoLEDPacket):
+            return
+        session = self.sessions_by_token.get(session_token) if session_token else None
+        if session is None:
+            self.datagrams_unknown_session += 1
+            return
+        self.handle_packet(session, packet)
+        return
+
+    async def start(self):
+        """Starts listening for clients on the running event loop, over TCP and UDP."""
+        self.server = await asyncio.start_server(self.handle_client, self.host or None, self.port, reuse_address=True)
+        self.datagram_transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(lambda: LITDatagramProtocol(self),
+                                                                                               local_addr=(self.host or '0.0.0.0', self.port))
+        self.pending_event = asyncio.Event()
+        self.render_task = asyncio.create_task(self.render_loop())
+        print(f"Server started on port {self.port}. Waiting for connections...")
+        return
+
+    async def serve_forever(self):
+        """Listens for clients until cancelled."""
+        if self.server is None:
+            await self.start()
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            self.datagram_transport.close()
+            self.render_task.cancel()
+            self.executor.shutdown(wait=True)
+        return
+
+    def main_server_loop(self):
+        """Runs this server alone on a new event loop until interrupted."""
+        asyncio.run(self.serve_forever())
+        return
+
+
+async def serve_lit_subsystem_servers(lit_servers: list[LITSubsystemServer]):
+    """Serves every LED subsystem on the running event loop until cancelled."""
+    await asyncio.gather(*[lit_server.serve_forever() for lit_server in lit_servers])
+    return
+
 
 def run_lit_subsystem_servers_in_parallel(lit_servers: typing.Union[list[LITSubsystemServer], LITSubsystemServer]):
+    """Serves one or more LED subsystems from a single process and event loop, each with its own LED executor."""
     if isinstance(lit_servers, LITSubsystemServer):
-        lit_servers.main_server_loop()
-        
-    elif isinstance(lit_servers, list):
-        server_processes = [Process(target=lit_server.main_server_loop) for lit_server in (lit_servers)]
-        for process in server_processes:
-            process.start()
-
-        for process in server_processes:
-            process.join()
-    
-    return 
\ No newline at end of file
+        lit_servers = [lit_servers]
+    try:
+        asyncio.run(serve_lit_subsystem_servers(lit_servers))
+    except KeyboardInterrupt:
+        pass
+    return
@@ -0,0 +1,133 @@
+"""Randomized tests of the IntervalSet range algebra and the manual/auto LED merge built on it, checked against a plain set of LED indices."""
+import random
+import pytest
+from utils import IntervalSet, AutoLEDData, ManualLEDData, SystemLEDData, find_missing_numbers_as_ranges_tuples, remove_overlapping_ranges_between_auto_led_and_manual_leds
+
+NUM_OF_LEDS: int = 256
+SEEDS = range(200)
+
+
+def random_ranges(rng: random.Random, max_ranges: int = 6, allow_empty: bool = True)->list[tuple[int, int]]:
+    """Returns up to max_ranges ranges inside the strip, in any order, overlapping, touching, and, if allow_empty, empty or reversed."""
+    ranges = []
+    for _ in range(rng.randint(0, max_ranges)):
+        if allow_empty:
+            ranges.append((rng.randint(0, NUM_OF_LEDS), rng.randint(0, NUM_OF_LEDS)))
+        else:
+            start = rng.randint(0, NUM_OF_LEDS - 1)
+            ranges.append((start, rng.randint(start + 1, NUM_OF_LEDS)))
+    return ranges
+
+
+def leds_of(ranges)->set[int]:
+    """The oracle: the LED indices covered by half-open ranges."""
+    return {led for start, stop in ranges for led in range(start, stop)}
+
+
+def assert_normalized(interval_set: IntervalSet):
+    """Checks the ranges are non-empty, sorted, and neither overlap nor touch."""
+    intervals = interval_set.to_list()
+    assert all(stop > start for start, stop in intervals)
+    assert all(previous[1] < following[0] for previous, following in zip(intervals, intervals[1:]))
+    assert interval_set.starts == [start for start, _ in intervals]
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_construction_matches_oracle(seed):
+    ranges = random_ranges(random.Random(seed))
+    interval_set = IntervalSet(ranges)
+    assert_normalized(interval_set)
+    assert leds_of(interval_set) == leds_of(ranges)
+    assert interval_set.num_of_leds() == len(leds_of(ranges))
+    assert bool(interval_set) == bool(leds_of(ranges))
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_add_and_remove_single_ranges_match_oracle(seed):
+    rng = random.Random(seed)
+    interval_set, oracle = IntervalSet(), set()
+    for _ in range(20):
+        start, stop = sorted((rng.randint(0, NUM_OF_LEDS), rng.randint(0, NUM_OF_LEDS)))
+        if rng.random() < 0.6:
+            interval_set, oracle = interval_set.union((start, stop)), oracle | set(range(start, stop))
+        else:
+            interval_set, oracle = interval_set.difference((start, stop)), oracle - set(range(start, stop))
+        assert_normalized(interval_set)
+        assert leds_of(interval_set) == oracle
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_set_operations_match_oracle(seed):
+    rng = random.Random(seed)
+    first_ranges, second_ranges = random_ranges(rng), random_ranges(rng)
+    first, second = IntervalSet(first_ranges), IntervalSet(second_ranges)
+    first_leds, second_leds = leds_of(first_ranges), leds_of(second_ranges)
+    for result, expected in ((first.union(second_ranges), first_leds | second_leds), (first.difference(second_ranges), first_leds - second_leds),
+                             (first.intersection(second), first_leds & second_leds), (first.complement(0, NUM_OF_LEDS), set(range(NUM_OF_LEDS)) - first_leds)):
+        assert_normalized(result)
+        assert leds_of(result) == expected
+    assert first.union(second) == second.union(first)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_overlaps_matches_oracle(seed):
+    rng = random.Random(seed)
+    ranges = random_ranges(rng)
+    interval_set, oracle = IntervalSet(ranges), leds_of(ranges)
+    for _ in range(20):
+        led_range = (rng.randint(0, NUM_OF_LEDS), rng.randint(0, NUM_OF_LEDS))
+        assert interval_set.overlaps(led_range) == bool(oracle & leds_of([led_range]))
+
+
+def test_coerce_accepts_every_range_form():
+    assert IntervalSet.coerce(None) == IntervalSet()
+    assert IntervalSet.coerce([]) == IntervalSet()
+    assert IntervalSet.coerce((4, 8)) == IntervalSet([(4, 8)])
+    assert IntervalSet.coerce([(8, 12), (0, 4), (4, 6)]).to_list() == [(0, 6), (8, 12)]
+    interval_set = IntervalSet([(1, 2)])
+    assert IntervalSet.coerce(interval_set) is interval_set
+
+
+def expand_auto_led_data(auto_led_data_list: list[AutoLEDData])->list[tuple[int, float]]:
+    """Returns every (led, brightness) pair of the auto LED data, in order."""
+    return [(led, auto_led.brightness) for auto_led in auto_led_data_list for led in range(*auto_led.led_range)]
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_removing_manual_leds_from_auto_leds_matches_oracle(seed):
+    rng = random.Random(seed)
+    manual_ranges = random_ranges(rng)
+    auto_led_data_list = [AutoLEDData(led_range, round(rng.random(), 2)) for led_range in random_ranges(rng, allow_empty=False)]
+    manual_leds = leds_of(manual_ranges)
+    expected = [(led, brightness) for led, brightness in expand_auto_led_data(auto_led_data_list) if led not in manual_leds]
+    assert expand_auto_led_data(remove_overlapping_ranges_between_auto_led_and_manual_leds(manual_ranges, auto_led_data_list)) == expected
+    assert leds_of(find_missing_numbers_as_ranges_tuples(manual_ranges, NUM_OF_LEDS)) == set(range(NUM_OF_LEDS)) - manual_leds
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('auto_status, manual_status', [(True, True), (True, False), (False, True)])
+def test_system_led_data_merge_matches_oracle(seed, auto_status, manual_status):
+    rng = random.Random(seed)
+    manual_led_data = ManualLEDData(brightness=0.5)
+    for led_range in random_ranges(rng, allow_empty=False):
+        manual_led_data.add_led_range(led_range)
+    if rng.random() < 0.5:
+        slider_start = rng.randint(0, NUM_OF_LEDS - 1)
+        manual_led_data.set_slider_led_range((slider_start, rng.randint(slider_start + 1, NUM_OF_LEDS)))
+    auto_led_data_list = [AutoLEDData(led_range, round(rng.random(), 2)) for led_range in random_ranges(rng, allow_empty=False)]
+    manual_leds = leds_of(manual_led_data.generate_full_manual_led_list())
+    auto_leds = leds_of(auto_led.led_range for auto_led in auto_led_data_list)
+    expanded_auto = expand_auto_led_data(auto_led_data_list)
+
+    system_led_data = SystemLEDData(manual_led_data, list(auto_led_data_list))
+    system_led_data.update_led_data_for_sending(auto_status=auto_status, manual_status=manual_status, num_of_leds=NUM_OF_LEDS)
+
+    lit_leds = (manual_leds if manual_status else set()) | (auto_leds if auto_status else set())
+    turn_off_ranges = system_led_data.turn_off_leds.manual_led_tuple_list
+    assert_normalized(IntervalSet(turn_off_ranges))
+    assert IntervalSet(turn_off_ranges).to_list() == turn_off_ranges
+    assert leds_of(turn_off_ranges) == set(range(NUM_OF_LEDS)) - lit_leds
+    if auto_status and manual_status:
+        assert expand_auto_led_data(system_led_data.auto_led_data_list) == [(led, brightness) for led, brightness in expanded_auto if led not in manual_leds]
+    elif auto_status:
+        assert expand_auto_led_data(system_led_data.auto_led_data_list) == expanded_auto
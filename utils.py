@@ -1,6 +1,7 @@
 import typing
 import itertools
 import math
+import bisect
 class ManualLEDData:
     """Stores all user entered manual LED Data, where all led ranges stored in this class share single brightness"""
     def __init__(self, brightness: float = 0.00):
@@ -89,12 +90,12 @@ class SystemLEDData:
             if self.auto_led_data_list:
                 full_auto_list = [auto_led.led_range for auto_led in self.auto_led_data_list]
                 if not full_auto_list:
-                    missing_leds = (0, num_of_leds)
+                    missing_leds = [(0, num_of_leds)]
                 else:
                     missing_leds = find_missing_numbers_as_ranges_tuples(full_auto_list, num_of_leds)
                 self.turn_off_leds.manual_led_tuple_list = missing_leds
             else:
-                missing_leds = (0, num_of_leds)
+                missing_leds = [(0, num_of_leds)]
                 full_auto_list = []
                 self.turn_off_leds.manual_led_tuple_list = missing_leds
         return
@@ -107,85 +108,121 @@ def is_overlap(range1, range2):
         return True
     return False
 
-def find_missing_numbers_as_ranges_tuples(ranges, all_numbers: int) -> typing.Union[list[tuple], None]:
-    if not ranges:
-        return [(0, all_numbers)]
+class IntervalSet:
+    """A set of LEDs stored as sorted, merged, half-open (start, stop) ranges, so range algebra costs O(k log k) in the number of ranges instead of the number of LEDs.
+    Empty ranges are dropped and overlapping or touching ranges are merged, so (0, 32) and (32, 64) are stored as (0, 64)."""
 
-    # Initialize a set with all numbers from 0 to 256
-    all_numbers = set(range(all_numbers))
-    
-    # Remove the numbers present in the given ranges
-    for start, end in ranges:
-        all_numbers -= set(range(start, end + 1))
-    
-    # Convert the set to a sorted list
-    missing_numbers_sorted = sorted(list(all_numbers))
-    
-    # Group the consecutive numbers into ranges
-    missing_ranges = []
-    if missing_numbers_sorted:
-        # Initialize the first range with the first missing number
-        range_start = missing_numbers_sorted[0]
-        range_end = missing_numbers_sorted[0]
-        
-        for number in missing_numbers_sorted[1:]:
-            if number == range_end + 1:
-                # Extend the current range
-                range_end = number
+    def __init__(self, ranges: typing.Iterable[tuple[int, int]] = ()):
+        """
+        Parameters:
+        - ranges (typing.Iterable[tuple[int, int]]): The half-open (start, stop) ranges of LEDs in the set, in any order."""
+
+        self.intervals: list[tuple[int, int]] = []
+        for start, stop in sorted((start, stop) for start, stop in ranges if stop > start):
+            if self.intervals and start <= self.intervals[-1][1]:
+                if stop > self.intervals[-1][1]:
+                    self.intervals[-1] = (self.intervals[-1][0], stop)
             else:
-                # Finish the current range and start a new one
-                missing_ranges.append((range_start, range_end))
-                range_start = number
-                range_end = number
-        
-        # Add the last range
-        missing_ranges.append((range_start, range_end))
-    
-    return missing_ranges
+                self.intervals.append((start, stop))
+        self.starts: list[int] = [start for start, _ in self.intervals]
+        return
+
+    @classmethod
+    def coerce(cls, ranges: typing.Union['IntervalSet', typing.Iterable[tuple[int, int]], tuple[int, int], None])->'IntervalSet':
+        """Returns the IntervalSet of ranges provided as an IntervalSet, a list of ranges, a single (start, stop) tuple, or None."""
+        if isinstance(ranges, IntervalSet):
+            return ranges
+        if not ranges:
+            return cls()
+        if isinstance(ranges, tuple) and len(ranges) == 2 and isinstance(ranges[0], int):
+            return cls([ranges])
+        return cls(ranges)
+
+    def __iter__(self)->typing.Iterator[tuple[int, int]]:
+        return iter(self.intervals)
+
+    def __len__(self)->int:
+        return len(self.intervals)
+
+    def __bool__(self)->bool:
+        return bool(self.intervals)
+
+    def __eq__(self, other)->bool:
+        return isinstance(other, IntervalSet) and self.intervals == other.intervals
+
+    def __repr__(self)->str:
+        return f'IntervalSet({self.intervals})'
+
+    def to_list(self)->list[tuple[int, int]]:
+        """Returns the ranges of the set as a list of half-open (start, stop) tuples."""
+        return list(self.intervals)
+
+    def num_of_leds(self)->int:
+        """Returns the number of LEDs in the set."""
+        return sum(stop - start for start, stop in self.intervals)
+
+    def union(self, other: typing.Union['IntervalSet', typing.Iterable[tuple[int, int]], tuple[int, int], None])->'IntervalSet':
+        """Returns the LEDs in this set or the other."""
+        return IntervalSet(self.intervals + IntervalSet.coerce(other).intervals)
+
+    def difference(self, other: typing.Union['IntervalSet', typing.Iterable[tuple[int, int]], tuple[int, int], None])->'IntervalSet':
+        """Returns the LEDs in this set that are not in the other."""
+        other_intervals = IntervalSet.coerce(other).intervals
+        remaining = []
+        other_idx = 0
+        for start, stop in self.intervals:
+            while other_idx < len(other_intervals) and other_intervals[other_idx][1] <= start:
+                other_idx += 1
+            idx = other_idx
+            while idx < len(other_intervals) and other_intervals[idx][0] < stop:
+                if other_intervals[idx][0] > start:
+                    remaining.append((start, other_intervals[idx][0]))
+                start = max(start, other_intervals[idx][1])
+                idx += 1
+            if stop > start:
+                remaining.append((start, stop))
+        return IntervalSet(remaining)
+
+    def intersection(self, other: typing.Union['IntervalSet', typing.Iterable[tuple[int, int]], tuple[int, int], None])->'IntervalSet':
+        """Returns the LEDs in both this set and the other."""
+        return self.difference(self.difference(other))
+
+    def complement(self, start: int, stop: int)->'IntervalSet':
+        """Returns the LEDs from start up to, not including, stop that are not in this set."""
+        return IntervalSet([(start, stop)]).difference(self)
+
+    def overlaps(self, led_range: tuple[int, int])->bool:
+        """Returns True if any LED of the half-open led_range is in this set, using a binary search over the ranges of the set."""
+        start, stop = led_range
+        if stop <= start:
+            return False
+        idx = bisect.bisect_left(self.starts, stop) - 1
+        return idx >= 0 and self.intervals[idx][1] > start
+
+
+def find_missing_numbers_as_ranges_tuples(ranges, all_numbers: int) -> typing.Union[list[tuple], None]:
+    """Returns the half-open ranges of the LEDs from 0 up to, not including, all_numbers that are not in any of the half-open ranges provided."""
+    return IntervalSet.coerce(ranges).complement(0, all_numbers).to_list()
     
 
-def remove_overlapping_ranges_between_auto_led_and_manual_leds(manual_led_tuple_list: list[tuple[int, int]], auto_led_data_list: list[AutoLEDData]):
-    if not auto_led_data_list and not manual_led_tuple_list:
-        return None
-    elif not manual_led_tuple_list:
+def remove_overlapping_ranges_between_auto_led_and_manual_leds(manual_led_tuple_list: list[tuple[int, int]], auto_led_data_list: list[AutoLEDData])->list[AutoLEDData]:
+    """Returns the auto LED data with the manually controlled LEDs removed from their ranges. An auto range split in two by a manual range becomes two AutoLEDData at
+    the same brightness, and auto ranges entirely covered by manual ranges are dropped."""
+    if not auto_led_data_list:
+        return []
+    manual_leds = IntervalSet.coerce(manual_led_tuple_list)
+    if not manual_leds:
         return auto_led_data_list
-    elif not auto_led_data_list:
-        return None
-    
-    for led_range in manual_led_tuple_list:
-        for auto_led in auto_led_data_list:
-            if is_overlap(auto_led.led_range, led_range):
-                auto_led.led_range = adjust_overlap(auto_led.led_range, led_range)
-                if auto_led.led_range[0] == auto_led.led_range[1]:
-                    auto_led_data_list.remove(auto_led)
-    
-    return auto_led_data_list
-
-
-def adjust_overlap(range1, range2):
-    """
-    Adjusts range1 to ensure there's no overlap with range2.
-    :param range1: First range tuple.
-    :param range2: Second range tuple.
-    :return: Adjusted range1 tuple.
-    """
-    start1, end1 = range1
-    start2, end2 = range2
-
-    # Check if range1 completely overlaps range2 or vice versa
-    if start1 >= start2 and end1 <= end2:
-        return (start1, start1)  # Or any logic to handle complete overlap
-    elif start2 >= start1 and end2 <= end1:
-        return (start1, end2)  # Split range1 around range2
-
-    # Partial overlap cases
-    if start1 < start2 < end1 <= end2:
-        return (start1, start2)  # Adjust end of range1 to start of range2
-    elif start2 <= start1 < end2 < end1:
-        return (end2, end1)  # Adjust start of range1 to end of range2
-
-    # No overlap
-    return range1
+
+    remaining_auto_led_data = []
+    for auto_led in auto_led_data_list:
+        if not manual_leds.overlaps(auto_led.led_range):
+            remaining_auto_led_data.append(auto_led)
+            continue
+        for led_range in IntervalSet([auto_led.led_range]).difference(manual_leds):
+            remaining_auto_led_data.append(AutoLEDData(led_range, auto_led.brightness))
+    return remaining_auto_led_data
+
 
 def focal_length_finder(camera_video_width: int, horizontal_fov: int)->float:
     """Using the width of the video from the camera in pixels and the horizontal field of view of the camera, both in pixels, this functuion returns the focal length in pixels of the camera."""